@@ -43,12 +43,17 @@
 # */
 # //==============================================================================
 
+import re
 from . import Devices
 from GaitCore.Core import PointArray
 
 
+@Devices.register
 class Accel(Devices.Devices):
 
+    columns = ((re.compile(r"Accelerometers.*Sensor (?P<number>\d+)"), "Accel_{number}"),)
+    schemas = (Devices.Schema("accels", re.compile(r"Accel_(?P<number>\d+)$"), ("ACCX", "ACCY", "ACCZ")),)
+
     def __init__(self, name, sensor):
         accel = PointArray.PointArray(sensor["ACCX"]["data"],
                             sensor["ACCY"]["data"],
@@ -42,9 +42,130 @@
 #     \version   0.1
 # */
 # //==============================================================================
-import abc
+from collections import namedtuple
+import numpy as np
+
+# A kind of device found in the devices section.
+# collection: name of the dict the devices are kept in, ex: "IMUs"
+# pattern: compiled pattern matching the fixed subject names of the device, with a "number" group
+# channels: fields every subject of the device must have
+Schema = namedtuple("Schema", ["collection", "pattern", "channels"])
+
+_registry = []
+_header_cache = {}
+_subject_cache = {}
+
+
+def register(device):
+    """
+    Class decorator that adds a device to the registry, so Vicon names its columns and builds it
+    :param device: subclass of Devices
+    :return: device
+    """
+    if device not in _registry:
+        _registry.append(device)
+    _header_cache.clear()
+    _subject_cache.clear()
+    return device
+
+
+def collections():
+    """
+    :return: the name of every collection of devices in the registry
+    :rtype: list
+    """
+    names = []
+    for device in _registry:
+        for schema in device.schemas:
+            if schema.collection not in names:
+                names.append(schema.collection)
+    return names
+
+
+def classify_header(names):
+    """
+    Find the fixed name of each subject in the header of the devices section. The result is cached for
+    each header, so trials recorded with the same setup only classify their columns once.
+    :param names: names of the subjects in the header
+    :return: the fixed name of each column, None for columns that are not a registered device
+    :rtype: tuple
+    """
+    key = tuple(names)
+    fixed = _header_cache.get(key)
+    if fixed is None:
+        fixed = tuple(_fix_name(name) for name in names)
+        _header_cache[key] = fixed
+    return fixed
+
+
+def classify_subjects(sensors):
+    """
+    Group the subjects of the devices section by device. Each subject goes to the schema with the most channels that
+    it matches, the first registered on a tie, so a subject is never in two collections: the subjects of an IMU are
+    not gyroscopes too. The result is cached for each set of subjects and fields.
+    :param sensors: the devices section of data_dict
+    :return: for each collection, a list of (device class, schema, number, keys of the subjects of the device)
+    :rtype: dict
+    """
+    key = tuple((subject, tuple(fields)) for subject, fields in sensors.items())
+    groups = _subject_cache.get(key)
+    if groups is None:
+        owners = {}
+        for device in _registry:
+            for schema in device.schemas:
+                for subject, fields in sensors.items():
+                    match = schema.pattern.match(subject)
+                    if match is not None and all(channel in fields for channel in schema.channels):
+                        owner = owners.get(subject)
+                        if owner is None or len(schema.channels) > len(owner[1].channels):
+                            owners[subject] = (device, schema, int(match.group("number")))
+
+        groups = {}
+        for device in _registry:
+            for schema in device.schemas:
+                found = {}
+                for subject, (owner, owner_schema, number) in owners.items():
+                    if owner_schema is schema:
+                        found.setdefault(number, []).append(subject)
+                for number in sorted(found):
+                    groups.setdefault(schema.collection, []).append((device, schema, number, found[number]))
+        _subject_cache[key] = groups
+    return groups
+
+
+def find_devices(sensors, collection, dtype=None):
+    """
+    Build every device of a collection
+    :param sensors: the devices section of data_dict
+    :param collection: name of the collection, ex: "IMUs"
+    :param dtype: type to store the signals of the devices as, ex: np.float32, None leaves it to the device
+    :return: devices by number
+    :rtype: dict
+    """
+    devices = {}
+    for device, schema, number, keys in classify_subjects(sensors).get(collection, []):
+        made = device.create(number, keys, sensors, schema, dtype=dtype)
+        if made is not None:
+            devices[number] = made
+    return devices
+
+
+def _fix_name(name):
+    for device in _registry:
+        for pattern, name_format in device.columns:
+            match = pattern.search(name)
+            if match is not None:
+                return name_format.format(**match.groupdict())
+    return None
+
+
 class Devices(object):
 
+    # (compiled pattern, format) pairs naming the columns of the device in the CSV header, see classify_header
+    columns = ()
+    # the kinds of subjects the device is built from, see Schema
+    schemas = ()
+
     def __init__(self, name, sensor, type, offest=20):
         """
         Base class for Device connected to the Vicon
@@ -57,6 +178,10 @@ class Devices(object):
         self._sensor = sensor
         self.type = type
         self.offset = offest
+        self.rate = None
+        # Set by Synchronization.synchronize, in samples and seconds per second
+        self.lag = 0
+        self.drift = 0.0
 
     @property
     def name(self):
@@ -82,8 +207,40 @@ class Devices(object):
     def type(self, value):
         self._type = value
 
+    @classmethod
+    def create(cls, number, keys, sensors, schema, dtype=None):
+        """
+        Build a device from the subjects that make it up
+        :param number: number of the device
+        :param keys: names of the subjects of the device in sensors
+        :param sensors: the devices section of data_dict
+        :param schema: the schema the subjects matched
+        :param dtype: type to store the signals as, ignored by devices that keep PointArrays
+        :return: the device, or None if it can not be built
+        """
+        return cls(keys[0], sensors[keys[0]])
+
+    def set_rate(self, rate, frame_rate):
+        """
+        Set the rate of the device, and the offset from the rate of the markers
+        :param rate: rate of the device in Hz
+        :param frame_rate: rate of the markers in Hz
+        :return: None
+        """
+        self.rate = rate
+        offset = rate / float(frame_rate)
+        self.offset = int(offset) if offset.is_integer() else offset
+
     def get_offset_index(self, dx):
-        return dx * self.offset
+        """
+        Get the index of the sample recorded at a frame of the markers
+        :param dx: frame of the markers
+        :return: index of the device sample, corrected for the lag and drift of the device
+        """
+        index = dx * self.offset
+        if self.drift != 0 or not float(self.offset).is_integer():
+            index = np.rint(np.multiply(index, 1.0 + self.drift)).astype(int)
+        return index + self.lag
 
     def get_values(self):
         return self._sensor
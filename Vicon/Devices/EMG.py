@@ -43,14 +43,90 @@
 # */
 # //==============================================================================
 
+import re
 from . import Devices
 from GaitCore.Core import PointArray
+import numpy as np
+from ..Mocap import Storage
 
+@Devices.register
 class EMG(Devices.Devices):
 
-    def __init__(self, name, sensor):
-        emg = PointArray.PointArray(sensor["data"],sensor["data"],sensor["data"])
-        super(EMG, self).__init__(name, emg, "EMG")
+    columns = ((re.compile(r"Trigno EMG.*?(?P<number>\d+)$"), "T_EMG_{number}"),
+               (re.compile(r"IMU EMG.*Sensor (?P<number>\d+)"), "EMG_{number}"))
+    schemas = (Devices.Schema("EMGs", re.compile(r"EMG_(?P<number>\d+)$"), ("IM EMG",)),
+               Devices.Schema("T_EMGs", re.compile(r"T_EMG_(?P<number>\d+)$"), ("EMG",)))
 
+    def __init__(self, name, sensor, dtype=np.float64):
+        """
+        A single EMG channel, stored as a read only 1D array, which is a view of the devices when the field is
+        already of type dtype
+        :param name: name of sensor
+        :param sensor: data
+        :param dtype: type to store the samples as, ex: np.float32
+        """
+        super(EMG, self).__init__(name, None, "EMG")
+        self._data = Storage.read_only(np.asarray(sensor["data"], dtype=dtype))
+        self._envelope = None
+        self._envelope_settings = None
 
+    @classmethod
+    def create(cls, number, keys, sensors, schema, dtype=None):
+        return cls(keys[0], sensors[keys[0]][schema.channels[0]], np.float64 if dtype is None else dtype)
 
+    @property
+    def data(self):
+        """
+        :return: the samples of the channel
+        :rtype: np.array
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._sensor = None
+
+    @property
+    def envelope(self):
+        """
+        :return: the envelope made by EMGPipeline.apply, or None if it has not been made
+        :rtype: np.array
+        """
+        return self._envelope
+
+    @property
+    def envelope_settings(self):
+        """
+        :return: the settings of the pipeline that made the envelope
+        """
+        return self._envelope_settings
+
+    def set_envelope(self, envelope, settings=None):
+        """
+        Cache the envelope of the channel
+        :param envelope: envelope of the channel
+        :param settings: settings of the pipeline that made the envelope
+        :return:
+        """
+        self._envelope = envelope
+        self._envelope_settings = settings
+
+    @property
+    def sensor(self):
+        """
+        The channel as a PointArray with the same samples in x, y and z, for code written against the old layout.
+        It is only built when it is asked for.
+        :return: the channel
+        :rtype: PointArray
+        """
+        if self._sensor is None:
+            self._sensor = PointArray.PointArray(self._data, self._data, self._data)
+        return self._sensor
+
+    @sensor.setter
+    def sensor(self, value):
+        self._sensor = value
+
+    def get_values(self):
+        return self.sensor
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import numpy as np
+from scipy import signal
+from scipy.ndimage import uniform_filter1d
+
+
+class EMGPipeline(object):
+
+    def __init__(self, rate, band=(20.0, 450.0), band_order=4, envelope="lowpass", cutoff=6.0, lowpass_order=4,
+                 rms_window=0.05, mvc=None):
+        """
+        Turns raw EMG into envelopes: band-pass, full wave rectify, low-pass or moving RMS, then normalize to MVC.
+        Every stage works on all channels at once, as a matrix indexed by [channel, sample].
+        :param rate: sample rate of the EMG in Hz
+        :param band: low and high cutoff of the band-pass filter in Hz
+        :param band_order: order of the band-pass filter
+        :param envelope: "lowpass" or "rms"
+        :param cutoff: cutoff of the low-pass envelope filter in Hz
+        :param lowpass_order: order of the low-pass envelope filter
+        :param rms_window: length of the moving RMS window in seconds
+        :param mvc: MVC of each channel, or one value for all channels. None skips normalizing
+        """
+        if envelope not in ("lowpass", "rms"):
+            raise ValueError("envelope must be 'lowpass' or 'rms'")
+        if band[1] >= rate / 2.0:
+            raise ValueError("The band-pass filter must stop below the Nyquist frequency of " + str(rate / 2.0) + " Hz")
+        self._rate = rate
+        self._band = tuple(band)
+        self._band_order = band_order
+        self._envelope = envelope
+        self._cutoff = cutoff
+        self._lowpass_order = lowpass_order
+        self._rms_window = rms_window
+        self._rms_samples = max(int(round(rms_window * rate)), 1)
+        self._mvc = mvc
+        self._band_sos = signal.butter(band_order, self._band, btype="bandpass", fs=rate, output="sos")
+        self._low_sos = signal.butter(lowpass_order, cutoff, btype="lowpass", fs=rate, output="sos")
+
+    @property
+    def mvc(self):
+        return self._mvc
+
+    @mvc.setter
+    def mvc(self, value):
+        self._mvc = value
+
+    @property
+    def settings(self):
+        """
+        :return: everything that changes the envelopes this pipeline makes
+        :rtype: tuple
+        """
+        mvc = None if self._mvc is None else tuple(np.ravel(self._mvc).tolist())
+        return (self._rate, self._band, self._band_order, self._envelope, self._cutoff, self._lowpass_order,
+                self._rms_window, mvc)
+
+    def process(self, matrix, normalize=True):
+        """
+        Make the envelopes of a whole recording. The filters are run forwards and backwards so the
+        envelopes are not delayed.
+        :param matrix: EMG indexed by [channel, sample]
+        :param normalize: divide by the MVC, if one is set
+        :return: envelopes indexed by [channel, sample]
+        :rtype: np.array
+        """
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+        rectified = np.abs(signal.sosfiltfilt(self._band_sos, matrix, axis=1))
+        if self._envelope == "lowpass":
+            envelopes = signal.sosfiltfilt(self._low_sos, rectified, axis=1)
+        else:
+            envelopes = np.sqrt(np.maximum(uniform_filter1d(rectified ** 2, self._rms_samples, axis=1), 0))
+        if normalize:
+            envelopes = self._normalize(envelopes)
+        return envelopes
+
+    def process_chunks(self, chunks, normalize=True):
+        """
+        Make the envelopes of a recording that is too long to filter at once. The filter states and the
+        end of the RMS window are carried from one chunk to the next, so the result is the same as filtering the
+        whole recording with causal filters.
+        :param chunks: iterable of EMG chunks, each indexed by [channel, sample]
+        :param normalize: divide by the MVC, if one is set
+        :return: generator of envelope chunks indexed by [channel, sample]
+        """
+        band_state = None
+        low_state = None
+        tail = None
+        for chunk in chunks:
+            chunk = np.atleast_2d(np.asarray(chunk, dtype=np.float64))
+            if band_state is None:
+                band_state = np.zeros((self._band_sos.shape[0], chunk.shape[0], 2))
+            filtered, band_state = signal.sosfilt(self._band_sos, chunk, axis=1, zi=band_state)
+            rectified = np.abs(filtered)
+
+            if self._envelope == "lowpass":
+                if low_state is None:
+                    # Start from the steady state of the first sample so the envelope doesn't ramp up from zero
+                    low_state = signal.sosfilt_zi(self._low_sos)[:, np.newaxis, :] * \
+                                rectified[:, 0][np.newaxis, :, np.newaxis]
+                envelopes, low_state = signal.sosfilt(self._low_sos, rectified, axis=1, zi=low_state)
+            else:
+                if tail is None:
+                    tail = np.zeros((chunk.shape[0], self._rms_samples - 1))
+                squared = np.concatenate((tail, rectified ** 2), axis=1)
+                total = np.cumsum(np.pad(squared, ((0, 0), (1, 0)), mode="constant"), axis=1)
+                envelopes = np.sqrt(np.maximum(total[:, self._rms_samples:] - total[:, :-self._rms_samples], 0)
+                                    / self._rms_samples)
+                tail = squared[:, squared.shape[1] - (self._rms_samples - 1):]
+
+            if normalize:
+                envelopes = self._normalize(envelopes)
+            yield envelopes
+
+    def apply(self, vicon, trigno=False, normalize=True, chunk_size=None, out=None):
+        """
+        Make the envelopes of every EMG in a trial and cache them on the EMG objects.
+        Channels that already have an envelope from the same settings are not processed again.
+        :param vicon: Vicon object
+        :param trigno: process the Trigno EMGs instead of the IMU EMGs
+        :param normalize: divide by the MVC, if one is set
+        :param chunk_size: filter this many samples at a time with process_chunks, for recordings that do not fit
+                           in memory. The filters are then causal. None filters the whole recording with process
+        :param out: array indexed by [channel, sample] to write the envelopes into when filtering in chunks,
+                    ex: a memory mapped array
+        :return: the channel numbers in the order of the rows, and the envelopes indexed by [channel, sample]
+        :rtype: list, np.array
+        """
+        emgs = vicon.get_all_t_emg() if trigno else vicon.get_all_emgs()
+        settings = (self.settings, normalize, chunk_size is not None)
+        keys = sorted(emgs.keys())
+        if len(keys) > 0 and all(emgs[key].envelope_settings == settings for key in keys):
+            return keys, np.vstack([emgs[key].envelope for key in keys])
+        if len(keys) == 0:
+            # the filters need more samples than a trial without EMGs has
+            return keys, np.empty((0, 0)) if out is None else out
+
+        if chunk_size is not None:
+            # the channels are views of the trial, so only one chunk of them is read at a time
+            channels = [emgs[key].data for key in keys]
+            samples = len(channels[0]) if channels else 0
+            if out is None:
+                out = np.empty((len(keys), samples))
+            pieces = (np.vstack([channel[start:start + chunk_size] for channel in channels])
+                      for start in range(0, samples, chunk_size))
+            for start, envelopes in zip(range(0, samples, chunk_size), self.process_chunks(pieces, normalize)):
+                out[:, start:start + envelopes.shape[1]] = envelopes
+            envelopes = out
+        else:
+            keys, matrix = vicon.get_emg_matrix(trigno=trigno)
+            envelopes = self.process(matrix, normalize=normalize)
+        for row, key in enumerate(keys):
+            emgs[key].set_envelope(envelopes[row], settings)
+        return keys, envelopes
+
+    def _normalize(self, envelopes):
+        if self._mvc is None:
+            return envelopes
+        mvc = np.asarray(self._mvc, dtype=np.float64)
+        if mvc.ndim > 0:
+            mvc = mvc.reshape((-1, 1))
+        return envelopes / mvc
@@ -44,45 +44,179 @@
 # //==============================================================================
 
 
+import re
 from . import Devices
 from GaitCore.Core import PointArray
 from GaitCore.Core import Newton
+import numpy as np
+from ..Mocap import Storage
 
+@Devices.register
 class ForcePlate(Devices.Devices):
 
-    def __init__(self, name, forces, moments, CoP):
-        self.force = PointArray.PointArray(forces["Fx"]["data"], forces["Fy"]["data"], forces["Fz"]["data"])
-        self.moment = PointArray.PointArray(moments["Mx"]["data"], moments["My"]["data"], moments["Mz"]["data"])
-        self.CoP = PointArray.PointArray(CoP["Cx"]["data"], CoP["Cy"]["data"], CoP["Cz"]["data"])
-        sensor = Newton.Newton(self.CoP, self.force, self.moment, None)
-        super(ForcePlate, self).__init__(name, sensor, "IMU")
+    columns = ((re.compile(r"AMTI.*#(?P<number>\d+)\s*-\s*(?P<quantity>Force|Moment|CoP)"),
+                "Force_Plate__{quantity}_{number}"),)
+    schemas = (Devices.Schema("force_plates", re.compile(r"Force_Plate__(?P<quantity>Force|Moment|CoP)_(?P<number>\d+)$"),
+                              ()),)
+    # fields of each quantity of a plate
+    channels = {"Force": ("Fx", "Fy", "Fz"), "Moment": ("Mx", "My", "Mz"), "CoP": ("Cx", "Cy", "Cz")}
+
+    def __init__(self, name, forces, moments, CoP, dtype=np.float64):
+        """
+        A force plate, stored as read only arrays indexed by [sample, axis], which are views of the devices when the
+        fields are already of type dtype
+        :param name: name of the force plate
+        :param forces: Fx, Fy and Fz fields of the plate
+        :param moments: Mx, My and Mz fields of the plate
+        :param CoP: Cx, Cy and Cz fields of the plate
+        :param dtype: type to store the samples as, ex: np.float32
+        """
+        self._force = _stack(forces, ("Fx", "Fy", "Fz"), dtype)
+        self._moment = _stack(moments, ("Mx", "My", "Mz"), dtype)
+        self._CoP = _stack(CoP, ("Cx", "Cy", "Cz"), dtype)
+        self._points = {}
+        super(ForcePlate, self).__init__(name, None, "ForcePlate")
+
+    @classmethod
+    def create(cls, number, keys, sensors, schema, dtype=None):
+        quantities = {}
+        for key in keys:
+            quantity = schema.pattern.match(key).group("quantity")
+            if all(channel in sensors[key] for channel in cls.channels[quantity]):
+                quantities[quantity] = sensors[key]
+        if len(quantities) < len(cls.channels):
+            return None
+        return cls("Force_Plate_" + str(number), quantities["Force"], quantities["Moment"], quantities["CoP"],
+                   np.float64 if dtype is None else dtype)
+
+    def _point_array(self, name, values):
+        if name not in self._points:
+            self._points[name] = PointArray.PointArray(values[:, 0], values[:, 1], values[:, 2])
+        return self._points[name]
+
+    @property
+    def force(self):
+        return self._point_array("force", self._force)
+
+    @property
+    def moment(self):
+        return self._point_array("moment", self._moment)
+
+    @property
+    def CoP(self):
+        return self._point_array("CoP", self._CoP)
+
+    @property
+    def sensor(self):
+        """
+        The force plate as a Newton, only built when it is asked for
+        :rtype: Newton
+        """
+        if self._sensor is None:
+            self._sensor = Newton.Newton(self.CoP, self.force, self.moment, None)
+        return self._sensor
+
+    @sensor.setter
+    def sensor(self, value):
+        self._sensor = value
 
     def get_forces(self):
         """
 
         :return: the force from the force plate
-        :rtype: Point
+        :rtype: PointArray
         """
-        return self._sensor.force
+        return self.force
 
     def get_moments(self):
         """
 
         :return: the Moment from the force plate
-        :rtype: Point
+        :rtype: PointArray
         """
-        return self._sensor.moment
+        return self.moment
 
     def get_CoP(self):
         """
 
         :return: the CoP from the force plate
-        :rtype: Point
+        :rtype: PointArray
+        """
+        return self.CoP
+
+    def get_force_array(self):
+        """
+
+        :return: the force from the force plate, indexed by [sample, axis]
+        :rtype: np.array
+        """
+        return self._force
+
+    def get_moment_array(self):
+        """
+
+        :return: the moment from the force plate, indexed by [sample, axis]
+        :rtype: np.array
+        """
+        return self._moment
+
+    def get_CoP_array(self):
+        """
+
+        :return: the CoP from the force plate, indexed by [sample, axis]
+        :rtype: np.array
         """
-        return self._sensor.angle
+        return self._CoP
 
     def get_values(self):
         """
         returns the force, CoP, and Moments
         """
-        return self.get_forces(), self.get_CoP(), self.get_moments()
\ No newline at end of file
+        return self.get_forces(), self.get_CoP(), self.get_moments()
+
+
+def _stack(fields, names, dtype):
+    return Storage.read_only(Storage.stack([fields[name]["data"] for name in names]).astype(dtype, copy=False))
+
+
+def combine(plates, threshold=10.0, origins=None):
+    """
+    Combine several force plates into a single ground reaction force for every sample.
+    The plates are assumed to be level with each other, and their moments to be about their origin in the global frame.
+    :param plates: list of ForcePlate
+    :param threshold: smallest vertical force a plate must carry to count as loaded. The force, moment and CoP of a
+                      plate are left out while it is not loaded, and the CoP is nan while no plate is
+    :param origins: origin of each plate in the global frame, defaults to the global origin for every plate
+    :return: dictionary with the total "force", the "moment" about the global origin, the combined "CoP",
+             each indexed by [sample, axis], and the "free_moment" about the vertical axis at the combined CoP
+    :rtype: dict
+    """
+    force = np.array([plate.get_force_array() for plate in plates], dtype=np.float64)
+    moment = np.array([plate.get_moment_array() for plate in plates], dtype=np.float64)
+    cop = np.array([plate.get_CoP_array() for plate in plates], dtype=np.float64)
+    # Vicon leaves the CoP of an unloaded plate blank, and what an unloaded plate reads is noise, so an unloaded plate
+    # adds nothing to the force, the moment or the CoP
+    plate_loaded = np.abs(force[:, :, 2]) > threshold
+    force = np.where(plate_loaded[:, :, np.newaxis], force, 0.0)
+    moment = np.where(plate_loaded[:, :, np.newaxis], moment, 0.0)
+    cop = np.where(plate_loaded[:, :, np.newaxis], cop, 0.0)
+    if origins is None:
+        origins = np.zeros((len(plates), 3))
+    arm = cop - np.asarray(origins, dtype=np.float64)[:, np.newaxis, :]
+
+    # The vertical moment each plate has left over once its force acting at its CoP is accounted for
+    plate_free = moment[:, :, 2] - (arm[:, :, 0] * force[:, :, 1] - arm[:, :, 1] * force[:, :, 0])
+
+    total_force = force.sum(axis=0)
+    loaded = plate_loaded.any(axis=0) & (total_force[:, 2] != 0)
+    safe_fz = np.where(loaded, total_force[:, 2], 1.0)
+    total_cop = (cop * force[:, :, 2:]).sum(axis=0) / safe_fz[:, np.newaxis]
+    total_cop[~loaded] = np.nan
+
+    total_moment = np.cross(cop, force).sum(axis=0)
+    total_moment[:, 2] += plate_free.sum(axis=0)
+
+    offset = cop - total_cop[np.newaxis, :, :]
+    free_moment = (plate_free + offset[:, :, 0] * force[:, :, 1] - offset[:, :, 1] * force[:, :, 0]).sum(axis=0)
+
+    return {"force": total_force, "moment": total_moment, "CoP": total_cop, "free_moment": free_moment}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import numpy as np
+
+HEEL_STRIKE = "heel_strike"
+TOE_OFF = "toe_off"
+
+EVENT_DTYPE = [("plate", np.int64), ("event", "U11"), ("sample", np.int64), ("frame", np.int64)]
+
+
+def get_vertical_forces(vicon):
+    """
+    Stack the vertical force of every force plate
+    :param vicon: Vicon object
+    :return: the force plate numbers in the order of the rows, and the forces indexed by [plate, sample]
+    :rtype: list, np.array
+    """
+    keys = sorted(vicon.get_force_plate_keys())
+    if len(keys) == 0:
+        return keys, np.zeros((0, 0))
+    return keys, np.vstack([vicon.get_force_plate(key).get_force_array()[:, 2] for key in keys])
+
+
+def detect_events(fz, threshold=20.0, release=None, min_stance=0, min_swing=0, samples_per_frame=1, plates=None):
+    """
+    Find heel strikes and toe offs on every force plate at once.
+    A plate is loaded once the magnitude of its vertical force rises above threshold, and stays loaded until it
+    drops below release. Stances shorter than min_stance samples are dropped, after gaps between stances that are
+    shorter than min_swing samples have been joined. Stances that are already loaded at the start of the recording
+    or still loaded at the end only produce the event that was recorded.
+    :param fz: vertical forces indexed by [plate, sample]
+    :param threshold: force that starts a stance
+    :param release: force that ends a stance, defaults to threshold
+    :param min_stance: shortest stance to keep, in samples
+    :param min_swing: shortest gap between two stances on the same plate, in samples
+    :param samples_per_frame: number of force plate samples per trajectory frame
+    :param plates: force plate numbers of the rows, defaults to 0, 1, 2, ...
+    :return: events sorted by sample, with the fields plate, event, sample and frame. frame is the
+             index of the trajectory frame the event happened in, starting at 0
+    :rtype: np.array
+    """
+    force = np.abs(np.atleast_2d(np.asarray(fz, dtype=np.float64)))
+    if release is None:
+        release = threshold
+    if plates is None:
+        plates = np.arange(force.shape[0])
+    plates = np.asarray(plates)
+    n = force.shape[1]
+
+    # Hysteresis: above threshold is loaded, below release is unloaded, anything in between keeps the last state
+    decided = (force > threshold) | (force < release)
+    last = np.where(decided, np.arange(n), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    loaded = (force > threshold)[np.arange(force.shape[0])[:, np.newaxis], last]
+    loaded[:, 0] &= decided[:, 0]
+
+    edges = np.diff(loaded.astype(np.int8), axis=1, prepend=0, append=0)
+    start_plate, starts = np.nonzero(edges == 1)
+    end_plate, ends = np.nonzero(edges == -1)
+
+    # Join stances separated by a swing that is too short
+    merge = (start_plate[1:] == end_plate[:-1]) & (starts[1:] - ends[:-1] < min_swing)
+    keep_start = np.concatenate(([True], ~merge))
+    keep_end = np.concatenate((~merge, [True]))
+    start_plate, starts, ends = start_plate[keep_start], starts[keep_start], ends[keep_end]
+
+    keep = ends - starts >= min_stance
+    start_plate, starts, ends = start_plate[keep], starts[keep], ends[keep]
+
+    strikes = starts > 0
+    offs = ends < n
+    events = np.zeros(np.count_nonzero(strikes) + np.count_nonzero(offs), dtype=EVENT_DTYPE)
+    events["plate"] = np.concatenate((plates[start_plate[strikes]], plates[start_plate[offs]]))
+    events["event"] = np.concatenate((np.full(np.count_nonzero(strikes), HEEL_STRIKE),
+                                      np.full(np.count_nonzero(offs), TOE_OFF)))
+    events["sample"] = np.concatenate((starts[strikes], ends[offs]))
+    events["frame"] = events["sample"] // samples_per_frame
+    return events[np.argsort(events["sample"], kind="stable")]
+
+
+def detect_gait_events(vicon, threshold=20.0, release=None, min_stance=0, min_swing=0, samples_per_frame=None):
+    """
+    Find heel strikes and toe offs on every force plate of a trial
+    :param vicon: Vicon object
+    :param samples_per_frame: number of force plate samples per trajectory frame, defaults to the offset of the plates
+    :return: events, see detect_events
+    :rtype: np.array
+    """
+    keys, fz = get_vertical_forces(vicon)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    if samples_per_frame is None:
+        samples_per_frame = vicon.get_force_plate(keys[0]).offset
+    return detect_events(fz, threshold, release, min_stance, min_swing, samples_per_frame, keys)
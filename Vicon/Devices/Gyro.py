@@ -43,12 +43,17 @@
 # */
 # //==============================================================================
 
+import re
 from . import Devices
 from GaitCore.Core import PointArray
 
 
+@Devices.register
 class Gyro(Devices.Devices):
 
+    # IMUs that only have gyroscope channels, IMUs with accelerometers as well go in IMUs instead
+    schemas = (Devices.Schema("gyros", re.compile(r"IMU_(?P<number>\d+)$"), ("GYROX", "GYROY", "GYROZ")),)
+
     def __init__(self, name, sensor):
         gyro = PointArray.PointArray(sensor["GYROX"]["data"],
                            sensor["GYROY"]["data"],
@@ -43,27 +43,50 @@
 # */
 # //==============================================================================
 
+import re
 from . import Devices
 from GaitCore.Core import PointArray
+import numpy as np
+from ..Mocap import Storage
 
+@Devices.register
 class IMU(Devices.Devices):
 
-    def __init__(self, name, sensor):
-        self._accel = PointArray.PointArray(sensor["ACCX"]["data"],
-                                 sensor["ACCY"]["data"],
-                                 sensor["ACCZ"]["data"])
-        self._gyro = PointArray.PointArray(sensor["GYROX"]["data"],
-                                 sensor["GYROY"]["data"],
-                                 sensor["GYROZ"]["data"])
+    columns = ((re.compile(r"IMU AUX.*Sensor (?P<number>\d+)"), "IMU_{number}"),)
+    schemas = (Devices.Schema("IMUs", re.compile(r"IMU_(?P<number>\d+)$"),
+                              ("ACCX", "ACCY", "ACCZ", "GYROX", "GYROY", "GYROZ")),)
+
+    def __init__(self, name, sensor, dtype=np.float64):
+        """
+        An IMU, with its accelerometer and gyroscope stored as read only arrays indexed by [sample, axis], which are
+        views of the devices when the fields are already of type dtype
+        :param name: name of the IMU
+        :param sensor: the fields of the IMU
+        :param dtype: type to store the samples as, ex: np.float32
+        """
+        self._accel_array = Storage.read_only(Storage.stack((sensor["ACCX"]["data"], sensor["ACCY"]["data"],
+                                                             sensor["ACCZ"]["data"])).astype(dtype, copy=False))
+        self._gyro_array = Storage.read_only(Storage.stack((sensor["GYROX"]["data"], sensor["GYROY"]["data"],
+                                                            sensor["GYROZ"]["data"])).astype(dtype, copy=False))
+        self._accel = None
+        self._gyro = None
+        self._orientation = None
+        self._free_accel = None
+        self._orientation_settings = None
 
         super(IMU, self).__init__(name, sensor, "IMU")
 
+    @classmethod
+    def create(cls, number, keys, sensors, schema, dtype=None):
+        return cls(keys[0], sensors[keys[0]], np.float64 if dtype is None else dtype)
 
     def get_accel(self):
         """
 
         :return:
         """
+        if self._accel is None:
+            self._accel = PointArray.PointArray(self._accel_array[:, 0], self._accel_array[:, 1], self._accel_array[:, 2])
         return self._accel
 
     def get_gyro(self):
@@ -71,7 +94,64 @@ class IMU(Devices.Devices):
 
         :return:
         """
+        if self._gyro is None:
+            self._gyro = PointArray.PointArray(self._gyro_array[:, 0], self._gyro_array[:, 1], self._gyro_array[:, 2])
         return self._gyro
 
+    def get_accel_array(self):
+        """
+
+        :return: the acceleration, indexed by [sample, axis]
+        :rtype: np.array
+        """
+        return self._accel_array
+
+    def get_gyro_array(self):
+        """
+
+        :return: the angular velocity, indexed by [sample, axis]
+        :rtype: np.array
+        """
+        return self._gyro_array
+
+    def get_accel_unit(self):
+        return self._sensor["ACCX"]["unit"]
+
+    def get_gyro_unit(self):
+        return self._sensor["GYROX"]["unit"]
+
+    @property
+    def orientation(self):
+        """
+        :return: the orientation quaternions [w, x, y, z] made by Orientation.OrientationFilter, indexed by
+                 [sample, component], or None if they have not been made
+        :rtype: np.array
+        """
+        return self._orientation
+
+    @property
+    def free_acceleration(self):
+        """
+        :return: the acceleration in the global frame with gravity removed, indexed by [sample, axis]
+        :rtype: np.array
+        """
+        return self._free_accel
+
+    @property
+    def orientation_settings(self):
+        return self._orientation_settings
+
+    def set_orientation(self, orientation, free_acceleration, settings=None):
+        """
+        Cache the orientation of the IMU
+        :param orientation: quaternions indexed by [sample, component]
+        :param free_acceleration: acceleration with gravity removed, indexed by [sample, axis]
+        :param settings: settings of the filter that made them
+        :return:
+        """
+        self._orientation = orientation
+        self._free_accel = free_acceleration
+        self._orientation_settings = settings
+
     def get_values(self):
-        return self._accel, self._gyro
+        return self.get_accel(), self.get_gyro()
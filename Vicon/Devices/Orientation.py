@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import numpy as np
+
+STANDARD_GRAVITY = 9.80665
+
+
+class OrientationFilter(object):
+
+    def __init__(self, rate, method="madgwick", gain=None, gyro_unit=None, gravity=None):
+        """
+        Estimates the orientation of IMUs from their gyroscopes and accelerometers.
+        Every IMU is filtered at the same time, so the work per sample is shared between all of the sensors.
+        :param rate: sample rate of the IMUs in Hz
+        :param method: "madgwick" for a Madgwick gradient descent filter, or "complementary" for a
+                       complementary filter that corrects the gyroscope with the direction of gravity
+        :param gain: beta of the Madgwick filter (default 0.1), or the proportional gain of the complementary
+                     filter (default 1.0)
+        :param gyro_unit: "deg/s" or "rad/s", defaults to the unit of the IMU
+        :param gravity: size of gravity in the unit of the accelerometers, defaults to 1 for g and 9.81 for m/s^2
+        """
+        if method not in ("madgwick", "complementary"):
+            raise ValueError("method must be 'madgwick' or 'complementary'")
+        if gain is None:
+            gain = 0.1 if method == "madgwick" else 1.0
+        self._rate = rate
+        self._method = method
+        self._gain = gain
+        self._gyro_unit = gyro_unit
+        self._gravity = gravity
+
+    @property
+    def settings(self):
+        return self._rate, self._method, self._gain, self._gyro_unit, self._gravity
+
+    def estimate(self, gyro, accel, gyro_unit="rad/s", gravity=1.0):
+        """
+        Filter a batch of IMUs
+        :param gyro: angular velocity indexed by [sensor, sample, axis]
+        :param accel: acceleration indexed by [sensor, sample, axis]
+        :param gyro_unit: unit of gyro, used if the filter wasn't given one
+        :param gravity: size of gravity in the unit of accel, used if the filter wasn't given one
+        :return: quaternions [w, x, y, z] from the sensor to the global frame, indexed by [sensor, sample, component],
+                 and the acceleration in the global frame with gravity removed, indexed by [sensor, sample, axis]
+        :rtype: np.array, np.array
+        """
+        gyro = np.asarray(gyro, dtype=np.float64)
+        accel = np.asarray(accel, dtype=np.float64)
+        if self._gyro_unit is not None:
+            gyro_unit = self._gyro_unit
+        if self._gravity is not None:
+            gravity = self._gravity
+        if "deg" in gyro_unit.lower():
+            gyro = np.radians(gyro)
+
+        if self._method == "madgwick":
+            quaternions = madgwick(gyro, accel, self._rate, self._gain)
+        else:
+            quaternions = complementary(gyro, accel, self._rate, self._gain)
+        free = rotate(quaternions, accel)
+        free[..., 2] -= gravity
+        return quaternions, free
+
+    def apply(self, imus):
+        """
+        Filter IMUs and cache the results on them. IMUs that were already filtered with the same settings are skipped.
+        :param imus: dictionary of IMUs, ex: Vicon.IMUs
+        :return: dictionary of (quaternions, free acceleration) for each IMU
+        :rtype: dict
+        """
+        todo = [key for key in imus if imus[key].orientation_settings != self.settings]
+
+        # IMUs can only be filtered together if they have the same length and units
+        groups = {}
+        for key in todo:
+            imu = imus[key]
+            group = (len(imu.get_gyro_array()), imu.get_gyro_unit(), imu.get_accel_unit())
+            groups.setdefault(group, []).append(key)
+
+        for (length, gyro_unit, accel_unit), keys in groups.items():
+            gyro = np.array([imus[key].get_gyro_array() for key in keys])
+            accel = np.array([imus[key].get_accel_array() for key in keys])
+            quaternions, free = self.estimate(gyro, accel, gyro_unit, gravity_for_unit(accel_unit))
+            for index, key in enumerate(keys):
+                imus[key].set_orientation(quaternions[index], free[index], self.settings)
+
+        return dict((key, (imus[key].orientation, imus[key].free_acceleration)) for key in imus)
+
+
+def gravity_for_unit(unit):
+    """
+    :param unit: unit of an accelerometer
+    :return: size of gravity in that unit
+    """
+    if "m/s" in unit.lower():
+        return STANDARD_GRAVITY
+    return 1.0
+
+
+def initial_orientation(accel):
+    """
+    Find the orientations that line each sensor's acceleration up with the global z axis
+    :param accel: acceleration of each sensor, indexed by [sensor, axis]
+    :return: quaternions indexed by [sensor, component]
+    """
+    down = accel / np.maximum(np.linalg.norm(accel, axis=-1, keepdims=True), 1e-12)
+    quaternions = np.zeros((len(accel), 4))
+    quaternions[:, 0] = 1.0 + down[:, 2]
+    quaternions[:, 1] = down[:, 1]
+    quaternions[:, 2] = -down[:, 0]
+    # Upside down sensors need a half turn around any horizontal axis
+    flipped = quaternions[:, 0] < 1e-9
+    quaternions[flipped] = (0.0, 1.0, 0.0, 0.0)
+    return quaternions / np.linalg.norm(quaternions, axis=-1, keepdims=True)
+
+
+def _coefficients(entries, shape):
+    """
+    Build a constant array from (index, value) pairs, used to write the products of the filters as matrix products
+    """
+    coefficients = np.zeros(shape)
+    for index, value in entries:
+        coefficients[index] = value
+    return coefficients
+
+
+_W, _X, _Y, _Z = range(4)
+# q_dot = 0.5 * q * (0, omega) as a matrix of omega times q, flattened so it is made with one product with omega
+_RATE = _coefficients([((0, _W, _X), -0.5), ((1, _W, _Y), -0.5), ((2, _W, _Z), -0.5),
+                       ((0, _X, _W), 0.5), ((2, _X, _Y), 0.5), ((1, _X, _Z), -0.5),
+                       ((1, _Y, _W), 0.5), ((2, _Y, _X), -0.5), ((0, _Y, _Z), 0.5),
+                       ((2, _Z, _W), 0.5), ((1, _Z, _X), 0.5), ((0, _Z, _Y), -0.5)], (3, 4, 4)).reshape((3, 16))
+# the direction of gravity in the sensor frame as quadratic forms of a unit quaternion, applied to q q^T
+_GRAVITY = _coefficients([((_X, _Z, 0), 1.0), ((_Z, _X, 0), 1.0), ((_W, _Y, 0), -1.0), ((_Y, _W, 0), -1.0),
+                          ((_W, _X, 1), 1.0), ((_X, _W, 1), 1.0), ((_Y, _Z, 1), 1.0), ((_Z, _Y, 1), 1.0),
+                          ((_W, _W, 2), 1.0), ((_X, _X, 2), -1.0), ((_Y, _Y, 2), -1.0), ((_Z, _Z, 2), 1.0)],
+                         (4, 4, 3)).reshape((16, 3))
+# the Jacobian of Madgwick's gravity error, which is linear in q
+_JACOBIAN = _coefficients([((_Y, 0, _W), -2.0), ((_Z, 0, _X), 2.0), ((_W, 0, _Y), -2.0), ((_X, 0, _Z), 2.0),
+                           ((_X, 1, _W), 2.0), ((_W, 1, _X), 2.0), ((_Z, 1, _Y), 2.0), ((_Y, 1, _Z), 2.0),
+                           ((_X, 2, _X), -4.0), ((_Y, 2, _Y), -4.0)], (4, 3, 4)).reshape((4, 12))
+# the cross product a x b as a matrix of a times b
+_CROSS = _coefficients([((2, 0, 1), -1.0), ((1, 0, 2), 1.0), ((2, 1, 0), 1.0), ((0, 1, 2), -1.0),
+                        ((1, 2, 0), -1.0), ((0, 2, 1), 1.0)], (3, 3, 3)).reshape((3, 9))
+
+
+class _Workspace(object):
+
+    def __init__(self, sensors):
+        """
+        The buffers the filters work in, so no arrays are made for each sample
+        :param sensors: number of sensors filtered at once
+        """
+        self.rate = np.empty((sensors, 4, 4))
+        self.q_dot = np.empty((sensors, 4, 1))
+        self.outer = np.empty((sensors, 4, 4))
+        self.gravity = np.empty((sensors, 3, 1))
+        self.squares = np.empty((sensors, 4))
+        self.norm = np.empty((sensors, 1))
+
+    def integrate(self, q, omega, dt, correction=None):
+        """
+        Turn the quaternions by the angular velocity for one sample and normalize them, in place
+        :param q: quaternions indexed by [sensor, component, 1]
+        :param omega: angular velocity indexed by [sensor, axis]
+        :param dt: length of the sample in seconds
+        :param correction: rate of change to take away from the rate of the quaternions, indexed like q
+        """
+        np.matmul(omega, _RATE, out=self.rate.reshape((-1, 16)))
+        np.matmul(self.rate, q, out=self.q_dot)
+        if correction is not None:
+            self.q_dot -= correction
+        self.q_dot *= dt
+        q += self.q_dot
+        self.normalize(q[..., 0])
+
+    def predict_gravity(self, q):
+        """
+        :param q: unit quaternions indexed by [sensor, component, 1]
+        :return: the direction of gravity in the sensor frame, indexed by [sensor, axis, 1]
+        """
+        np.multiply(q, q.reshape((-1, 1, 4)), out=self.outer)
+        np.matmul(self.outer.reshape((-1, 16)), _GRAVITY, out=self.gravity[..., 0])
+        return self.gravity
+
+    def normalize(self, values):
+        """
+        Divide each row of values by its length, in place
+        :param values: array indexed by [sensor, component]
+        """
+        np.multiply(values, values, out=self.squares[:, :values.shape[1]])
+        np.sum(self.squares[:, :values.shape[1]], axis=1, keepdims=True, out=self.norm)
+        np.sqrt(self.norm, out=self.norm)
+        np.maximum(self.norm, np.finfo(np.float64).tiny, out=self.norm)
+        values /= self.norm
+
+
+def madgwick(gyro, accel, rate, beta=0.1):
+    """
+    Madgwick's gradient descent orientation filter without a magnetometer, run on several sensors at once
+    :param gyro: angular velocity in rad/s, indexed by [sensor, sample, axis]
+    :param accel: acceleration indexed by [sensor, sample, axis]
+    :param rate: sample rate in Hz
+    :param beta: gain of the gradient descent step
+    :return: quaternions [w, x, y, z] indexed by [sensor, sample, component]
+    """
+    sensors, samples = gyro.shape[:2]
+    dt = 1.0 / rate
+    out = np.empty((sensors, samples, 4))
+    q = initial_orientation(accel[:, 0])[..., np.newaxis]
+    work = _Workspace(sensors)
+    jacobian = np.empty((sensors, 3, 4))
+    step = np.empty((sensors, 1, 4))
+
+    norms = np.linalg.norm(accel, axis=-1, keepdims=True)
+    unit_accel = np.divide(accel, norms, out=np.zeros_like(accel), where=norms > 0)[..., np.newaxis]
+    # samples without any acceleration are not corrected
+    gain = (beta * (norms > 0)).reshape((sensors, samples, 1, 1))
+
+    for n in range(samples):
+        # Gradient of the difference between the measured and predicted direction of gravity
+        error = work.predict_gravity(q)
+        error -= unit_accel[:, n]
+        np.matmul(q[..., 0], _JACOBIAN, out=jacobian.reshape((-1, 12)))
+        np.matmul(error.reshape((-1, 1, 3)), jacobian, out=step)
+        work.normalize(step[:, 0])
+        step *= gain[:, n]
+        work.integrate(q, gyro[:, n], dt, step.reshape((-1, 4, 1)))
+        out[:, n] = q[..., 0]
+    return out
+
+
+def complementary(gyro, accel, rate, gain=1.0):
+    """
+    Complementary orientation filter, run on several sensors at once. The gyroscope is integrated, and
+    corrected towards the direction of gravity measured by the accelerometer.
+    :param gyro: angular velocity in rad/s, indexed by [sensor, sample, axis]
+    :param accel: acceleration indexed by [sensor, sample, axis]
+    :param rate: sample rate in Hz
+    :param gain: how strongly the accelerometer corrects the gyroscope
+    :return: quaternions [w, x, y, z] indexed by [sensor, sample, component]
+    """
+    sensors, samples = gyro.shape[:2]
+    dt = 1.0 / rate
+    out = np.empty((sensors, samples, 4))
+    q = initial_orientation(accel[:, 0])[..., np.newaxis]
+    work = _Workspace(sensors)
+    cross = np.empty((sensors, 3, 3))
+    omega = np.empty((sensors, 3, 1))
+
+    norms = np.linalg.norm(accel, axis=-1, keepdims=True)
+    unit_accel = np.divide(accel, norms, out=np.zeros_like(accel), where=norms > 0)
+
+    for n in range(samples):
+        # Turn towards the direction of gravity predicted from the current orientation
+        np.matmul(unit_accel[:, n], _CROSS, out=cross.reshape((-1, 9)))
+        np.matmul(cross, work.predict_gravity(q), out=omega)
+        omega *= gain
+        omega += gyro[:, n, :, np.newaxis]
+        work.integrate(q, omega[..., 0], dt)
+        out[:, n] = q[..., 0]
+    return out
+
+
+def rotate(quaternions, vectors):
+    """
+    Rotate vectors from the sensor frame to the global frame
+    :param quaternions: quaternions [w, x, y, z], indexed by [..., component]
+    :param vectors: vectors indexed by [..., axis]
+    :return: rotated vectors indexed by [..., axis]
+    """
+    w = quaternions[..., 0:1]
+    u = quaternions[..., 1:4]
+    t = 2.0 * np.cross(u, vectors)
+    return vectors + w * t + np.cross(u, t)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+from fractions import Fraction
+
+import numpy as np
+from scipy import signal as sig
+
+
+def resample(values, rate, new_rate, axis=0):
+    """
+    Resample a signal with an anti-aliasing polyphase filter
+    :param values: the signal, can hold several channels
+    :param rate: rate of the signal in Hz
+    :param new_rate: rate to resample to in Hz
+    :param axis: axis of values along which the samples are
+    :return: the resampled signal
+    :rtype: np.array
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if rate == new_rate:
+        return values
+    ratio = Fraction(float(new_rate) / float(rate)).limit_denominator(1000)
+    return sig.resample_poly(values, ratio.numerator, ratio.denominator, axis=axis)
+
+
+def marker_acceleration(positions, rate):
+    """
+    The acceleration of a marker, from the second derivative of its position
+    :param positions: positions indexed by [frame, axis]
+    :param rate: frame rate of the markers in Hz
+    :return: acceleration indexed by [frame, axis]
+    :rtype: np.array
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    dt = 1.0 / rate
+    return np.gradient(np.gradient(positions, dt, axis=0), dt, axis=0)
+
+
+def estimate_lag(signal, reference, signal_rate, reference_rate, rate=None, max_lag=None):
+    """
+    Estimate how far a device signal lags behind a reference signal with an FFT cross-correlation.
+    Both signals are resampled to a common, lower rate first, which keeps the correlation cheap on long recordings.
+    :param signal: the device signal, ex: the magnitude of an IMU's acceleration
+    :param reference: the reference signal, ex: the magnitude of the acceleration of a marker on the IMU
+    :param signal_rate: rate of signal in Hz
+    :param reference_rate: rate of reference in Hz
+    :param rate: rate to correlate at in Hz, defaults to the lower of the two rates
+    :param max_lag: largest lag to look for in seconds, defaults to any lag
+    :return: the lag in seconds, positive if the device signal happens later than the reference, and the
+             normalized correlation at that lag
+    :rtype: float, float
+    """
+    if rate is None:
+        rate = min(signal_rate, reference_rate)
+    a = _standardize(resample(signal, signal_rate, rate))
+    b = _standardize(resample(reference, reference_rate, rate))
+
+    correlation = sig.correlate(a, b, mode="full", method="fft")
+    lags = sig.correlation_lags(len(a), len(b), mode="full")
+    if max_lag is not None:
+        window = np.abs(lags) <= max_lag * rate
+        correlation, lags = correlation[window], lags[window]
+
+    peak = int(np.argmax(correlation))
+    # Fit a parabola through the peak to get a lag between samples
+    shift = 0.0
+    if 0 < peak < len(correlation) - 1:
+        left, middle, right = correlation[peak - 1], correlation[peak], correlation[peak + 1]
+        denominator = left - 2.0 * middle + right
+        if denominator != 0:
+            shift = 0.5 * (left - right) / denominator
+    overlap = min(len(a), len(b))
+    return (lags[peak] + shift) / float(rate), correlation[peak] / overlap
+
+
+def estimate_drift(signal, reference, signal_rate, reference_rate, window=10.0, rate=None, max_lag=None):
+    """
+    Estimate the lag and the clock drift between a device signal and a reference signal, by finding the lag
+    in windows along the recording and fitting a line through them.
+    :param signal: the device signal
+    :param reference: the reference signal
+    :param signal_rate: rate of signal in Hz
+    :param reference_rate: rate of reference in Hz
+    :param window: length of each window in seconds
+    :param rate: rate to correlate at in Hz, defaults to the lower of the two rates
+    :param max_lag: largest lag to look for in seconds, defaults to half a window
+    :return: the lag at the start of the recording in seconds, and the drift in seconds per second
+    :rtype: float, float
+    """
+    if max_lag is None:
+        max_lag = window / 2.0
+    duration = min(len(signal) / float(signal_rate), len(reference) / float(reference_rate))
+    starts = np.arange(0.0, duration - window + 1e-9, window / 2.0)
+    if len(starts) < 2:
+        return estimate_lag(signal, reference, signal_rate, reference_rate, rate, max_lag)[0], 0.0
+
+    centers = []
+    lags = []
+    for start in starts:
+        s = slice(int(start * signal_rate), int((start + window) * signal_rate))
+        r = slice(int(start * reference_rate), int((start + window) * reference_rate))
+        lag, strength = estimate_lag(signal[s], reference[r], signal_rate, reference_rate, rate, max_lag)
+        centers.append(start + window / 2.0)
+        lags.append(lag)
+    drift, lag = np.polyfit(centers, lags, 1)
+    return lag, drift
+
+
+def synchronize(device, signal, reference, signal_rate, reference_rate, rate=None, max_lag=None, drift=False,
+                window=10.0):
+    """
+    Estimate the lag (and optionally the drift) of a device and store it on the device, so that
+    Devices.get_offset_index points at the right samples. The device's arrays are not changed or copied.
+    :param device: the device to synchronize
+    :param signal: a signal from the device
+    :param reference: the reference signal from the markers
+    :param signal_rate: rate of signal, which is the rate of the device, in Hz
+    :param reference_rate: rate of reference in Hz
+    :param rate: rate to correlate at in Hz
+    :param max_lag: largest lag to look for in seconds
+    :param drift: also estimate the drift of the device's clock
+    :param window: length of the windows used to estimate the drift, in seconds
+    :return: the lag in seconds and the drift in seconds per second
+    :rtype: float, float
+    """
+    if drift:
+        lag, rate_error = estimate_drift(signal, reference, signal_rate, reference_rate, window, rate, max_lag)
+    else:
+        lag, rate_error = estimate_lag(signal, reference, signal_rate, reference_rate, rate, max_lag)[0], 0.0
+    device.lag = int(round(lag * signal_rate))
+    device.drift = rate_error
+    return lag, rate_error
+
+
+def align(values, lag, fill=np.nan):
+    """
+    Line a device array up with the reference, so that sample i of the result was recorded at the same time as
+    sample i of the reference
+    :param values: array from the device, indexed by [sample, ...]
+    :param lag: lag of the device in samples, see Devices.lag
+    :param fill: value for the samples from before the device started, when it started after the reference
+    :return: a view of values without its first lag samples if the device started before the reference. If it started
+             after the reference, a copy of values with -lag samples of fill in front of it
+    :rtype: np.array
+    """
+    values = np.asarray(values)
+    if lag >= 0:
+        return values[lag:]
+    aligned = np.empty((len(values) - lag,) + values.shape[1:], dtype=np.result_type(values, np.asarray(fill)))
+    aligned[:-lag] = fill
+    aligned[-lag:] = values
+    return aligned
+
+
+def _standardize(values):
+    values = values - np.mean(values)
+    deviation = np.std(values)
+    if deviation > 0:
+        values = values / deviation
+    return values
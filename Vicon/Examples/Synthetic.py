@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+import csv
+
+import numpy as np
+
+# Markers of each rigid body in its own frame, in mm. The first three markers of each body are placed so that the frame
+# Markers.make_frame builds from them is orthonormal, as the hinge joint solver expects. The femur and tibia markers are
+# mirrored across the plane through the knee normal to its axis, so the knee is the point of the axis closest to them
+# and its center is fully known
+ROOT_MARKERS = np.array([[-30.0, -16.0, 0.0], [26.0, -30.0, 0.0], [-16.0, 40.0, 0.0], [26.0, 33.0, 0.0]])
+FEMUR_MARKERS = np.array([[0.0, -25.0, -100.0], [0.0, 25.0, -100.0], [60.0, -25.0, -250.0], [60.0, 25.0, -250.0]])
+TIBIA_MARKERS = np.array([[0.0, -20.0, -100.0], [0.0, 20.0, -100.0], [50.0, -20.0, -220.0], [50.0, 20.0, -220.0]])
+# Clusters placed the way they often are on a subject, with none of their axes at right angles, for checking the
+# joint solvers on frames that are not orthonormal. The knee is only known up to its axis with these.
+SKEWED_ROOT_MARKERS = np.array([[-30.0, -16.0, 0.0], [26.0, -30.0, 0.0], [-16.0, 33.0, 0.0], [26.0, 33.0, 0.0]])
+SKEWED_FEMUR_MARKERS = np.array([[0.0, 0.0, -100.0], [70.0, 0.0, -120.0], [0.0, 42.0, -200.0], [70.0, 56.0, -250.0]])
+SKEWED_TIBIA_MARKERS = np.array([[0.0, 0.0, -100.0], [42.0, 0.0, -150.0], [7.0, 49.0, -200.0], [63.0, 70.0, -250.0]])
+# Joint centers, the hip in the root frame and the knee in the femur frame
+HIP = np.array([80.0, 0.0, -80.0])
+KNEE = np.array([0.0, 0.0, -400.0])
+
+
+def generate(file_path, frames=500, rate=100, device_rate=1000, force_plates=2, emgs=2, imus=2, accels=1,
+             gaps=None, random_gaps=0, max_gap=10, noise=0.0, subject="Sub", seed=0, root_markers=ROOT_MARKERS,
+             femur_markers=FEMUR_MARKERS, tibia_markers=TIBIA_MARKERS):
+    """
+    Write a synthetic Vicon CSV file of a right leg walking forward. The root, femur and tibia are each a cluster of
+    four markers moving as a rigid body: the femur swings about a ball joint at the hip and the tibia bends about a
+    hinge at the knee, so the joint centers are known.
+    :param file_path: path of the CSV file to write
+    :param frames: number of frames of the markers
+    :param rate: rate of the markers in Hz
+    :param device_rate: rate of the devices in Hz, a multiple of rate
+    :param force_plates: number of force plates
+    :param emgs: number of EMG sensors, each has an IMU EMG and a Trigno EMG channel
+    :param imus: number of IMUs
+    :param accels: number of accelerometers
+    :param gaps: (marker, first frame, number of frames) of each gap to leave in the markers, ex: [("Root1", 100, 10)]
+    :param random_gaps: number of gaps to leave at random frames of random markers
+    :param max_gap: longest random gap
+    :param noise: standard deviation of the noise added to the markers in mm
+    :param subject: prefix of the marker and model output names
+    :param seed: seed of the random numbers
+    :param root_markers: markers of the root in its own frame, in mm, ex: SKEWED_ROOT_MARKERS
+    :param femur_markers: markers of the femur in its own frame, in mm
+    :param tibia_markers: markers of the tibia in its own frame, in mm
+    :return: the true positions, "markers" {name: [frame, axis]}, and "joints" {"hip": [frame, axis], "knee": ...}
+             along with the axis of the knee "knee_axis" [frame, axis]
+    :rtype: dict
+    """
+    samples_per_frame = device_rate // rate
+    if samples_per_frame * rate != device_rate:
+        raise ValueError("The device rate must be a multiple of the marker rate!")
+    rng = np.random.RandomState(seed)
+
+    t = np.arange(frames) / float(rate)
+    root_rotation = _rotation(2, 0.2 * np.sin(np.pi * t))
+    root_position = np.column_stack((100.0 * t, np.zeros(frames), np.full(frames, 900.0)))
+    femur_rotation = np.einsum("nij,njk,nkl->nil", root_rotation, _rotation(1, 0.5 * np.sin(2 * np.pi * t)),
+                               _rotation(0, 0.3 * np.sin(1.4 * np.pi * t)))
+    tibia_rotation = np.einsum("nij,njk->nik", femur_rotation, _rotation(1, -0.6 * (1 + np.sin(2 * np.pi * t))))
+
+    hip = root_position + np.einsum("nij,j->ni", root_rotation, HIP)
+    knee = hip + np.einsum("nij,j->ni", femur_rotation, KNEE)
+    bodies = [("Root", root_rotation, root_position, root_markers),
+              ("R_Femur", femur_rotation, hip, femur_markers),
+              ("R_Tibia", tibia_rotation, knee, tibia_markers)]
+    markers = {}
+    for name, rotation, origin, local in bodies:
+        positions = origin[:, np.newaxis, :] + np.einsum("nij,mj->nmi", rotation, local)
+        for index in range(len(local)):
+            markers[name + str(index + 1)] = positions[:, index, :]
+    truth = {"markers": dict((name, value.copy()) for name, value in markers.items()),
+             "joints": {"hip": hip, "knee": knee}, "knee_axis": femur_rotation[:, :, 1]}
+
+    if noise > 0:
+        for name in markers:
+            markers[name] = markers[name] + rng.normal(0, noise, markers[name].shape)
+    gaps = list(gaps) if gaps is not None else []
+    names = sorted(markers)
+    for _ in range(random_gaps):
+        length = rng.randint(1, max_gap + 1)
+        gaps.append((names[rng.randint(len(names))], rng.randint(1, max(frames - length, 2)), length))
+    for name, start, length in gaps:
+        markers[name][start:start + length] = np.nan
+
+    with open(file_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        _write_devices(f, writer, frames * samples_per_frame, samples_per_frame, device_rate, force_plates, emgs,
+                       imus, accels, rng)
+        _write_model_outputs(f, writer, t, rate, subject)
+        columns = [(subject + ":" + name, "XYZ", "mm", markers[name]) for name in names]
+        _write_section(f, writer, "Trajectories", rate, columns, 1)
+    return truth
+
+
+def _rotation(axis, angles):
+    """
+    Rotations about an axis
+    :param axis: 0, 1 or 2 for x, y or z
+    :param angles: angle of each rotation in radians
+    :return: rotation matrices indexed by [rotation, row, column]
+    """
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+    i, j = [index for index in range(3) if index != axis]
+    rotation = np.zeros((len(angles), 3, 3))
+    rotation[:, axis, axis] = 1
+    rotation[:, i, i] = cos
+    rotation[:, j, j] = cos
+    rotation[:, i, j] = -sin if axis != 1 else sin
+    rotation[:, j, i] = sin if axis != 1 else -sin
+    return rotation
+
+
+def _write_devices(f, writer, samples, samples_per_frame, device_rate, force_plates, emgs, imus, accels, rng):
+    t = np.arange(samples) / float(device_rate)
+    columns = []
+    for plate in range(1, force_plates + 1):
+        # each plate is loaded for the first half of every step, the plates take turns
+        phase = np.sin(np.pi * t + np.pi * (plate - 1) / 2.0)
+        stance = np.maximum(phase, 0)
+        name = "Imported AMTI OR6 Series Force Plate #" + str(plate) + " - "
+        force = np.column_stack((20 * stance * np.cos(np.pi * t), 5 * stance, -700 * stance))
+        moment = np.column_stack((np.zeros(samples), np.zeros(samples), 10 * stance))
+        CoP = np.column_stack((np.full(samples, 500.0 * plate), 100 * phase, np.zeros(samples)))
+        columns += [(name + "Force", ("Fx", "Fy", "Fz"), "N", force),
+                    (name + "Moment", ("Mx", "My", "Mz"), "N.mm", moment),
+                    (name + "CoP", ("Cx", "Cy", "Cz"), "mm", CoP)]
+    for sensor in range(1, emgs + 1):
+        burst = 1 + 4 * np.maximum(np.sin(np.pi * t + sensor), 0)
+        columns.append(("Imported Delsys Trigno IMU EMG 2.0 #1 - Sensor " + str(sensor), ("IM EMG" + str(sensor),),
+                        "V", (rng.normal(0, 1e-5, samples) * burst)[:, np.newaxis]))
+        columns.append(("Imported Trigno EMG #1 - Sensor " + str(sensor), ("EMG" + str(sensor),), "V",
+                        (rng.normal(0, 1e-5, samples) * burst)[:, np.newaxis]))
+    for sensor in range(1, imus + 1):
+        accel = np.column_stack((0.2 * np.sin(2 * np.pi * t), 0.1 * np.cos(2 * np.pi * t), np.ones(samples)))
+        gyro = np.column_stack((30 * np.sin(2 * np.pi * t + sensor), np.zeros(samples), 10 * np.cos(np.pi * t)))
+        columns.append(("Delsys Trigno IMU AUX 2.0 #1 - Sensor " + str(sensor),
+                        [axis + str(sensor) for axis in ("ACCX", "ACCY", "ACCZ", "GYROX", "GYROY", "GYROZ")],
+                        ["g"] * 3 + ["deg/s"] * 3, np.column_stack((accel, gyro))))
+    for sensor in range(1, accels + 1):
+        accel = np.column_stack((0.2 * np.sin(2 * np.pi * t), np.zeros(samples), np.ones(samples)))
+        columns.append(("Accelerometers #1 - Sensor " + str(sensor),
+                        [axis + str(sensor) for axis in ("ACCX", "ACCY", "ACCZ")], "g", accel))
+    _write_section(f, writer, "Devices", device_rate, columns, samples_per_frame)
+
+
+def _write_model_outputs(f, writer, t, rate, subject):
+    columns = []
+    for side, sign in (("L", -1), ("R", 1)):
+        for joint, amplitude in (("Hip", 30.0), ("Knee", 60.0), ("Ankle", 20.0)):
+            angles = np.column_stack((sign * amplitude * np.sin(2 * np.pi * t), 5 * np.cos(2 * np.pi * t),
+                                      np.full(len(t), 2.0)))
+            columns.append((subject + ":" + side + joint + "Angles", "XYZ", "deg", angles))
+    _write_section(f, writer, "Model Outputs", rate, columns, 1)
+
+
+def _write_section(f, writer, category, rate, columns, samples_per_frame):
+    """
+    Write a section of the CSV file
+    :param columns: (subject, axis names, units, values [sample, axis]) of each subject
+    :param samples_per_frame: number of samples in each frame
+    """
+    names = ["", ""]
+    axes = ["Frame", "Sub Frame"]
+    units = ["", ""]
+    for subject, subject_axes, subject_units, values in columns:
+        names += [subject] + [""] * (values.shape[1] - 1)
+        axes += list(subject_axes)
+        units += list(subject_units) if not isinstance(subject_units, str) else [subject_units] * values.shape[1]
+    writer.writerows([[category], [rate], names, axes, units])
+
+    values = np.column_stack([column[3] for column in columns])
+    text = np.char.mod("%.6f", values)
+    text[np.isnan(values)] = ""
+    index = np.arange(len(values))
+    frames = np.char.mod("%d", index // samples_per_frame + 1)
+    sub_frames = np.char.mod("%d", index % samples_per_frame)
+    rows = np.column_stack((frames, sub_frames, text))
+    f.writelines(",".join(row) + "\r\n" for row in rows)
+    writer.writerow([])
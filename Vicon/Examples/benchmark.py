@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+"""
+Benchmark of reading and processing Vicon trials at several sizes, on synthetic trials from Synthetic.generate.
+Every stage is timed, then run again to measure its peak memory, and the calculated hip and knee joint centers are checked
+against the known centers. tests/test_benchmark.py runs the same checks under pytest.
+
+    python -m Vicon.Examples.benchmark --frames 500 2000 8000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from Vicon.Examples import Synthetic
+from Vicon.Interpolation import Akmia
+from Vicon.Mocap.Catalog import scan_sections
+from Vicon.Mocap.Vicon import Vicon
+
+# Largest error of the hip joint center in mm
+HIP_TOLERANCE = 5.0
+# Largest error of the knee joint center in mm
+KNEE_TOLERANCE = 5.0
+
+# Marker layouts of the synthetic trials. The orthonormal clusters give orthonormal frames and a knee center that is
+# known along its axis. The skewed clusters are placed the way they often are on a subject, the hip must still be
+# within HIP_TOLERANCE with them (it is 2.5 to 3.3 mm off), but the hinge solver assumes orthonormal frames, so there
+# the knee is more than 100 mm from its axis and only its distance from the axis is reported.
+LAYOUTS = {"orthonormal": {},
+           "skewed": {"root_markers": Synthetic.SKEWED_ROOT_MARKERS, "femur_markers": Synthetic.SKEWED_FEMUR_MARKERS,
+                      "tibia_markers": Synthetic.SKEWED_TIBIA_MARKERS}}
+
+
+def measure(results, name, function, memory=False):
+    """
+    Run a stage, recording its wall time and CPU time, or its peak memory
+    :param results: dictionary the measurements of the stage are added to
+    :param name: name of the stage
+    :param function: the stage
+    :param memory: measure the peak memory in MB instead of the time, as tracing memory slows the stage down
+    :return: what the stage returns
+    """
+    if memory:
+        tracemalloc.start()
+        value = function()
+        results[name] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        return value
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    value = function()
+    results[name] = (time.perf_counter() - wall, time.process_time() - cpu)
+    return value
+
+
+def run_stages(file_path, memory=False):
+    """
+    Run every stage on a trial
+    :param file_path: path of the trial
+    :param memory: measure the peak memory of the stages instead of their time
+    :return: the measurements of each stage, and the markers with the hip and knee joints
+    :rtype: dict, Markers.Markers
+    """
+    results = {}
+    section = scan_sections(file_path)["Trajectories"]
+    trajectories = {}
+    for (subject, field), values in zip(section["fields"], section["data"].T):
+        trajectories.setdefault(subject, {})[field] = {"data": values.tolist()}
+
+    vicon = measure(results, "open_file", lambda: Vicon(file_path), memory)
+    measure(results, "interpolation", lambda: Akmia.Akmia(trajectories).interpolate(False), memory)
+    markers = measure(results, "make_markers", vicon.get_markers, memory)
+    measure(results, "smart_sort", lambda: markers.smart_sort(filter=False), memory)
+    measure(results, "auto_make_frames", markers.auto_make_frames, memory)
+    markers.def_joint("hip", "Root", "R_Femur", True)
+    markers.def_joint("knee", "R_Femur", "R_Tibia", False)
+    measure(results, "calc_joints", lambda: markers.calc_joints(try_load=False), memory)
+    measure(results, "save", lambda: vicon.save(file_path[:-4] + "_saved.csv"), memory)
+    return results, markers
+
+
+def run(directory, frames, memory=True, layout="orthonormal"):
+    """
+    Benchmark one trial size
+    :param directory: directory to write the trial in
+    :param frames: number of frames of the trial
+    :param memory: also measure the peak memory of every stage, in a second run
+    :param layout: marker layout of the trial, a key of LAYOUTS
+    :return: the (name, wall time, CPU time, peak memory in MB) of each stage, and the largest errors of the
+             hip and knee joint centers in mm. With the skewed layout the knee error is its distance from the axis.
+    :rtype: list, float, float
+    """
+    file_path = os.path.join(directory, "trial_" + layout + "_" + str(frames) + ".csv")
+    truth = Synthetic.generate(file_path, frames, random_gaps=frames // 100, max_gap=10, seed=frames,
+                               **LAYOUTS[layout])
+    times, markers = run_stages(file_path)
+    peaks = run_stages(file_path, memory=True)[0] if memory else {}
+    results = [(name, wall, cpu, peaks.get(name, np.nan)) for name, (wall, cpu) in times.items()]
+
+    # Without the filter the markers are the first frames of the trial
+    hip = np.asarray(markers.get_joint("hip"), dtype=np.float64)
+    hip_error = np.linalg.norm(hip - truth["joints"]["hip"][:len(hip)], axis=1).max()
+    # The orthonormal markers are symmetric about the knee, so its center is known along the axis too
+    knee = np.asarray(markers.get_joint("knee"), dtype=np.float64) - truth["joints"]["knee"][:len(hip)]
+    if layout != "orthonormal":
+        axis = truth["knee_axis"][:len(hip)]
+        knee = knee - np.sum(knee * axis, axis=1)[:, np.newaxis] * axis
+    knee_error = np.linalg.norm(knee, axis=1).max()
+    return results, hip_error, knee_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, nargs="+", default=[500, 2000, 8000], help="sizes of the trials")
+    parser.add_argument("--directory", default=None, help="where to write the trials, a temporary directory if unset")
+    parser.add_argument("--no-memory", action="store_true", help="do not run the stages again to measure memory")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="orthonormal", help="marker layout of the trials")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix="vicon_benchmark_")
+    passed = True
+    try:
+        for frames in args.frames:
+            results, hip_error, knee_error = run(directory, frames, not args.no_memory, args.layout)
+            print("\n" + str(frames) + " frames")
+            print("%-30s %10s %10s %12s" % ("stage", "wall (s)", "cpu (s)", "peak (MB)"))
+            for name, wall, cpu, peak in results:
+                print("%-30s %10.3f %10.3f %12.1f" % (name, wall, cpu, peak))
+            hip_ok = hip_error < HIP_TOLERANCE
+            if args.layout == "orthonormal":
+                knee_ok = knee_error < KNEE_TOLERANCE
+                knee = "knee center error %.2f mm (%s)" % (knee_error, "pass" if knee_ok else "FAIL")
+            else:
+                knee_ok = True
+                knee = "knee distance from axis %.2f mm (not checked, see LAYOUTS)" % knee_error
+            passed = passed and hip_ok and knee_ok
+            print("hip center error %.2f mm (%s), %s" % (hip_error, "pass" if hip_ok else "FAIL", knee))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+    if not passed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,35 @@ def akmia(sub_value, verbose, category, sub_key, key ):
     return s.to_list()
 
 
+def akmia_chunks(values, size=100000, overlap=3, verbose=False, category="", sub_key="", key=""):
+    """
+    Akima interpolation of a long field in place, a chunk at a time, ex: a field of a memory mapped store.
+    Each chunk is widened to take in overlap valid samples past both of its edges, so a gap that crosses an
+    edge is filled the same as when the whole field is interpolated at once.
+    :param values: the field, it is changed in place
+    :param size: number of samples in each chunk
+    :param overlap: valid samples to take in past each edge, Akima needs at least 3
+    :return: None
+    """
+    nans = np.isnan(values)
+    valid = np.flatnonzero(~nans)
+    if len(valid) == 0:
+        return
+    for start in range(0, len(values), size):
+        stop = min(start + size, len(values))
+        if not nans[start:stop].any():
+            continue
+        before = np.searchsorted(valid, start)
+        after = np.searchsorted(valid, stop)
+        first = valid[before - overlap] if before >= overlap else 0
+        last = valid[after + overlap - 1] + 1 if after + overlap - 1 < len(valid) else len(values)
+        # the samples filled by the chunks before this one are still gaps to this one
+        piece = np.array(values[first:last], dtype=np.float64)
+        piece[nans[first:last]] = np.nan
+        filled = akmia({"data": piece}, verbose, category, sub_key, key)
+        values[start:stop] = filled[start - first:stop - first]
+
+
 if __name__ == '__main__':
 
     data = np.array([ 56, 36, np.nan,np.nan,np.nan,np.nan,np.nan,np.nan, 36, np.nan ])
@@ -55,8 +55,51 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from pathlib import Path
 import csv, os
+import builtins
+import re
+import fnmatch
+import hashlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import matplotlib.animation as animation
+from . import Render
+from . import Spatial
+from ..Mocap import Storage
+
+
+class PointView(object):
+    """
+    The positions of a marker as a sequence of Points. The positions are not copied, each Point is made when it is
+    asked for and holds python floats, so the math done on it stays in double precision.
+    """
+
+    def __init__(self, positions):
+        """
+        :param positions: array indexed by [frame, axis]
+        """
+        self._positions = positions
+
+    @property
+    def positions(self):
+        """
+        :return: the positions indexed by [frame, axis]
+        :rtype: np.array
+        """
+        return self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PointView(self._positions[index])
+        x, y, z = self._positions[index].tolist()
+        return core.Point.Point(x, y, z)
+
+    def __iter__(self):
+        for x, y, z in self._positions.tolist():
+            yield core.Point.Point(x, y, z)
 
 
 class Markers(object):
@@ -64,24 +107,48 @@ class Markers(object):
     Creates an object to hold marker values
     """
 
-    def __init__(self, marker_dict, dat_name):
+    # pickled by Storage.reduce, which keeps the views into the trajectories
+    _share_views = True
+    # rebuilt when they are used, rather than pickled
+    _caches = ("_spatial_indexes",)
+
+    def __init__(self, marker_dict, dat_name, dtype=None, chunk_size=None):
         """
 
         :param marker_dict: dict of markers
+        :param dtype: type to store the raw and filtered positions as, ex: np.float32, defaults to np.float64
+        :param chunk_size: number of frames filtered at a time, None filters each marker at once
         """
         self._data_dict = marker_dict
+        self._dtype = np.float64 if dtype is None else dtype
+        self._chunk_size = chunk_size
         self._raw_markers = {}
+        self._raw_positions = {}
         self._rigid_body = {}
+        self._rigid_body_markers = {}
         self._marker_names = []
         self._frames = {}
         self._filter_window = 10
         self._filtered_markers = {}
+        self._filtered_positions = {}
         self._joints = {}
         self._joints_rel = {}
         self._joints_rel_child = {}
         self._balljoints_def = {}
         self._hingejoints_def = {}
         self._dat_name = dat_name
+        self._spatial_indexes = {}
+
+    def __reduce_ex__(self, protocol):
+        return Storage.reduce(self, protocol)
+
+    def share(self):
+        """
+        Copy the arrays of the markers into shared memory, so worker processes can attach to them without copying
+        :return: handle to send to the workers, their markers are handle.attach()
+        :rtype: Storage.Shared
+        """
+        return Storage.share(self)
 
     @property
     def marker_names(self):
@@ -144,12 +211,12 @@ class Markers(object):
 
         # TODO need to ensure that the frame are being created correctly and fill in missing data with a flag
 
-        to_remove = [item for item in self._data_dict.keys() if "|" in item]
-        to_remove += [item for item in self._data_dict.keys() if "Trajectory Count" == item]
-        for rr in to_remove:
-            self._data_dict.pop(rr, None)
-
+        names = []
+        trajectories = []
         for key_name, value_name in self._data_dict.items():
+            # the trajectory counts are not markers, they are skipped rather than removed from the shared dict
+            if "|" in key_name or key_name == "Trajectory Count":
+                continue
             fixed_name = key_name[1 + key_name.find(":"):]
             self._marker_names.append(fixed_name)
             self._raw_markers[fixed_name] = []
@@ -162,21 +229,41 @@ class Markers(object):
             if "Magnitude( X )" in value_name.keys() or "Count" in value_name.keys():
                 continue
 
-            x_arr = value_name["X"]["data"]
-            y_arr = value_name["Y"]["data"]
-            z_arr = value_name["Z"]["data"]
-
-            # smooth the markers
-            x_filt = np.convolve(x_arr, np.ones((self._filter_window,)) / self._filter_window, mode='valid')
-            y_filt = np.convolve(y_arr, np.ones((self._filter_window,)) / self._filter_window, mode='valid')
-            z_filt = np.convolve(z_arr, np.ones((self._filter_window,)) / self._filter_window, mode='valid')
-
-            # save a copy of both the unfiltered and fitlered markers
-            for inx in range(len(x_filt)):
-                point = core.Point.Point(x_arr[inx], y_arr[inx], z_arr[inx])
-                self._raw_markers[fixed_name].append(point)
-                point = core.Point.Point(x_filt[inx], y_filt[inx], z_filt[inx])
-                self._filtered_markers[fixed_name].append(point)
+            # a view into the trajectories when they are stored as one array, see Storage.pack
+            names.append(fixed_name)
+            trajectories.append(Storage.stack((value_name["X"]["data"], value_name["Y"]["data"],
+                                               value_name["Z"]["data"])))
+
+        lengths = [builtins.max(len(positions) - self._filter_window + 1, 0) for positions in trajectories]
+        # the filtered markers share one array indexed by [frame, marker, axis], so a query of them is a view
+        block = None
+        if len(set(lengths)) == 1:
+            block = np.empty((lengths[0], len(trajectories), 3), dtype=self._dtype)
+
+        for index, (fixed_name, positions, frames) in enumerate(zip(names, trajectories, lengths)):
+            out = block[:, index] if block is not None else np.empty((frames, 3), dtype=self._dtype)
+            # smooth the markers, always in double precision, a chunk of frames at a time
+            filtered = Storage.map_chunks(self._smooth, positions, self._chunk_size or builtins.max(frames, 1),
+                                          after=self._filter_window - 1, length=frames, out=out)
+
+            # the raw markers are a view of the trajectories, only the filtered markers are a new array
+            raw = Storage.read_only(positions[:frames].astype(self._dtype, copy=False))
+            filtered = Storage.read_only(filtered)
+            self._raw_positions[fixed_name] = raw
+            self._filtered_positions[fixed_name] = filtered
+            self._raw_markers[fixed_name] = PointView(raw)
+            self._filtered_markers[fixed_name] = PointView(filtered)
+
+    def _smooth(self, positions):
+        """
+        moving average of the positions of a marker
+        :param positions: positions indexed by [frame, axis]
+        :return: the average of each window of frames that fits in the positions, indexed by [frame, axis]
+        :rtype: np.array
+        """
+        window = np.ones((self._filter_window,)) / self._filter_window
+        positions = np.asarray(positions, dtype=np.float64)
+        return np.column_stack([np.convolve(positions[:, axis], window, mode='valid') for axis in range(3)])
 
     def set_ground_plane(self, rigid_body, offset_height=14):
 
@@ -210,13 +297,16 @@ class Markers(object):
             markers_keys = [s for s in keys if name in s]
             markers_keys.sort()
             markers = []
+            valid_keys = []
             for marker in markers_keys:
                 if self._is_valid_marker(marker):
+                    valid_keys.append(marker)
                     if filter:
                         markers.append(self._filtered_markers[marker])
                     else:
                         markers.append(self._raw_markers[marker])
             self._rigid_body[name] = markers
+            self._rigid_body_markers[name] = (valid_keys, filter)
 
     def make_frame(self, _origin, _x, _y, _extra):
         """
@@ -290,25 +380,168 @@ class Markers(object):
         else:
             self._hingejoints_def[name] = [parentBody, childBody]
 
-    def calc_joints(self, try_load=True, verbose=False, strict=True):
+    def calc_joints(self, try_load=True, verbose=False, strict=True, workers=None, processes=True, cache_dir=None):
         """
-        Calculates all defined joints automatically
+        Calculates all defined joints automatically. Each joint is an array of positions indexed by [frame, axis],
+        and its positions relative to the parent and child are arrays of shape (3, 1).
+        :param try_load: without a cache_dir, read the joints from <file>-joints.csv if it exists. With a cache_dir,
+                         reuse the joints of the joint cache and write the joints that are calculated to it
+        :param strict: raise an error if a rigid body of a joint in <file>-joints.csv is not in this trial
+        :param workers: number of joints to calculate at the same time, None or 1 calculates them one after another
+        :param processes: use a pool of forked processes, the markers and frames are inherited by the workers rather
+                          than copied to them. With False a pool of threads is used, which does not make the joints
+                          any faster, as the math on the Points holds the GIL
+        :param cache_dir: directory of the joint cache, None for no cache. Its entries are keyed by the markers and
+                          frames of the rigid bodies of each joint, the filter window and the joint definition, so a
+                          joint is only reused if none of these have changed
         :return:
         """
 
-        if try_load and os.path.isfile(self._dat_name + "-joints.csv"):
+        if try_load and cache_dir is None and os.path.isfile(self._dat_name + "-joints.csv"):
             self.read_joints(verbose=verbose, strict=strict)
             if verbose:
                 print("Reading joints from file " + self._dat_name + "-joints.csv")
+            return
+
+        jobs = [(name, True, bodies) for name, bodies in self._balljoints_def.items()]
+        jobs += [(name, False, bodies) for name, bodies in self._hingejoints_def.items()]
+
+        keys = {}
+        results = []
+        if try_load and cache_dir is not None:
+            keys = {name: self._joint_key(ball, bodies[0], bodies[1]) for name, ball, bodies in jobs}
+            missing = []
+            for job in jobs:
+                loaded = self._load_cached_joint(cache_dir, job[0], keys[job[0]], job[2][0], verbose=verbose)
+                if loaded is None:
+                    missing.append(job)
+                else:
+                    if verbose:
+                        print("Reading joint " + job[0] + " from the joint cache")
+                    results.append((job[0], loaded))
+            jobs = missing
+
+        if verbose and len(jobs) > 0:
+            print("Manually calculating joints")
 
+        if workers is None or workers <= 1 or len(jobs) <= 1:
+            calculated = [(name, _calc_joint(self, ball, bodies[0], bodies[1])) for name, ball, bodies in jobs]
         else:
+            calculated = self._calc_joints_pool(jobs, workers, processes, verbose)
+
+        if try_load and cache_dir is not None:
+            for name, joint in calculated:
+                self._save_cached_joint(cache_dir, name, keys[name], joint, verbose=verbose)
+
+        for name, (joint, joint_rel, joint_rel_child) in results + calculated:
+            self._joints[name] = joint
+            self._joints_rel[name] = joint_rel
+            self._joints_rel_child[name] = joint_rel_child
+
+    def _joint_key(self, ball, parent, child):
+        """
+        Hash everything a joint calculation depends on
+        :param ball: True for a ball joint, False for a hinge joint
+        :param parent: name of the parent rigid body
+        :param child: name of the child rigid body
+        :return: hex digest identifying the joint result
+        """
+        key = hashlib.sha1()
+        key.update(repr((JOINT_CACHE_VERSION, ball, parent, child, self._filter_window)).encode())
+        for body in (parent, child):
+            key.update(np.ascontiguousarray(self.get_rigid_body_array(body), dtype=np.float64).tobytes())
+            if body in self._frames:
+                key.update(np.ascontiguousarray(self.get_frame(body), dtype=np.float64).tobytes())
+        return key.hexdigest()
+
+    def _load_cached_joint(self, directory, name, key, parent, verbose=False):
+        """
+        Memory map a joint from the joint cache, copy on write so changing it does not change the cache
+        :param directory: directory of the joint cache
+        :param name: name of the joint
+        :param key: key from _joint_key
+        :param parent: name of the parent rigid body, whose number of frames the joint must have
+        :return: joint, joint_rel, joint_rel_child or None if the joint is not cached or its entry can not be read,
+                 in which case it is calculated and written again
+        """
+        path = os.path.join(directory, name + "-" + key + ".npy")
+        if not os.path.isfile(path):
+            return None
+        # Row 0 is the joint relative to the parent, row 1 relative to the child, the rest are the positions
+        try:
+            data = np.load(path, mmap_mode="c")
+            valid = data.ndim == 2 and data.shape == (len(self.get_rigid_body(parent)[0]) + 2, 3)
+        except (OSError, ValueError, EOFError):
+            valid = False
+        if not valid:
             if verbose:
-                print("Manually calculating joints")
-            for name, bodies in self._balljoints_def.items():
-                (self._joints[name], self._joints_rel[name], self._joints_rel_child[name]) = self._calc_ball_joint(bodies[0], bodies[1])
+                print("WARNING: The joint cache entry " + path + " can not be read, calculating joint " + name)
+            return None
+        return _joint_arrays(data[2:], data[0], data[1])
 
-            for name, bodies in self._hingejoints_def.items():
-                (self._joints[name], self._joints_rel[name], self._joints_rel_child[name]) = self._calc_hinge_joint(bodies[0], bodies[1])
+    def _save_cached_joint(self, directory, name, key, joint, verbose=False):
+        """
+        Write a joint to the joint cache, replacing any out of date entry for the joint. The entry is written under a
+        temporary name first, so a calculation that is stopped never leaves a broken entry.
+        :param directory: directory of the joint cache
+        :param name: name of the joint
+        :param key: key from _joint_key
+        :param joint: joint, joint_rel, joint_rel_child
+        :return:
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        positions, joint_rel, joint_rel_child = joint
+        data = np.vstack((np.reshape(np.asarray(joint_rel, dtype=np.float64), (1, 3)),
+                          np.reshape(np.asarray(joint_rel_child, dtype=np.float64), (1, 3)),
+                          np.reshape(np.asarray(positions, dtype=np.float64), (-1, 3))))
+        path = os.path.join(directory, name + "-" + key + ".npy")
+        temp = path + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(temp, "wb") as f:
+                np.save(f, data)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        entry = re.compile(re.escape(name) + r"-[0-9a-f]{40}\.npy")
+        for old in os.listdir(directory):
+            if entry.fullmatch(old) and old != os.path.basename(path):
+                os.remove(os.path.join(directory, old))
+        if verbose:
+            print("Saved joint " + name + " to the joint cache")
+
+    def _calc_joints_pool(self, jobs, workers, processes, verbose=False):
+        """
+        Calculates the joints in a worker pool. Each joint only reads the markers and frames of its own
+        parent and child, so the joints can be calculated independently of each other.
+        :param jobs: list of (name, is ball joint, [parent, child])
+        :param workers: size of the pool
+        :param processes: use forked processes instead of threads
+        :return: list of (name, (joint, joint_rel, joint_rel_child)) in the order of jobs
+        """
+        # numpy's min is imported over the builtin one
+        workers = builtins.min(workers, len(jobs))
+
+        if processes and "fork" not in multiprocessing.get_all_start_methods():
+            if verbose:
+                print("Forked processes are not available on this platform, calculating joints with threads")
+            processes = False
+
+        if processes:
+            # Forked workers inherit the arguments of their initializer, so nothing but the names and results are
+            # pickled, and each pool only sees its own markers
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=_init_joint_worker, initargs=(self,)) as pool:
+                futures = [(name, pool.submit(_calc_joint, None, ball, bodies[0], bodies[1]))
+                           for name, ball, bodies in jobs]
+                return [(name, future.result()) for name, future in futures]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(name, pool.submit(_calc_joint, self, ball, bodies[0], bodies[1]))
+                       for name, ball, bodies in jobs]
+            return [(name, future.result()) for name, future in futures]
 
     def get_joint(self, name):
         """
@@ -380,6 +613,67 @@ class Markers(object):
 
         return self._rigid_body.keys()
 
+    def get_rigid_body_array(self, name):
+        """
+        Get the markers of a rigid body as an array
+        :param name: name of rigid body
+        :return: array of the marker positions indexed by [marker, frame, axis]
+        :rtype: np.array
+        """
+        if name in self._rigid_body_markers:
+            keys, filtered = self._rigid_body_markers[name]
+            positions = self._filtered_positions if filtered else self._raw_positions
+            if builtins.all(key in positions for key in keys):
+                return np.array([positions[key] for key in keys])
+
+        # The rigid body was set by hand, so fall back to the points
+        return np.array([points_to_matrix(marker) for marker in self.get_rigid_body(name)])
+
+    def query(self, names, start=0, end=None, filtered=True):
+        """
+        Get the positions of several markers over a window of frames as one array, ex: query("R_Femur*", 1200, 1800).
+        The array is a view when the markers are evenly spaced in the trial, like the markers of one rigid body.
+        :param names: marker name, rigid body name or glob pattern, or a list of them
+        :param start: first frame of the window
+        :param end: frame after the last frame of the window, None for the end of the trial
+        :param filtered: use the filtered markers, or the raw markers
+        :return: the names of the markers, and their positions indexed by [frame, marker, axis]
+        :rtype: list, np.array
+        """
+        positions = self._filtered_positions if filtered else self._raw_positions
+        keys = []
+        for name in [names] if isinstance(names, str) else names:
+            if name in self._rigid_body_markers:
+                keys.extend(self._rigid_body_markers[name][0])
+            else:
+                keys.extend(match_names(list(positions.keys()), name))
+        keys = list(dict.fromkeys(keys))
+        if len(keys) == 0:
+            raise ValueError("No markers to query")
+        missing = [key for key in keys if key not in positions]
+        if len(missing) > 0:
+            raise ValueError("No positions for markers " + ", ".join(missing))
+        return keys, Storage.gather([positions[key] for key in keys])[start:end]
+
+    def spatial_index(self, names="*", start=0, end=None, filtered=True, window=10000):
+        """
+        Get an index of the markers to find the markers near a point or near each other in every frame, ex:
+        spatial_index().close_pairs(10) finds the markers within 10 mm of each other. It is built once for the same
+        arguments, and its trees are built when they are used.
+        :param names: marker name, rigid body name or glob pattern, or a list of them, see query
+        :param start: first frame of the window
+        :param end: frame after the last frame of the window, None for the end of the trial
+        :param filtered: use the filtered markers, or the raw markers
+        :param window: number of frames in each tree
+        :return: the index, whose marker indices are of its names
+        :rtype: Spatial.SpatialIndex
+        """
+        key = (names if isinstance(names, str) else tuple(names), start, end, filtered, window)
+        if key not in self._spatial_indexes:
+            keys, positions = self.query(names, start, end, filtered)
+            self._spatial_indexes[key] = Spatial.SpatialIndex(keys, positions, window)
+        return self._spatial_indexes[key]
+
     def calc_joint_center(self, parent_name, child_name, start, end):
         """
         Calculate the joint center between two frames
@@ -486,125 +780,149 @@ class Markers(object):
                        [np.mean([joint_by_parent[n].x[1] for n in range(frames)])],
                        [np.mean([joint_by_parent[n].x[2] for n in range(frames)])]], joint_by_child
 
-    def play(self, joints=False, save=False, name="im", center=False, centerPoint=None, addlPoints=None, addlPointsMin=0):
+    def play(self, joints=False, save=False, name="im", center=False, centerPoint=None, addlPoints=None, addlPointsMin=0,
+             start=0, end=None, step=1, rate=100, fps=None):
         """
         play an animation of the markers
         :param joints: bool to display calculated joint centers
         :param save: bool to save the animation
         :param center: bool to keep the markers centered
+        :param centerPoint: name of the marker to center on
+        :param addlPoints: list of additional points to display, each indexed by [frame][axis]
+        :param addlPointsMin: first frame to show the additional points on
+        :param start: first frame to play
+        :param end: frame to stop playing at, None plays to the end
+        :param step: only play every step frames
+        :param rate: rate the markers were recorded at, in frames per second
+        :param fps: frames per second to play at, None plays in real time
         :return: name of file
         """
 
-        if center and centerPoint is None:
-            raise ValueError("Must specify the marker to center on!")
-
-        x_total = []
-        y_total = []
-        z_total = []
-        joints_points = []
-        addl_total = []
-        fps = 10  # Frame per sec
-        keys = self._filtered_markers.keys()
-        nfr = len(self._filtered_markers[list(keys)[0]])  # Number of frames
-        root0z0 = self._filtered_markers[centerPoint][0].z
-
-        for frame in range(nfr):
-            x = []
-            y = []
-            z = []
-            for key in keys:
-                if self._is_valid_marker(key):
-                    point = self._filtered_markers[key][frame]
-                    if not center:
-                        x += [point.x]
-                        y += [point.y]
-                        z += [point.z]
-                    else:
-                        root0 = self._filtered_markers[centerPoint][frame]
-                        x += [point.x - root0.x]
-                        y += [point.y - root0.y]
-                        z += [point.z - root0.z + root0z0]
-            if len(x) > 0:
-                x_total.append(x)
-                y_total.append(y)
-                z_total.append(z)
-            x = []
-            y = []
-            z = []
-            if joints:
-                for jointname, joint in self._joints.items():
-                    f = frame
-                    if frame >= len(joint):
-                        f = len(joint) - 1
-
-                    if not center:
-                        x.append(joint[frame][0])
-                        y.append(joint[frame][1])
-                        z.append(joint[frame][2])
-                    else:
-                        root0 = self._filtered_markers[centerPoint][frame]
-                        x.append(joint[frame][0] - root0.x)
-                        y.append(joint[frame][1] - root0.y)
-                        z.append(joint[frame][2] - root0.z + root0z0)
-                joints_points.append([x, y, z])
-
-            if addlPoints is not None:
-                x = []
-                y = []
-                z = []
-                for j_points in addlPoints:
-                    point = j_points[frame]
-                    if not center:
-                        x.append(point[0])
-                        y.append(point[1])
-                        z.append(point[2])
-                    else:
-                        root0 = self._filtered_markers[centerPoint][frame]
-                        x.append(point[0] - root0.x)
-                        y.append(point[1] - root0.y)
-                        z.append(point[2] - root0.z + root0z0)
-                addl_total.append([x, y, z])
-
-
+        playback = self._playback_frames(joints, center, centerPoint, addlPoints, addlPointsMin, start, end, step)
+        if fps is None:
+            fps = float(rate) / step
 
         self._fig = plt.figure()
         self._ax = self._fig.add_subplot(111, projection='3d')
         self._ax.set_autoscale_on(False)
+        self._ax.set_xlabel('X Label')
+        self._ax.set_ylabel('Y Label')
+        self._ax.set_zlabel('Z Label')
+        self._ax.set_xlim(-500, 500)
+        self._ax.set_ylim(-500, 500)
+        self._ax.set_zlim3d(0, 1250)
+
+        # Every frame only moves these artists, mplot3d has to reproject the whole axes on each draw so it can't blit
+        artists = []
+        for points, color in zip(playback, ('r', 'g', 'b')):
+            if points is not None:
+                artists.append((self._ax.scatter(points[0, :, 0], points[0, :, 1], points[0, :, 2], c=color, marker='o'),
+                                points))
 
         ani = animation.FuncAnimation(self._fig,
-                                      self.__animate, nfr,
-                                      fargs=(x_total, y_total, z_total, joints_points, addl_total, addlPointsMin),
-                                      interval=100 / fps)
+                                      self._update_playback, len(playback[0]),
+                                      fargs=(artists,),
+                                      interval=1000.0 / fps)
         if save:
             Writer = animation.writers['ffmpeg']
-            writer = Writer(fps=15, metadata=dict(artist='Me'), bitrate=1800)
+            writer = Writer(fps=fps, metadata=dict(artist='Me'), bitrate=1800)
             ani.save(name + '.mp4', writer=writer)
             plt.show()
         else:
             plt.show()
 
-    def __animate(self, frame, x, y, z, centers=None, addl=None, addl_min=0):
+    def export(self, name="im", joints=False, center=False, centerPoint=None, addlPoints=None, addlPointsMin=0,
+               start=0, end=None, step=1, rate=100, fps=None, workers=None, chunk_size=None, size=(6.4, 4.8), dpi=100,
+               images=False):
+        """
+        Render an animation of the markers to a video without showing it. The frames are rendered in chunks
+        by a pool of processes and joined afterwards.
+        :param name: name of the video without the extension, or the directory to write images to
+        :param joints: bool to display calculated joint centers
+        :param center: bool to keep the markers centered
+        :param centerPoint: name of the marker to center on
+        :param addlPoints: list of additional points to display, each indexed by [frame][axis]
+        :param addlPointsMin: first frame to show the additional points on
+        :param start: first frame to render
+        :param end: frame to stop rendering at, None renders to the end
+        :param step: only render every step frames
+        :param rate: rate the markers were recorded at, in frames per second
+        :param fps: frames per second of the video, None keeps it in real time
+        :param workers: number of processes to render with, defaults to the number of cores
+        :param chunk_size: number of frames each process renders at a time
+        :param size: size of each frame in inches
+        :param dpi: dots per inch of each frame
+        :param images: write a PNG image per frame instead of a video
+        :return: path of the video, or of the directory of images
         """
+        playback = self._playback_frames(joints, center, centerPoint, addlPoints, addlPointsMin, start, end, step)
+        if fps is None:
+            fps = float(rate) / step
+        return Render.export(playback, name, fps, workers=workers, chunk_size=chunk_size, size=size, dpi=dpi,
+                             images=images)
+
+    def _playback_frames(self, joints=False, center=False, centerPoint=None, addlPoints=None, addlPointsMin=0,
+                         start=0, end=None, step=1):
+        """
+        Precompute everything play needs to draw
+        :return: markers, joints and additional points, each indexed by [frame, point, axis]. joints and
+                 additional points are None if they are not shown
+        """
+        if center and centerPoint is None:
+            raise ValueError("Must specify the marker to center on!")
 
-        :param frame: interation frame
-        :param x:array of x data
-        :param y: array of y data
-        :param z: array of z data
-        :param centers:optioanl data
-        :return:
+        keys = [key for key in self._filtered_markers.keys() if len(self._filtered_markers[key]) > 0]
+        nfr = len(self._filtered_markers[keys[0]])  # Number of frames
+        frames = np.arange(nfr)[start:end:step]
+        if len(frames) == 0:
+            raise ValueError("No frames to play between " + str(start) + " and " + str(end) + "!")
+
+        positions = [self._marker_positions(key) for key in keys]
+        # Markers that are all zeros don't contain any data
+        markers = np.stack([p[frames] for p in positions if np.any(p != 0)], axis=1)
+
+        joints_points = None
+        if joints and len(self._joints) > 0:
+            joints_points = np.stack([np.asarray(joint)[np.minimum(frames, len(joint) - 1)]
+                                      for joint in self._joints.values()], axis=1)
+
+        addl_points = None
+        if addlPoints is not None and len(addlPoints) > 0:
+            addl_points = np.stack([np.asarray(points, dtype=np.float64)[frames] for points in addlPoints], axis=1)
+            addl_points[frames < addlPointsMin] = np.nan
+
+        if center:
+            root = self._marker_positions(centerPoint)
+            offset = root[frames]
+            offset[:, 2] -= root[0, 2]
+            offset = offset[:, np.newaxis, :]
+            markers = markers - offset
+            if joints_points is not None:
+                joints_points = joints_points - offset
+            if addl_points is not None:
+                addl_points = addl_points - offset
+
+        return markers, joints_points, addl_points
+
+    def _marker_positions(self, name):
+        """
+        :param name: name of the marker
+        :return: the filtered positions of the marker as an array indexed by [frame, axis]
         """
+        if name in self._filtered_positions and len(self._filtered_positions[name]) == len(self._filtered_markers[name]):
+            return self._filtered_positions[name]
+        return points_to_matrix(self._filtered_markers[name])
 
-        self._ax.clear()
-        self._ax.set_xlabel('X Label')
-        self._ax.set_ylabel('Y Label')
-        self._ax.set_zlabel('Z Label')
-        self._ax.axis([-500, 500, -500, 500])
-        self._ax.set_zlim3d(0, 1250)
-        self._ax.scatter(x[frame], y[frame], z[frame], c='r', marker='o')
-        if len(centers) > 0:
-            self._ax.scatter(centers[frame][0], centers[frame][1], centers[frame][2], c='g', marker='o')
-        if len(addl) > 0 and frame >= addl_min:
-            self._ax.scatter(addl[frame][0], addl[frame][1], addl[frame][2], c='b', marker='o')
+    def _update_playback(self, frame, artists):
+        """
+
+        :param frame: interation frame
+        :param artists: list of (scatter, points indexed by [frame, point, axis])
+        :return: the updated artists
+        """
+        for scatter, points in artists:
+            scatter._offsets3d = (points[frame, :, 0], points[frame, :, 1], points[frame, :, 2])
+        return [scatter for scatter, points in artists]
 
     def save_joints(self, verbose=False, jlim=None, doBall=True, doHinge=True):
         file_path = self._dat_name + "-joints.csv"
@@ -639,6 +957,13 @@ class Markers(object):
                         writer.writerow(timestep)
 
     def read_joints(self, filename=None, verbose=False, strict=False):
+        """
+        Read joints written by save_joints. Like calculated joints, each joint is an array of positions indexed by
+        [frame, axis], and its positions relative to the parent and child are arrays of shape (3, 1).
+        :param filename: CSV file to read, defaults to <file>-joints.csv next to the CSV file
+        :param strict: raise an error if a rigid body of a joint is not in this trial
+        :return:
+        """
         if filename is None:
             filename = self._dat_name + "-joints.csv"
 
@@ -667,10 +992,12 @@ class Markers(object):
                 next(reader)
                 self._joints_rel_child[name] = [[float(n)] for n in next(reader)]
 
-                self._joints[name] = []
+                joint = []
                 l = int(next(reader)[1])
                 for i in range(l):
-                    self._joints[name].append([float(n) for n in next(reader)])
+                    joint.append([float(n) for n in next(reader)])
+                self._joints[name], self._joints_rel[name], self._joints_rel_child[name] = \
+                    _joint_arrays(joint, self._joints_rel[name], self._joints_rel_child[name])
 
             while True:
                 try:
@@ -691,10 +1018,72 @@ class Markers(object):
                 next(reader)
                 self._joints_rel_child[name] = [[float(n)] for n in next(reader)]
 
-                self._joints[name] = []
+                joint = []
                 l = int(next(reader)[1])
                 for i in range(l):
-                    self._joints[name].append([float(n) for n in next(reader)])
+                    joint.append([float(n) for n in next(reader)])
+                self._joints[name], self._joints_rel[name], self._joints_rel_child[name] = \
+                    _joint_arrays(joint, self._joints_rel[name], self._joints_rel_child[name])
+
+
+# Bump when the joint calculations change so that old joint cache entries are not reused
+JOINT_CACHE_VERSION = 1
+
+# Markers object of this process when it is a forked joint worker, see Markers._calc_joints_pool. It is only set in
+# the workers, by _init_joint_worker
+_joint_source = None
+
+
+def match_names(names, pattern):
+    """
+    Find the names that a name or glob pattern matches
+    :param names: names to search, in order
+    :param pattern: a name, or a glob pattern like "R_Femur*"
+    :return: the names that match, in the order of names
+    :rtype: list
+    """
+    if pattern in names:
+        return [pattern]
+    matches = [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+    if len(matches) == 0:
+        raise ValueError("Nothing matches " + pattern)
+    return matches
+
+
+def _init_joint_worker(markers):
+    """
+    Initializer of the forked joint workers, keeps the Markers object the worker inherited from its pool
+    :param markers: Markers object of the pool
+    """
+    global _joint_source
+    _joint_source = markers
+
+
+def _calc_joint(markers, ball, parent, child):
+    """
+    Calculates a single joint, used by Markers.calc_joints
+    :param markers: Markers object, if None the object of this worker is used, see _init_joint_worker
+    :param ball: True for a ball joint, False for a hinge joint
+    :param parent: name of the parent rigid body
+    :param child: name of the child rigid body
+    :return: joint, joint relative to the parent, joint relative to the child
+    """
+    if markers is None:
+        markers = _joint_source
+    if ball:
+        return _joint_arrays(*markers._calc_ball_joint(parent, child))
+    return _joint_arrays(*markers._calc_hinge_joint(parent, child))
+
+
+def _joint_arrays(joint, joint_rel, joint_rel_child):
+    """
+    :return: the positions of a joint indexed by [frame, axis], and its positions relative to the parent and child
+             as arrays of shape (3, 1), without copying arrays that are already of these types
+    :rtype: np.array, np.array, np.array
+    """
+    return (np.asarray(joint, dtype=np.float64).reshape((-1, 3)),
+            np.array(joint_rel, dtype=np.float64).reshape((3, 1)),
+            np.array(joint_rel_child, dtype=np.float64).reshape((3, 1)))
 
 
 def avg(n):
@@ -857,7 +1246,7 @@ def avg_vector(markers):
     for marker in markers:
         vp = np.array((0.0, 0.0, 0.0))
         for point in marker:
-            vp = vp + np.array((point.x, point.y, point.z))
+            vp = vp + np.array((point.x, point.y, point.z), dtype=np.float64)
         vp /= len(marker)
         vp_norm.append(vp)
     return vp_norm
@@ -916,7 +1305,7 @@ def __calc_A(markers):
     for marker, vp_n in zip(markers, vp_norm):  # loop though each marker
         Ak = np.zeros((3, 3))
         for point in marker:  # go through is location of the marker
-            v = np.array((point.x, point.y, point.z))
+            v = np.array((point.x, point.y, point.z), dtype=np.float64)
             Ak = Ak + v.reshape((-1, 1)) * v
         Ak = (1.0 / len(marker)) * Ak - vp_n.reshape((-1, 1)) * vp_n
         A = A + Ak
@@ -939,9 +1328,10 @@ def __calc_b(markers):
         for point in marker:
             # v = np.array((point.x, point.y, point.z))
             # print np.dot(v.reshape((-1,1)),v.reshape((-1,1)))
-            v2 = (point.x * point.x + point.y * point.y + point.z * point.z)
+            x, y, z = float(point.x), float(point.y), float(point.z)
+            v2 = (x * x + y * y + z * z)
             v2_sum = v2_sum + invN * v2
-            v3_sum = v3_sum + invN * (v2 * np.array((point.x, point.y, point.z)))
+            v3_sum = v3_sum + invN * (v2 * np.array((x, y, z)))
         b = b + v3_sum - v2_sum * vp_norm[ii]
 
     return b.reshape((-1, 1))
@@ -1142,9 +1532,9 @@ def sphereFit(frames):
         spY.append(frame[1])
         spZ.append(frame[2])
 
-    spX = np.array(spX)
-    spY = np.array(spY)
-    spZ = np.array(spZ)
+    spX = np.array(spX, dtype=np.float64)
+    spY = np.array(spY, dtype=np.float64)
+    spZ = np.array(spZ, dtype=np.float64)
     A = np.zeros((len(spX), 4))
     A[:, 0] = spX * 2
     A[:, 1] = spY * 2
@@ -1168,6 +1558,8 @@ def points_to_matrix(points):
     :param points:
     :return:
     """
+    if isinstance(points, PointView):
+        return np.array(points.positions, dtype=np.float64)
 
     cloud = np.zeros((len(points), 3))
     for index, point in enumerate(points):
@@ -48,88 +48,111 @@ from GaitCore.Bio.Leg import Leg
 from GaitCore.Bio.Arm import Arm
 from GaitCore.Bio.Trunk import Trunk
 from GaitCore.Bio.Joint import Joint
+from ..Mocap import Storage
 
 class ModelOutput(object):
 
     def __init__(self, data):
-
+        """
+        Joints and limbs are only built the first time they are asked for
+        :param data: the Model Outputs category
+        """
         self.joint_names = ["Hip", "Knee", "Ankle", "Head", "Thorax", "Neck", "Shoulder", "Pelvis", "Spine", "Wrist", "Elbow"]
-        left_joints = {}
-        right_joints = {}
-
-        for side, joint in zip(("L", "R"), (left_joints, right_joints)):
-            for output in self.joint_names:
-                angle = None
-                power = None
-                moment = None
-                force = None
-                if side + output + "Angles" in data.keys():
-                    angle = core.PointArray.PointArray(data[side + output + "Angles"]["X"]["data"],
-                                       data[side + output + "Angles"]["Y"]["data"],
-                                       data[side + output + "Angles"]["Z"]["data"])
-                if side + output + "Force" in data.keys():
-                    force = core.PointArray.PointArray(data[side + output + "Force"]["X"]["data"],
-                                       data[side + output + "Force"]["Y"]["data"],
-                                       data[side + output + "Force"]["Z"]["data"])
-                if side + output + "Moment" in data.keys():
-                    moment = core.PointArray.PointArray(data[side + output + "Moment"]["X"]["data"],
-                                        data[side + output + "Moment"]["Y"]["data"],
-                                        data[side + output + "Moment"]["Z"]["data"])
-                if side + output + "Power" in data.keys():
-                    power = core.PointArray.PointArray(data[side + output + "Power"]["X"]["data"],
-                                       data[side + output + "Power"]["Y"]["data"],
-                                       data[side + output + "Power"]["Z"]["data"])
-
-                joint[output] = Joint(angle, moment, power, force)
-                #joint[output] = core.Newton.Newton(angle, force, moment, power)
-
-        self._left_leg = Leg(left_joints["Hip"], left_joints["Knee"], left_joints["Ankle"])
-        self._right_leg = Leg(right_joints["Hip"], right_joints["Knee"], right_joints["Ankle"])
-
-        self._left_arm = Arm(left_joints["Shoulder"], left_joints["Elbow"], left_joints["Wrist"])
-        self._right_arm = Arm(right_joints["Shoulder"], right_joints["Elbow"], right_joints["Wrist"])
-
-        self._left_trunk = Trunk(left_joints["Head"], left_joints["Spine"], left_joints["Thorax"], left_joints["Pelvis"])
-        self._right_trunk = Trunk(right_joints["Head"], right_joints["Spine"], right_joints["Thorax"], right_joints["Pelvis"] )
+        self.quantities = ["Angles", "Force", "Moment", "Power"]
+        self._data = data
+        self._arrays = {}
+        self._joints = {}
+        self._limbs = {}
+
+    def get_array(self, side, joint, quantity):
+        """
+        Get a model output as an array, without building any joints
+        :param side: "L" or "R"
+        :param joint: name of the joint, ex: "Knee"
+        :param quantity: "Angles", "Force", "Moment" or "Power"
+        :return: read only array indexed by [frame, axis], or None if the model has no such output
+        :rtype: np.array
+        """
+        key = side + joint + quantity
+        if key not in self._arrays:
+            if key not in self._data:
+                return None
+            output = self._data[key]
+            self._arrays[key] = Storage.stack((output["X"]["data"], output["Y"]["data"], output["Z"]["data"]))
+        return self._arrays[key]
+
+    def get_joint(self, side, joint):
+        """
+        Get the outputs of a joint
+        :param side: "L" or "R"
+        :param joint: name of the joint, ex: "Knee"
+        :return: joint
+        :rtype: Joint
+        """
+        if (side, joint) not in self._joints:
+            outputs = {}
+            for quantity in self.quantities:
+                key = side + joint + quantity
+                outputs[quantity] = None
+                if key in self._data:
+                    outputs[quantity] = core.PointArray.PointArray(self._data[key]["X"]["data"],
+                                                                   self._data[key]["Y"]["data"],
+                                                                   self._data[key]["Z"]["data"])
+            self._joints[(side, joint)] = Joint(outputs["Angles"], outputs["Moment"], outputs["Power"],
+                                                outputs["Force"])
+        return self._joints[(side, joint)]
+
+    def _get_limb(self, name, side, limb, joints):
+        """
+        Build a limb the first time it is asked for
+        :param name: name to cache the limb under
+        :param side: "L" or "R"
+        :param limb: class of the limb
+        :param joints: names of the joints the limb is made of, in the order the limb takes them
+        :return: limb
+        """
+        if name not in self._limbs:
+            self._limbs[name] = limb(*[self.get_joint(side, joint) for joint in joints])
+        return self._limbs[name]
 
     def get_right_leg(self):
         """
 
         :return:
         """
-        return self._right_leg
+        return self._get_limb("right_leg", "R", Leg, ("Hip", "Knee", "Ankle"))
 
     def get_left_leg(self):
         """
 
         :return:
         """
-        return self._left_leg
+        return self._get_limb("left_leg", "L", Leg, ("Hip", "Knee", "Ankle"))
 
     def get_right_arm(self):
         """
 
         :return:
         """
-        return self._right_arm
+        return self._get_limb("right_arm", "R", Arm, ("Shoulder", "Elbow", "Wrist"))
 
     def get_left_arm(self):
         """
 
         :return:
         """
-        return self._left_arm
+        return self._get_limb("left_arm", "L", Arm, ("Shoulder", "Elbow", "Wrist"))
 
     def get_right_trunk(self):
         """
 
         :return:
         """
-        return self._right_trunk
+        return self._get_limb("right_trunk", "R", Trunk, ("Head", "Spine", "Thorax", "Pelvis"))
 
     def get_left_trunk(self):
         """
 
         :return:
         """
-        return self._left_trunk
\ No newline at end of file
+        return self._get_limb("left_trunk", "L", Trunk, ("Head", "Spine", "Thorax", "Pelvis"))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+# registers the 3d projection on older versions of matplotlib
+from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
+
+
+def export(playback, name, fps, workers=None, chunk_size=None, size=(6.4, 4.8), dpi=100, images=False):
+    """
+    Render frames of marker data to a video or an image sequence without a display.
+    The frames are split into chunks, and each chunk is rendered in its own process with the Agg backend.
+    :param playback: markers, joints and additional points from Markers._playback_frames
+    :param name: name of the video without the extension, or of the directory for the image sequence
+    :param fps: frames per second of the video
+    :param workers: number of processes to render with, defaults to the number of cores
+    :param chunk_size: number of frames to render per chunk, defaults to splitting the frames evenly between the workers
+    :param size: size of each frame in inches
+    :param dpi: dots per inch, together with size this sets the resolution
+    :param images: write a PNG per frame into the directory name instead of a video
+    :return: path of the video or of the image directory
+    """
+    markers, joints, addl = playback
+    nfr = len(markers)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = int(np.ceil(nfr / float(workers)))
+    chunk_size = max(chunk_size, 1)
+
+    # Videos need an even number of pixels in both directions
+    width = 2 * int(round(size[0] * dpi / 2.0))
+    height = 2 * int(round(size[1] * dpi / 2.0))
+    size = (width / float(dpi), height / float(dpi))
+
+    if images:
+        directory = name
+    else:
+        ffmpeg = matplotlib.rcParams['animation.ffmpeg_path']
+        if shutil.which(ffmpeg) is None:
+            raise RuntimeError("Can't find ffmpeg at " + str(ffmpeg) + " to write " + name + ".mp4, install it, set "
+                               "matplotlib.rcParams['animation.ffmpeg_path'] or export images instead")
+        # a directory of its own, so nothing that was already next to the video is removed with the chunks
+        directory = tempfile.mkdtemp(prefix=os.path.basename(name) + "-chunks-", dir=os.path.dirname(name) or ".")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    chunks = []
+    for index, first in enumerate(range(0, nfr, chunk_size)):
+        last = min(first + chunk_size, nfr)
+        if images:
+            output = os.path.join(directory, "frame_%06d.png")
+        else:
+            output = os.path.join(directory, "chunk_%06d.mp4" % index)
+        chunks.append((markers[first:last],
+                       None if joints is None else joints[first:last],
+                       None if addl is None else addl[first:last],
+                       first, output, fps, size, dpi))
+
+    if images:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            list(pool.map(_render_chunk, chunks))
+        return directory
+
+    # The chunks are only needed until they are joined, so don't leave them behind if rendering fails
+    path = name + ".mp4"
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            outputs = list(pool.map(_render_chunk, chunks))
+        if len(outputs) == 1:
+            shutil.move(outputs[0], path)
+        else:
+            _concat_videos(outputs, path, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return path
+
+
+def _make_figure(size, dpi):
+    """
+    make a figure that can be drawn without a display
+    :return: figure, canvas, axes
+    """
+    fig = Figure(figsize=size, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    ax.set_autoscale_on(False)
+    ax.set_xlabel('X Label')
+    ax.set_ylabel('Y Label')
+    ax.set_zlabel('Z Label')
+    ax.set_xlim(-500, 500)
+    ax.set_ylim(-500, 500)
+    ax.set_zlim3d(0, 1250)
+    return fig, canvas, ax
+
+
+def _render_chunk(chunk):
+    """
+    Render one chunk of frames, used by export
+    :param chunk: markers, joints, additional points, index of the first frame, output path, fps, size, dpi
+    :return: the output path of the chunk
+    """
+    markers, joints, addl, first, output, fps, size, dpi = chunk
+    fig, canvas, ax = _make_figure(size, dpi)
+
+    artists = []
+    for points, color in zip((markers, joints, addl), ('r', 'g', 'b')):
+        if points is not None:
+            artists.append((ax.scatter(points[0, :, 0], points[0, :, 1], points[0, :, 2], c=color, marker='o'), points))
+
+    video = None
+    if not output.endswith(".png"):
+        width, height = canvas.get_width_height()
+        video = subprocess.Popen([matplotlib.rcParams['animation.ffmpeg_path'], "-y", "-loglevel", "error",
+                                  "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "%dx%d" % (width, height),
+                                  "-r", str(fps), "-i", "-",
+                                  "-vcodec", "libx264", "-pix_fmt", "yuv420p", output],
+                                 stdin=subprocess.PIPE)
+
+    try:
+        for frame in range(len(markers)):
+            for scatter, points in artists:
+                scatter._offsets3d = (points[frame, :, 0], points[frame, :, 1], points[frame, :, 2])
+            if video is None:
+                fig.savefig(output % (first + frame), dpi=dpi)
+            else:
+                canvas.draw()
+                video.stdin.write(canvas.buffer_rgba())
+    finally:
+        if video is not None:
+            video.stdin.close()
+            video.wait()
+
+    if video is not None and video.returncode != 0:
+        raise RuntimeError("ffmpeg failed to write " + output)
+    return output
+
+
+def _concat_videos(chunks, path, directory):
+    """
+    Join the chunk videos into one video without re-encoding them
+    :param chunks: paths of the chunks, in order
+    :param path: path of the joined video
+    :param directory: directory to write the list of chunks to
+    """
+    listing = os.path.join(directory, "chunks.txt")
+    with open(listing, "w") as f:
+        for chunk in chunks:
+            f.write("file '" + os.path.abspath(chunk) + "'\n")
+    subprocess.check_call([matplotlib.rcParams['animation.ffmpeg_path'], "-y", "-loglevel", "error",
+                           "-f", "concat", "-safe", "0", "-i", listing, "-c", "copy", path])
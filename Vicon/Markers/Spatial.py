@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex(object):
+    """
+    Finds the markers near points, and near each other, in every frame of a trial at once.
+    The markers of a window of frames are put in one cKDTree, with the frame as a fourth coordinate whose frames are
+    further apart than any two markers, so a query only finds the markers of its own frame.
+    The trees are built when they are first used, and kept.
+    """
+
+    def __init__(self, names, positions, window=10000):
+        """
+        :param names: names of the markers
+        :param positions: positions of the markers indexed by [frame, marker, axis], ex: from Markers.query
+        :param window: number of frames in each tree
+        """
+        if window < 1:
+            raise ValueError("The window must be at least 1 frame")
+        self._names = list(names)
+        self._positions = positions
+        self._window = window
+        self._trees = {}
+
+    @property
+    def names(self):
+        """
+        :return: names of the markers, in the order of the marker indices the queries return
+        :rtype: list
+        """
+        return self._names
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _tree(self, number):
+        """
+        Build the tree of a window of frames, or get it if it is built
+        :param number: number of the window
+        :return: the tree, the marker of each point of the tree, the spacing of the frames, and the lowest and
+                 highest corners of the markers
+        """
+        if number not in self._trees:
+            start = number * self._window
+            positions = np.asarray(self._positions[start:start + self._window], dtype=np.float64)
+            frames, markers = np.nonzero(np.isfinite(positions).all(axis=2))
+            points = positions[frames, markers]
+            if len(points) > 0:
+                low, high = points.min(axis=0), points.max(axis=0)
+            else:
+                low, high = np.zeros(3), np.zeros(3)
+            # frames are further apart than the diagonal of the box around the markers
+            spacing = 2.0 * np.linalg.norm(high - low) + 1.0
+            tree = cKDTree(np.column_stack((points, frames * spacing)))
+            self._trees[number] = (tree, markers, spacing, low, high)
+        return self._trees[number]
+
+    def _windows(self):
+        for number, start in enumerate(range(0, len(self._positions), self._window)):
+            yield number, start, min(start + self._window, len(self._positions))
+
+    def _query(self, points, k, radius):
+        """
+        Find the k nearest markers closer than radius to a point in every frame
+        :param points: point of each frame, indexed by [frame, axis], or one point for every frame
+        :param k: number of markers to find
+        :param radius: largest distance, inclusive
+        :return: distances and marker indices indexed by [frame, neighbour], inf and -1 where there are not k markers
+        :rtype: np.array, np.array
+        """
+        points = np.broadcast_to(np.asarray(points, dtype=np.float64), (len(self._positions), 3))
+        distances = np.full((len(points), k), np.inf)
+        indices = np.full((len(points), k), -1, dtype=np.intp)
+        for number, start, stop in self._windows():
+            tree, markers, spacing, low, high = self._tree(number)
+            rows = start + np.nonzero(np.isfinite(points[start:stop]).all(axis=1))[0]
+            if tree.n == 0 or len(rows) == 0:
+                continue
+            query = points[rows]
+            bound = min(np.nextafter(radius, np.inf), spacing)
+            found_distances, found = tree.query(np.column_stack((query, (rows - start) * spacing)), k=k,
+                                                distance_upper_bound=bound)
+            found_distances = found_distances.reshape(len(rows), k)
+            found = found.reshape(len(rows), k)
+            hit = found < tree.n
+            distances[rows] = np.where(hit, found_distances, np.inf)
+            indices[rows] = np.where(hit, markers[np.minimum(found, tree.n - 1)], -1)
+
+            # the markers of a point so far away that the bound had to be the spacing are found by hand
+            if bound == spacing:
+                farthest = np.linalg.norm(np.maximum(np.abs(query - low), np.abs(query - high)), axis=1)
+                far = rows[farthest >= spacing]
+                if len(far) > 0:
+                    distances[far], indices[far] = self._brute(points[far], far, k, radius)
+        return distances, indices
+
+    def _brute(self, points, rows, k, radius):
+        """
+        Find the k nearest markers closer than radius to a point in some frames, by measuring the distance to every
+        marker
+        """
+        positions = np.asarray(self._positions[rows], dtype=np.float64)
+        every = np.linalg.norm(positions - points[:, np.newaxis, :], axis=2)
+        every[~(every <= radius)] = np.inf
+        order = np.argsort(every, axis=1, kind="stable")[:, :k]
+        distances = np.full((len(rows), k), np.inf)
+        indices = np.full((len(rows), k), -1, dtype=np.intp)
+        distances[:, :order.shape[1]] = np.take_along_axis(every, order, axis=1)
+        indices[:, :order.shape[1]] = np.where(np.isinf(distances[:, :order.shape[1]]), -1, order)
+        return distances, indices
+
+    def nearest(self, points, k=1):
+        """
+        Find the markers nearest to a point in every frame, ex: the marker closest to a joint center
+        :param points: point of each frame, indexed by [frame, axis], or one point for every frame
+        :param k: number of markers to find for each frame
+        :return: distances and marker indices indexed by [frame, neighbour], inf and -1 where a frame has less than k
+                 markers
+        :rtype: np.array, np.array
+        """
+        return self._query(points, k, np.inf)
+
+    def within(self, points, radius):
+        """
+        Find the markers within a distance of a point in every frame
+        :param points: point of each frame, indexed by [frame, axis], or one point for every frame
+        :param radius: distance from the point
+        :return: whether each marker is within the radius, indexed by [frame, marker]
+        :rtype: np.array
+        """
+        mask = np.zeros((len(self._positions), len(self._names)), dtype=bool)
+        if len(self._names) == 0:
+            return mask
+        distances, indices = self._query(points, len(self._names), radius)
+        rows, columns = np.nonzero(indices >= 0)
+        mask[rows, indices[rows, columns]] = True
+        return mask
+
+    def close_pairs(self, radius):
+        """
+        Find the pairs of markers within a distance of each other in every frame, ex: to find swapped or ghost markers
+        :param radius: distance between the markers
+        :return: the frame, the first and second marker indices, and the distance of each pair, ordered by frame
+        :rtype: np.array, np.array, np.array, np.array
+        """
+        frames, first, second = [], [], []
+        for number, start, stop in self._windows():
+            tree, markers, spacing, low, high = self._tree(number)
+            # no two markers of a frame are further apart than the diagonal, which is less than the spacing
+            pairs = tree.query_pairs(min(radius, np.linalg.norm(high - low)), output_type="ndarray")
+            frames.append(start + np.rint(tree.data[pairs[:, 0], 3] / spacing).astype(np.intp))
+            first.append(markers[pairs[:, 0]])
+            second.append(markers[pairs[:, 1]])
+        if len(frames) == 0:
+            return (np.empty(0, dtype=np.intp),) * 3 + (np.empty(0),)
+        frames, first, second = np.concatenate(frames), np.concatenate(first), np.concatenate(second)
+        first, second = np.minimum(first, second), np.maximum(first, second)
+        order = np.lexsort((second, first, frames))
+        frames, first, second = frames[order], first[order], second[order]
+        positions = self._positions
+        distances = np.linalg.norm(np.asarray(positions[frames, first], dtype=np.float64) -
+                                   np.asarray(positions[frames, second], dtype=np.float64), axis=1)
+        return frames, first, second, distances
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+import fnmatch
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+from ..Devices import Devices
+from .Vicon import fix_col_names, _header_fields, _longest_run, _parse_rate, _read_rows, _scan_sections, \
+    _section_chunks
+
+# Changing what is scanned from a trial makes the old trials be scanned again
+CATALOG_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, hash TEXT,
+                                   frames INTEGER, version INTEGER);
+CREATE TABLE IF NOT EXISTS subjects (trial INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS categories (trial INTEGER, category TEXT, rate REAL, samples INTEGER);
+CREATE TABLE IF NOT EXISTS fields (trial INTEGER, category TEXT, subject TEXT, field TEXT, unit TEXT, nans INTEGER,
+                                   max_gap INTEGER);
+CREATE TABLE IF NOT EXISTS devices (trial INTEGER, collection TEXT, number INTEGER);
+CREATE INDEX IF NOT EXISTS subjects_trial ON subjects (trial);
+CREATE INDEX IF NOT EXISTS categories_trial ON categories (trial, category);
+CREATE INDEX IF NOT EXISTS fields_trial ON fields (trial, category, subject);
+CREATE INDEX IF NOT EXISTS devices_trial ON devices (trial);
+"""
+
+
+class Catalog(object):
+
+    def __init__(self, path):
+        """
+        A SQLite catalog of Vicon CSV files, with the metadata and missing data of every trial,
+        so trials can be selected without opening them.
+        :param path: path of the database file, it is made if it does not exist
+        """
+        self._path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+
+    @property
+    def path(self):
+        return self._path
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def update(self, root, pattern="*.csv", verbose=False):
+        """
+        Add every CSV file under a directory to the catalog. Files whose modification time and size have not
+        changed are skipped, and files whose contents have not changed are not scanned again. Trials under root
+        whose files were deleted are removed.
+        :param root: directory to search
+        :param pattern: glob pattern of the file names
+        :param verbose: print the trials that are scanned
+        :return: number of trials that were scanned
+        :rtype: int
+        """
+        root = os.path.abspath(root)
+        found = set()
+        scanned = 0
+        for directory, _, files in os.walk(root):
+            for name in sorted(fnmatch.filter(files, pattern)):
+                file_path = os.path.join(directory, name)
+                found.add(file_path)
+                if self.add(file_path, verbose=verbose):
+                    scanned += 1
+
+        prefix = os.path.join(root, "")
+        for (file_path,) in self._connection.execute("SELECT path FROM trials").fetchall():
+            if file_path.startswith(prefix) and file_path not in found:
+                self.remove(file_path)
+                if verbose:
+                    print("Removed " + file_path)
+        self._connection.commit()
+        return scanned
+
+    def add(self, file_path, force=False, verbose=False):
+        """
+        Add a trial to the catalog, or update it if the file has changed
+        :param file_path: path of the CSV file
+        :param force: scan the file even if it has not changed
+        :param verbose: print the trial if it is scanned
+        :return: True if the file was scanned
+        :rtype: bool
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        row = self._connection.execute("SELECT id, mtime, size, hash, version FROM trials WHERE path = ?",
+                                       (file_path,)).fetchone()
+        current = row is not None and row[4] == CATALOG_VERSION and not force
+        if current and row[1] == stat.st_mtime and row[2] == stat.st_size:
+            return False
+
+        content_hash = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                content_hash.update(block)
+        content_hash = content_hash.hexdigest()
+        if current and row[3] == content_hash:
+            self._connection.execute("UPDATE trials SET mtime = ?, size = ? WHERE id = ?",
+                                     (stat.st_mtime, stat.st_size, row[0]))
+            self._connection.commit()
+            return False
+
+        if verbose:
+            print("Scanning " + file_path)
+        sections = scan_sections(file_path)
+        if row is not None:
+            self.remove(file_path)
+        self._insert(file_path, stat, content_hash, sections)
+        self._connection.commit()
+        return True
+
+    def remove(self, file_path):
+        """
+        Remove a trial from the catalog
+        :param file_path: path of the CSV file
+        :return: None
+        """
+        row = self._connection.execute("SELECT id FROM trials WHERE path = ?",
+                                       (os.path.abspath(file_path),)).fetchone()
+        if row is None:
+            return
+        for table in ("subjects", "categories", "fields", "devices"):
+            self._connection.execute("DELETE FROM " + table + " WHERE trial = ?", row)
+        self._connection.execute("DELETE FROM trials WHERE id = ?", row)
+
+    def trials(self):
+        """
+        :return: the path of every trial in the catalog
+        :rtype: list
+        """
+        return [row[0] for row in self._connection.execute("SELECT path FROM trials ORDER BY path")]
+
+    def get_trial(self, file_path):
+        """
+        Get the metadata of a trial
+        :param file_path: path of the CSV file
+        :return: dictionary with the hash, number of frames, subjects, categories ({category: (rate, samples)}),
+                 devices ({collection: [numbers]}) and fields ({category: {subject: {field: (unit, nans, max gap)}}})
+                 of the trial, or None if it is not in the catalog
+        :rtype: dict
+        """
+        row = self._connection.execute("SELECT id, hash, frames FROM trials WHERE path = ?",
+                                       (os.path.abspath(file_path),)).fetchone()
+        if row is None:
+            return None
+        trial = {"path": os.path.abspath(file_path), "hash": row[1], "frames": row[2], "subjects": [],
+                 "categories": {}, "devices": {}, "fields": {}}
+        for (name,) in self._connection.execute("SELECT name FROM subjects WHERE trial = ?", row[:1]):
+            trial["subjects"].append(name)
+        for category, rate, samples in self._connection.execute(
+                "SELECT category, rate, samples FROM categories WHERE trial = ?", row[:1]):
+            trial["categories"][category] = (rate, samples)
+        for collection, number in self._connection.execute(
+                "SELECT collection, number FROM devices WHERE trial = ? ORDER BY number", row[:1]):
+            trial["devices"].setdefault(collection, []).append(number)
+        for category, subject, field, unit, nans, max_gap in self._connection.execute(
+                "SELECT category, subject, field, unit, nans, max_gap FROM fields WHERE trial = ?", row[:1]):
+            trial["fields"].setdefault(category, {}).setdefault(subject, {})[field] = (unit, nans, max_gap)
+        return trial
+
+    def find(self, subject=None, markers=(), max_nans=None, max_gap=None, collections=(), path=None):
+        """
+        Find the trials that match every condition given
+        :param subject: name of the subject, the prefix of the marker names, ex: "subject_08"
+        :param markers: names or glob patterns of markers that must be in the trial, ex: ["R_Tibia*"]
+        :param max_nans: largest fraction of missing samples allowed in any field of the markers, or of every
+                         trajectory if no markers are given, ex: 0.02
+        :param max_gap: longest run of missing samples allowed in the same fields
+        :param collections: device collections the trial must have, ex: ["IMUs", "force_plates"]
+        :param path: glob pattern the path of the file must match
+        :return: paths of the trials
+        :rtype: list
+        """
+        conditions = []
+        params = []
+        if subject is not None:
+            conditions.append("EXISTS (SELECT 1 FROM subjects s WHERE s.trial = t.id AND s.name = ?)")
+            params.append(subject)
+        for marker in markers:
+            conditions.append("EXISTS (SELECT 1 FROM fields f WHERE f.trial = t.id AND "
+                              "f.category = 'Trajectories' AND f.subject GLOB ?)")
+            params.append(marker)
+        for collection in collections:
+            conditions.append("EXISTS (SELECT 1 FROM devices d WHERE d.trial = t.id AND d.collection = ?)")
+            params.append(collection)
+        if path is not None:
+            conditions.append("t.path GLOB ?")
+            params.append(path)
+
+        marker_filter = ""
+        if len(markers) > 0:
+            marker_filter = " AND (" + " OR ".join(["f.subject GLOB ?"] * len(markers)) + ")"
+        if max_nans is not None:
+            conditions.append("NOT EXISTS (SELECT 1 FROM fields f JOIN categories c ON c.trial = f.trial AND "
+                              "c.category = f.category WHERE f.trial = t.id AND f.category = 'Trajectories'" +
+                              marker_filter + " AND f.nans > ? * c.samples)")
+            params.extend(markers)
+            params.append(max_nans)
+        if max_gap is not None:
+            conditions.append("NOT EXISTS (SELECT 1 FROM fields f WHERE f.trial = t.id AND "
+                              "f.category = 'Trajectories'" + marker_filter + " AND f.max_gap > ?)")
+            params.extend(markers)
+            params.append(max_gap)
+
+        sql = "SELECT t.path FROM trials t"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        return [row[0] for row in self._connection.execute(sql + " ORDER BY t.path", params)]
+
+    def query(self, sql, params=()):
+        """
+        Run a query on the catalog. The tables are trials, subjects, categories, fields and devices.
+        :param sql: SQL query
+        :param params: parameters of the query
+        :return: the rows
+        :rtype: list
+        """
+        return self._connection.execute(sql, params).fetchall()
+
+    def _insert(self, file_path, stat, content_hash, sections):
+        frames = 0
+        for category, section in sections.items():
+            if category != "Devices":
+                frames = max(frames, len(section["data"]))
+        cursor = self._connection.execute(
+            "INSERT INTO trials (path, mtime, size, hash, frames, version) VALUES (?, ?, ?, ?, ?, ?)",
+            (file_path, stat.st_mtime, stat.st_size, content_hash, frames, CATALOG_VERSION))
+        trial = cursor.lastrowid
+
+        subjects = set()
+        for category, section in sections.items():
+            subjects.update(section["people"])
+            self._connection.execute("INSERT INTO categories VALUES (?, ?, ?, ?)",
+                                     (trial, category, section["rate"], len(section["data"])))
+            nans = np.isnan(section["data"])
+            self._connection.executemany("INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?, ?)", [
+                (trial, category, subject, field, unit, int(missing.sum()), _longest_run(missing))
+                for (subject, field), unit, missing in zip(section["fields"], section["units"], nans.T)])
+        self._connection.executemany("INSERT INTO subjects VALUES (?, ?)", [(trial, name) for name in sorted(subjects)])
+
+        if "Devices" in sections:
+            sensors = {}
+            for subject, field in sections["Devices"]["fields"]:
+                sensors.setdefault(subject, []).append(field)
+            for collection, groups in Devices.classify_subjects(sensors).items():
+                self._connection.executemany("INSERT INTO devices VALUES (?, ?, ?)",
+                                             [(trial, collection, number) for _, _, number, _ in groups])
+
+
+def scan_sections(file_path, chunk_size=100000):
+    """
+    Read every section of a Vicon CSV file into arrays. This is much faster than building a Vicon object,
+    as nothing is interpolated and no models are built. The sections, fields and values are found the same way
+    Vicon finds them when it converts a trial to a store.
+    :param file_path: path of the CSV file
+    :param chunk_size: number of rows parsed at a time
+    :return: for each category, a dictionary with the "rate", the (subject, field) of each column as "fields",
+             the "units", the "frames" and "sub_frames", the subject prefixes of the names as "people", and the
+             "data" indexed by [sample, column]. Missing values are nan.
+    :rtype: dict
+    """
+    sections = _scan_sections(file_path)
+    scanned = {}
+    for section in sections:
+        rate, names, axes, units = section["header"]
+        fields = _header_fields(fix_col_names(names), [''.join([i for i in axis if not i.isdigit()]) for axis in axes],
+                                units)
+        people = sorted(set(name[:name.index(":")] for name in names[2:len(axes)] if ":" in name))
+        scanned[section["category"]] = {"rate": _parse_rate(rate),
+                                        "fields": [(subject, field) for subject, field, _, _ in fields],
+                                        "units": [unit for _, _, _, unit in fields],
+                                        "columns": [column for _, _, column, _ in fields],
+                                        "frames": np.zeros(section["rows"], dtype=np.int64),
+                                        "sub_frames": np.zeros(section["rows"], dtype=np.int64),
+                                        "people": people,
+                                        "data": np.empty((section["rows"], len(fields)))}
+
+    with open(file_path, newline="") as f:
+        for section, (position, lines) in _section_chunks(f, sections, chunk_size):
+            found = scanned[section["category"]]
+            rows = _read_rows(lines, section["header"])
+            stop = position + len(rows)
+            found["data"][position:stop] = rows[:, found["columns"]]
+            found["frames"][position:stop] = rows[:, 0]
+            found["sub_frames"][position:stop] = np.nan_to_num(rows[:, 1])
+    for found in scanned.values():
+        del found["columns"]
+    return scanned
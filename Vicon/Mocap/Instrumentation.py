@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+import logging
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("Vicon")
+
+
+class Instrumentation(object):
+
+    def __init__(self, memory=False, callbacks=None, verbose=False, max_records=None):
+        """
+        Records the wall time, CPU time and peak memory of the stages of reading and processing a trial.
+        Every finished stage and every status message is sent to the callbacks and to the "Vicon" logger.
+        :param memory: measure the peak memory of every stage with tracemalloc, which slows the stages down
+        :param callbacks: functions called with a dictionary for every event. Stage events have the keys "event"
+                          ("stage"), "name", "depth", "wall" and "cpu" in seconds, "peak" in bytes (None if memory is
+                          not measured) and "info", messages have "event" ("message") and "message"
+        :param verbose: print every status message, even the ones sent without verbose
+        :param max_records: keep only this many of the latest records, None keeps them until they are drained. The
+                            totals always count every stage.
+        """
+        self.memory = memory
+        self.verbose = verbose
+        self._callbacks = list(callbacks) if callbacks is not None else []
+        self._records = deque(maxlen=max_records)
+        self._totals = {}
+        self._stack = []
+
+    def add_callback(self, callback):
+        """
+        :param callback: function called with a dictionary for every event
+        :return: None
+        """
+        self._callbacks.append(callback)
+
+    @property
+    def records(self):
+        """
+        :return: a dictionary for each finished stage, in the order they finished
+        :rtype: list
+        """
+        return list(self._records)
+
+    def drain(self):
+        """
+        Take the records, so an instrumentation shared by a long run does not keep every stage. The totals are kept.
+        :return: a dictionary for each stage that finished since the last drain, in the order they finished
+        :rtype: list
+        """
+        records = list(self._records)
+        self._records.clear()
+        return records
+
+    def reset(self):
+        """
+        Forget every record and the totals
+        :return: None
+        """
+        self._records.clear()
+        self._totals = {}
+
+    @contextmanager
+    def stage(self, name, **info):
+        """
+        Record a stage. Stages can be nested, the depth of a stage is the number of stages it is inside of.
+        :param name: name of the stage, ex: "read file"
+        :param info: anything else to keep with the record, ex: category="Trajectories"
+        """
+        frame = {"start": 0, "peak": 0, "owner": False}
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                frame["owner"] = True
+            current, peak = tracemalloc.get_traced_memory()
+            if len(self._stack) > 0:
+                # resetting the peak loses the peak of the outer stage, so it is kept on its frame
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start"] = current
+        self._stack.append(frame)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._stack.pop()
+            peak = None
+            if self.memory:
+                top = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                peak = top - frame["start"]
+                if len(self._stack) > 0:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], top)
+                if frame["owner"]:
+                    tracemalloc.stop()
+            record = {"event": "stage", "name": name, "depth": len(self._stack), "wall": wall, "cpu": cpu,
+                      "peak": peak, "info": info}
+            self._records.append(record)
+            wall_total, cpu_total, count = self._totals.get(name, (0.0, 0.0, 0))
+            self._totals[name] = (wall_total + wall, cpu_total + cpu, count + 1)
+            logger.debug("%s took %.4f s wall, %.4f s cpu", name, wall, cpu)
+            self._emit(record)
+
+    def message(self, text, verbose=False):
+        """
+        Send a status message, printing it if either it or the instrumentation is verbose
+        :param text: the message
+        :param verbose: print the message, ex: for a trial read with verbose=True
+        :return: None
+        """
+        if verbose or self.verbose:
+            print(text)
+        logger.info(text)
+        self._emit({"event": "message", "message": text})
+
+    def report(self, min_depth=0, max_depth=None):
+        """
+        A table of the stages
+        :param min_depth: leave out stages inside fewer stages than this
+        :param max_depth: leave out stages inside more stages than this
+        :return: one line for each stage, with its wall time and CPU time in seconds and peak memory in MB
+        :rtype: str
+        """
+        lines = ["%-40s %10s %10s %10s" % ("stage", "wall (s)", "cpu (s)", "peak (MB)")]
+        for record in self._records:
+            if record["depth"] < min_depth or (max_depth is not None and record["depth"] > max_depth):
+                continue
+            peak = "" if record["peak"] is None else "%.1f" % (record["peak"] / 1e6)
+            lines.append("%-40s %10.4f %10.4f %10s" % ("  " * record["depth"] + record["name"], record["wall"],
+                                                      record["cpu"], peak))
+        return "\n".join(lines)
+
+    def totals(self):
+        """
+        Add up the stages with the same name, including the ones that were drained or dropped by max_records
+        :return: the total wall time and CPU time of each stage name
+        :rtype: dict
+        """
+        return dict((name, (wall, cpu)) for name, (wall, cpu, count) in self._totals.items())
+
+    def counts(self):
+        """
+        :return: the number of times each stage name finished, including the ones that were drained
+        :rtype: dict
+        """
+        return dict((name, count) for name, (wall, cpu, count) in self._totals.items())
+
+    def __getstate__(self):
+        # callbacks are often lambdas, which can not be pickled with the trial
+        state = self.__dict__.copy()
+        state["_callbacks"] = []
+        return state
+
+    def _emit(self, event):
+        for callback in self._callbacks:
+            callback(event)
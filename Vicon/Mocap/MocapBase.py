@@ -50,16 +50,39 @@ import pandas
 import numpy as np
 from ..Markers import ModelOutput as modeloutput
 from ..Markers import Markers as markers
-from ..Devices import EMG, IMU, Accel, ForcePlate
+from ..Devices import EMG, IMU, Accel, ForcePlate, Synchronization
 import matplotlib.pyplot as plt
 from Vicon import Markers
 from ..Interpolation import Interpolation
 import abc
 from ..Interpolation import Akmia
+from . import Instrumentation
+from . import Storage
 class MocapBase(object):
 
-    def __init__(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1, sanitize=True, inerpolation_method=Akmia.Akmia):
+    # pickled by Storage.reduce, which keeps the views into the categories
+    _share_views = True
+
+    def __init__(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1, sanitize=True, inerpolation_method=Akmia.Akmia,
+                 instrumentation=None, dtype=None, keep_raw=True, store=None, chunk_size=100000):
         self._file_path = file_path
+        #  The type the parsed fields, markers and device signals are stored as
+        self._dtype = np.float64 if dtype is None else dtype
+        #  Keep data_dict and the nan masks once every model is built
+        self._keep_raw = keep_raw
+        #  The only copy of the values of each category, indexed by [(subject, field), sample], see Storage.pack
+        #  data_dict and the models all hold views into these
+        self._arrays = {}
+        self._dropped = False
+        #  Directory of the memory mapped stores of the trials, None reads the trial into memory
+        self._store = store
+        #  Number of samples processed at a time when converting to a store and filtering the markers
+        self._chunk_size = chunk_size
+        #  Records the time and memory of each stage, and carries the verbose messages
+        if instrumentation is None:
+            instrumentation = Instrumentation.Instrumentation()
+        self._instrumentation = instrumentation
+        #  Whether this trial prints its messages, kept here since the instrumentation can be shared between trials
         self._verbose = verbose
         self._interpolate = interpolate
         self._maxanstotal = maxnanstotal
@@ -67,10 +90,14 @@ class MocapBase(object):
         self._sanitize = sanitize
         self._number_of_frames = 0
         self._nan_dict = {}
+        #  The rate in Hz and the frame and sub frame of each sample, for each category
+        self._sample_rates = {}
+        self._timebase = {}
         self.my_marker_interpolation = inerpolation_method
         #  sanitized is a dictionary to keep track of what subject, if any, have had their fields sanitized
         #  If sanitized[category][subject] exists, that subject has had at least one field sanitized
         self._sanitized = {}
+        self._built = set()
         # self.data_dict = self.open_file(self._file_path, verbose=verbose, interpolate=interpolate,
         #                                       maxnanstotal=maxnanstotal, maxnansrow=maxnansrow, sanitize=sanitize)
 
@@ -110,8 +137,54 @@ class MocapBase(object):
 
     @property
     def markers(self):
+        self._build("markers", self._make_marker_trajs)
         return self._markers
 
+    @property
+    def dtype(self):
+        """
+        :return: the type the fields are stored as
+        """
+        return self._dtype
+
+    @property
+    def instrumentation(self):
+        """
+        :return: the record of the time and memory of each stage of reading and processing the trial
+        :rtype: Instrumentation.Instrumentation
+        """
+        return self._instrumentation
+
+    def get_report(self):
+        """
+        get the time and memory of each stage so far
+        :return: a dictionary for each stage with its "name", "depth", "wall" and "cpu" time in seconds,
+                 "peak" memory in bytes and "info"
+        :rtype: list
+        """
+        return self._instrumentation.records
+
+    def _log(self, message):
+        """
+        print a status message, and send it to the callbacks and logger of the instrumentation. The stages only log
+        their messages when they were asked to be verbose
+        :param message: the message
+        :return: None
+        """
+        self._instrumentation.message(message, verbose=True)
+
+    def _build(self, name, make):
+        """
+        build a model from data_dict the first time it is used
+        :param name: name of the model
+        :param make: method that builds the model
+        :return: None
+        """
+        if name not in self._built:
+            with self._instrumentation.stage("make " + name):
+                make(verbose=self._verbose)
+            self._built.add(name)
+
     @property
     def length(self):
         return self._length
@@ -138,6 +211,151 @@ class MocapBase(object):
         """
         self._number_of_frames = value
 
+    @property
+    def frame_rate(self):
+        """
+        The rate of the frames, which is the rate of the trajectories
+        :return: frame rate in Hz, or None if there are no rates
+        :rtype: float
+        """
+        if "Trajectories" in self._sample_rates:
+            return self._sample_rates["Trajectories"]
+        rates = [rate for category, rate in self._sample_rates.items() if category != "Devices"]
+        if len(rates) > 0:
+            return rates[0]
+        return None
+
+    def get_sample_rate(self, category):
+        """
+        get the sample rate of a category
+        :param category: name of the category, ex: "Devices"
+        :return: sample rate in Hz
+        :rtype: float
+        """
+        return self._sample_rates[category]
+
+    def get_timebase(self, category):
+        """
+        get the frame and sub frame of every sample in a category
+        :param category: name of the category
+        :return: frames and sub frames
+        :rtype: np.array, np.array
+        """
+        return self._timebase[category]["frame"], self._timebase[category]["sub_frame"]
+
+    def get_times(self, category):
+        """
+        get the time of every sample in a category, from the frame and sub frame
+        :param category: name of the category
+        :return: time of each sample in seconds, where the first frame is at 0
+        :rtype: np.array
+        """
+        frames, sub_frames = self.get_timebase(category)
+        frame_rate = self.frame_rate
+        if frame_rate is None:
+            frame_rate = self._sample_rates[category]
+        return (frames - 1) / float(frame_rate) + sub_frames / float(self._sample_rates[category])
+
+    def samples_per_frame(self, category):
+        """
+        get the number of samples of a category recorded in each frame
+        :param category: name of the category
+        :return: samples per frame, ex: 20 for devices at 2000Hz with markers at 100Hz
+        :rtype: float
+        """
+        frame_rate = self.frame_rate
+        if frame_rate is None:
+            return 1
+        ratio = self._sample_rates[category] / float(frame_rate)
+        return int(ratio) if ratio.is_integer() else ratio
+
+    def get_category_array(self, category, dtype=np.float64):
+        """
+        get every field of a category as one array
+        :param category: name of the category
+        :param dtype: type of the array
+        :return: the (subject, field) of each column, and the data indexed by [sample, column]
+        :rtype: list, np.array
+        """
+        if category in self._arrays:
+            columns, values = self._arrays[category]
+            if values.dtype == dtype:
+                return list(columns), Storage.read_only(values.T)
+            return list(columns), values.T.astype(dtype)
+        self._check_raw()
+        columns = []
+        values = []
+        for subject, fields in self.data_dict[category].items():
+            for field, f_vals in fields.items():
+                columns.append((subject, field))
+                values.append(np.asarray(f_vals["data"], dtype=dtype))
+        if len(values) == 0:
+            return columns, np.empty((0, 0), dtype=dtype)
+        return columns, np.column_stack(values)
+
+    def query(self, category, subjects, fields=None, start=0, end=None):
+        """
+        Get some fields of several subjects of a category over a window of frames as one array,
+        ex: query("Trajectories", "R_Femur*", start=1200, end=1800).
+        The array is a view when the columns are evenly spaced in the category, like the X, Y and Z of the markers.
+        :param category: name of the category
+        :param subjects: subject name or glob pattern, or a list of them
+        :param fields: names of the fields, defaults to the fields of the first subject
+        :param start: first frame of the window, a device sample is in the frame it was recorded in
+        :param end: frame after the last frame of the window, None for the end of the trial
+        :return: the names of the subjects, the names of the fields, and the data indexed by [sample, subject, field]
+        :rtype: list, list, np.array
+        """
+        columns, values = self.get_category_array(category, dtype=np.dtype(self._dtype))
+        index = {column: number for number, column in enumerate(columns)}
+        names = list(dict.fromkeys(subject for subject, field in columns))
+        keys = []
+        for subject in [subjects] if isinstance(subjects, str) else subjects:
+            keys.extend(markers.match_names(names, subject))
+        keys = list(dict.fromkeys(keys))
+        if len(keys) == 0:
+            raise ValueError("No subjects to query")
+        if fields is None:
+            fields = [field for subject, field in columns if subject == keys[0]]
+        if len(fields) == 0:
+            raise ValueError("No fields to query")
+        missing = [subject + " " + field for subject in keys for field in fields if (subject, field) not in index]
+        if len(missing) > 0:
+            raise ValueError("No field " + ", ".join(missing) + " in " + category)
+
+        ratio = self.samples_per_frame(category)
+        first = int(round(start * ratio))
+        last = None if end is None else int(round(end * ratio))
+        grid = [[index[(subject, field)] for field in fields] for subject in keys]
+        return keys, list(fields), Storage.take(values, grid)[first:last]
+
+    def resample(self, category, rate):
+        """
+        resample every field of a category at once with an anti-aliasing polyphase filter
+        :param category: name of the category
+        :param rate: rate to resample to in Hz
+        :return: the (subject, field) of each column, and the resampled data indexed by [sample, column]
+        :rtype: list, np.array
+        """
+        columns, values = self.get_category_array(category)
+        return columns, Synchronization.resample(values, self._sample_rates[category], rate, axis=0)
+
+    def decimate_devices(self):
+        """
+        resample the devices to the rate of the trajectories
+        :return: the (subject, field) of each column, and the data indexed by [frame, column]
+        :rtype: list, np.array
+        """
+        return self.resample("Devices", self.frame_rate)
+
+    def upsample_trajectories(self):
+        """
+        resample the trajectories to the rate of the devices
+        :return: the (subject, field) of each column, and the data indexed by [sample, column]
+        :rtype: list, np.array
+        """
+        return self.resample("Trajectories", self._sample_rates["Devices"])
+
     def get_markers(self):
         """
         get the markers
@@ -194,28 +412,67 @@ class MocapBase(object):
     def _make_markers(self):
         markers = self.data_dict["Trajectories"]
 
-    def _make_marker_trajs(self):
+    def _make_marker_trajs(self, verbose=False):
         """
-        generate IMU models
+        generate the marker models
         :return: None
         """
-        self._markers = markers.Markers(self.data_dict["Trajectories"], self._file_path[:len(self._file_path)-4])
+        self._markers = markers.Markers(self.data_dict["Trajectories"], self._file_path[:len(self._file_path)-4],
+                                        dtype=self._dtype, chunk_size=self._chunk_size)
         self._markers.make_markers()
+        if verbose:
+            self._log("Marker models generated")
 
     @abc.abstractmethod
     def save(self, filename=None, verbose=False, mark_interpolated=True):
         pass
 
+    @abc.abstractmethod
+    def _make_all(self):
+        raise NotImplementedError
+
+    def drop_raw(self):
+        """
+        Build every model, then drop data_dict and the nan masks. The models keep views into the arrays of their
+        categories, and the arrays of the categories no model uses are freed.
+        get_category_array and resample still work on the categories with models, save and graph do not.
+        :return: None
+        """
+        if self._dropped:
+            return
+        with self._instrumentation.stage("drop raw"):
+            self._make_all()
+            used = ("Trajectories", "Devices", "Model Outputs")
+            self._arrays = {category: values for category, values in self._arrays.items() if category in used}
+            self.data_dict = {}
+            self._nan_dict = {}
+            self._sanitized = {}
+            self._dropped = True
+        if self._verbose:
+            self._log("Dropped the raw data of " + self._file_path)
+
+    def __reduce_ex__(self, protocol):
+        return Storage.reduce(self, protocol)
+
+    def share(self):
+        """
+        Copy the arrays of the trial into shared memory, so worker processes can attach to them without copying
+        :return: handle to send to the workers, their trial is handle.attach()
+        :rtype: Storage.Shared
+        """
+        return Storage.share(self)
+
+    def _check_raw(self):
+        if self._dropped:
+            raise ValueError("The raw data of " + self._file_path + " was dropped, reload it to use data_dict")
+
     def _false_of_n(self, n):
         """Helper function to generate an array of Falses of length N"""
-        arr = []
-        for i in range(n):
-            arr.append(False)
-        return arr
+        return np.zeros(n, dtype=bool)
 
     def _len_data(self, category):
         """Returns the length of the data section of a given category"""
-        return len(next(next(self.data_dict[category].itervalues()).itervalues())["data"])
+        return len(next(iter(next(iter(self.data_dict[category].values())).values()))["data"])
 
 
     def is_sanitized(self, category, subject):
@@ -226,68 +483,54 @@ class MocapBase(object):
                 return True
         return False
 
-    def graph(self, category, subject, field, showinterpolated=True, colorinterpolated=True, limits=None):
-        """Graphs the data specified. If showinterpolated is set to False, interpolated values will not be shown."""
+    def graph(self, category, subject, field, showinterpolated=True, colorinterpolated=True, limits=None,
+              max_points=None):
+        """Graphs the data specified. If showinterpolated is set to False, interpolated values will not be shown.
+        Long fields are reduced to the minimum and maximum of each group of samples before they are plotted,
+        max_points sets how many points are plotted per line and defaults to twice the width of the figure in pixels."""
+        self._check_raw()
         if not (category in self.data_dict and subject in self.data_dict[category] and field in
                 self.data_dict[category][subject]):
             return  # We don't have any data for this field!
-        interpolated = True in self._nan_dict[category][subject][field]
+        data = np.asarray(self.data_dict[category][subject][field]["data"], dtype=np.float64)
+        nans = np.asarray(self._nan_dict[category][subject][field], dtype=bool)
+        frames = np.arange(len(data))
+        if limits is not None:
+            # Only reduce the samples that will be visible, so zooming in still shows every sample
+            first = max(int(np.floor(limits[0])) - 1, 0)
+            last = max(int(np.ceil(limits[1])) + 2, first)
+            data, nans, frames = data[first:last], nans[first:last], frames[first:last]
+        if max_points is None:
+            fig = plt.gcf()
+            max_points = 2 * int(fig.get_figwidth() * fig.dpi)
+
+        interpolated = nans.any()
         if not interpolated or (not colorinterpolated and showinterpolated):  # Simplest case - just graph the data
-            plt.plot(self.data_dict[category][subject][field]["data"])
-            plt.xlabel("Frame")
-            plt.ylabel(self.data_dict[category][subject][field]["unit"])
-            plt.title("Data in category " + category + ", in subject " + subject + ", in field " + field)
-            if limits is not None:
-                plt.xlim(limits)
-            plt.show()
+            plt.plot(*minmax_decimate(frames, data, max_points))
         else:
-            nans = self._nan_dict[category][subject][field]
-            data = self.data_dict[category][subject][field]["data"]
-
-            orgdatablocks = []
-            interdatablocks = []
-            orgtemp = []
-            intertemp = []
-            for i in range(len(nans)):
-                if nans[i]:
-                    if len(orgtemp) > 0:
-                        orgdatablocks.append(orgtemp)
-                        orgtemp = []
-                    intertemp.append(i)
-                else:
-                    if len(intertemp) > 0:
-                        interdatablocks.append(intertemp)
-                        intertemp = []
-                    orgtemp.append(i)
-            if len(orgtemp) > 0:
-                orgdatablocks.append(orgtemp)
-            if len(intertemp) > 0:
-                interdatablocks.append(intertemp)
-
-            flagorg = True
-            for blk in orgdatablocks:
-                if flagorg:
-                    plt.plot(blk, data[blk[0]:blk[len(blk) - 1] + 1], "C0", label="Original Data")
-                    flagorg = False
-                else:
-                    plt.plot(blk, data[blk[0]:blk[len(blk) - 1] + 1], "C0")
+            # Interpolated values are replaced with nans, which matplotlib leaves as gaps in a single line
+            plt.plot(*minmax_decimate(frames, np.where(nans, np.nan, data), max_points), "C0", label="Original Data")
 
             if showinterpolated:
-                flagint = True
-                for blk in interdatablocks:
-                    if flagint:
-                        plt.plot([blk[0]-1] + blk + [blk[len(blk) - 1] + 1], data[blk[0]-1:blk[len(blk) - 1] + 2], "C1", label="Interpolated Data")
-                        flagint = False
-                    else:
-                        plt.plot([blk[0]-1] + blk + [blk[len(blk) - 1] + 1], data[blk[0]-1:blk[len(blk) - 1] + 2], "C1")
+                # Each interpolated block also includes the original value on either side of it, so that it
+                # joins up with the original data
+                edges = np.diff(nans.astype(np.int8), prepend=0, append=0)
+                starts = np.maximum(np.flatnonzero(edges == 1) - 1, 0)
+                ends = np.minimum(np.flatnonzero(edges == -1) + 1, len(nans))
+                blocks = np.zeros(len(nans) + 1, dtype=np.int32)
+                np.add.at(blocks, starts, 1)
+                np.add.at(blocks, ends, -1)
+                shown = np.cumsum(blocks[:-1]) > 0
+                plt.plot(*minmax_decimate(frames, np.where(shown, data, np.nan), max_points), "C1",
+                         label="Interpolated Data")
                 plt.legend()
 
-            plt.xlabel("Frame")
-            plt.ylabel(self.data_dict[category][subject][field]["unit"])
-            plt.title("Data in category " + category + ", in subject " + subject + ", in field " + field)
-            if limits is not None:
-                plt.xlim(limits)
-            plt.show()
+        plt.xlabel("Frame")
+        plt.ylabel(self.data_dict[category][subject][field]["unit"])
+        plt.title("Data in category " + category + ", in subject " + subject + ", in field " + field)
+        if limits is not None:
+            plt.xlim(limits)
+        plt.show()
 
     def _marker_interpolation(self, value, key, naninfo, category, interpolate, sanitize, verbose):
         ### OLD NOT USED
@@ -305,8 +548,8 @@ class MocapBase(object):
             self._nan_dict[category][key]["Y"] = nans
             self._nan_dict[category][key]["Z"] = nans
             if verbose:
-                print("Interpolating missing values in field X Y Z" + ", in subject " + key + \
-                      ", in category " + category + "...")
+                self._log("Interpolating missing values in field X Y Z" + ", in subject " + key + \
+                          ", in category " + category + "...")
             # x, y, z = Interpolation.velocity_method(value["X"]["data"], value["Y"]["data"], value["Z"]["data"])
             # value["X"]["data"] = Interpolation.akmia(value["X"], verbose, category, "X", key)
             # value["Y"]["data"] = Interpolation.akmia(value["X"], verbose, category, "X", key)
@@ -316,12 +559,12 @@ class MocapBase(object):
                 nans = np.isnan(sub_value["data"])
                 if False not in nans:
                     if verbose:
-                        print("Could not interpolate field " + sub_key + ", in subject " + key + \
-                              ", in category " + category + ", as all values were nans!")
+                        self._log("Could not interpolate field " + sub_key + ", in subject " + key + \
+                                  ", in category " + category + ", as all values were nans!")
                     if sanitize and sub_key != "":
                         sub_value["data"] = [0 for i in range(len(sub_value["data"]))]
                         if verbose:
-                            print("Sanitizing field with all 0s...")
+                            self._log("Sanitizing field with all 0s...")
                         if category not in self._sanitized:
                             self._sanitized[category] = []
                         if key not in self._sanitized[category]:
@@ -350,19 +593,19 @@ class MocapBase(object):
                     self._nan_dict[category][key] = {}
                 self._nan_dict[category][key][sub_key] = nans
                 if verbose and interpolate:
-                    print("Interpolating missing values in field " + sub_key + ", in subject " + key + \
-                          ", in category " + category + "...")
+                    self._log("Interpolating missing values in field " + sub_key + ", in subject " + key + \
+                              ", in category " + category + "...")
                 if interpolate:
                     sub_value["data"] = Interpolation.akmia(sub_value, verbose, category, sub_key, key)
             else:
                 if False not in nans:
                     if verbose:
-                        print("Could not interpolate field " + sub_key + ", in subject " + key + \
-                              ", in category " + category + ", as all values were nans!")
+                        self._log("Could not interpolate field " + sub_key + ", in subject " + key + \
+                                  ", in category " + category + ", as all values were nans!")
                     if sanitize and sub_key != "":
                         sub_value["data"] = [0 for i in range(len(sub_value["data"]))]
                         if verbose:
-                            print("Sanitizing field with all 0s...")
+                            self._log("Sanitizing field with all 0s...")
                         if category not in self._sanitized:
                             self._sanitized[category] = []
                         if key not in self._sanitized[category]:
@@ -372,3 +615,38 @@ class MocapBase(object):
                 if key not in self._nan_dict[category]:
                     self._nan_dict[category][key] = {}
                 self._nan_dict[category][key][sub_key] = self._false_of_n(len(sub_value["data"]))
+
+
+def minmax_decimate(x, y, max_points):
+    """
+    Reduce a line to about max_points points by keeping only the minimum and maximum of each group of samples.
+    Groups where every value is nan stay nan so gaps in the line are kept.
+    :param x: x values
+    :param y: y values, may contain nans
+    :param max_points: the most points to return
+    :return: reduced x and y values
+    :rtype: np.array, np.array
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    groups = max_points // 2
+    if groups < 1 or n <= max_points:
+        return x, y
+
+    size = int(np.ceil(n / float(groups)))
+    groups = int(np.ceil(n / float(size)))
+    padded = np.full(groups * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape((groups, size))
+
+    empty = np.isnan(padded)
+    low = np.argmin(np.where(empty, np.inf, padded), axis=1)
+    high = np.argmax(np.where(empty, -np.inf, padded), axis=1)
+    # Keep the minimum and maximum in the order they happened
+    index = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=1) + (np.arange(groups) * size)[:, np.newaxis]
+    index = np.minimum(index, n - 1).ravel()
+
+    y_out = y[index]
+    y_out[np.repeat(empty.all(axis=1), 2)] = np.nan
+    return x[index], y_out
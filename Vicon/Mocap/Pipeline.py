@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+import hashlib
+import os
+import pickle
+import sys
+import traceback
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import Vicon
+
+
+# Directory of this Vicon package, whose source is part of the key of every stage
+_PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_file_hashes = {}
+
+
+class Stage(object):
+
+    def __init__(self, name, function, inputs=(), version=1, params=None, sources=()):
+        """
+        A step of a pipeline. The stage is called as function(file_path, *outputs of inputs, **params)
+        The key of the stage covers the source of the module of the function and of this Vicon package, so changing
+        them recalculates the stage. Change version when anything else the function uses has changed, ex: another
+        library, or add its files to sources.
+        :param name: name of the stage
+        :param function: module level function that runs the stage
+        :param inputs: names of the stages whose outputs are passed to the function
+        :param version: change this to recalculate the stage when something the function uses has changed
+        :param params: keyword arguments of the function
+        :param sources: more files or directories whose python source the stage depends on
+        """
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.version = version
+        self.params = params if params is not None else {}
+        self.sources = tuple(sources)
+
+    def key(self, trial_hash, input_keys):
+        """
+        The key of the output of the stage, which changes when the trial, the inputs, the parameters, the
+        code of the stage or the source it depends on change
+        :param trial_hash: hash of the file of the trial
+        :param input_keys: keys of the inputs of the stage
+        :return: key
+        :rtype: str
+        """
+        key = hashlib.sha1()
+        for part in [self.name, str(self.version), _code_hash(self.function), self._source_hash(),
+                     repr(sorted(self.params.items())), trial_hash] + list(input_keys):
+            key.update(part.encode("utf-8"))
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def _source_hash(self):
+        paths = [_PACKAGE]
+        # functions defined in an interactive session have no file, their bytecode is still hashed by _code_hash
+        module_file = getattr(sys.modules.get(getattr(self.function, "__module__", None)), "__file__", None)
+        if module_file is not None and os.path.isfile(module_file):
+            paths.append(os.path.abspath(module_file))
+        return _source_hash(paths + [os.path.abspath(path) for path in self.sources])
+
+
+class Pipeline(object):
+
+    def __init__(self, store, verbose=False):
+        """
+        Runs named stages over many trials, keeping the output of every stage of every trial in a checkpoint store.
+        Stages whose trial, inputs, parameters and code have not changed are read from the store instead of being
+        run again, so a run that was stopped picks up where it left off.
+        :param store: directory of the checkpoint store
+        :param verbose: print the stages as they run
+        """
+        self._store = store
+        self._verbose = verbose
+        self._stages = []
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def stages(self):
+        return list(self._stages)
+
+    def add_stage(self, name, function, inputs=None, version=1, sources=(), **params):
+        """
+        Add a stage to the end of the pipeline. Each stage is given its own copy of its inputs, so it may change them.
+        :param name: name of the stage
+        :param function: module level function called as function(file_path, *outputs of inputs, **params),
+                         that returns the output of the stage
+        :param inputs: names of the stages the stage uses, defaults to the previous stage
+        :param version: change this to recalculate the stage when something the function uses has changed, other than
+                        the module of the function and this Vicon package, whose source is part of the key
+        :param sources: more files or directories whose python source the stage depends on
+        :param params: keyword arguments of the function
+        :return: the pipeline
+        """
+        if name in self._stage_names():
+            raise ValueError("A stage named " + name + " is already in the pipeline!")
+        if inputs is None:
+            inputs = self._stage_names()[-1:]
+        for stage in inputs:
+            if stage not in self._stage_names():
+                raise ValueError("Stage " + name + " uses stage " + stage + ", which is not in the pipeline!")
+        self._stages.append(Stage(name, function, inputs, version, params, sources))
+        return self
+
+    def run(self, trials, targets=None, workers=None, processes=True):
+        """
+        Run the pipeline over several trials. A trial that fails does not stop the others.
+        :param trials: paths of the CSV files
+        :param targets: names of the stages to bring up to date, defaults to the last stage
+        :param workers: most trials to run at the same time, None or 1 runs them one after another
+        :param processes: use a pool of processes instead of threads
+        :return: for each trial, the names of the stages that were run, or the error that stopped the trial
+        :rtype: dict
+        """
+        results = {}
+        if workers is None or workers <= 1:
+            for trial in trials:
+                results[trial] = self._run_safely(trial, targets)
+            return results
+
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            futures = [(trial, pool.submit(self._run_safely, trial, targets)) for trial in trials]
+            for trial, future in futures:
+                results[trial] = future.result()
+        return results
+
+    def run_trial(self, file_path, targets=None):
+        """
+        Bring the stages of a trial up to date
+        :param file_path: path of the CSV file
+        :param targets: names of the stages to bring up to date, defaults to the last stage
+        :return: the output of each target, and the names of the stages that were run
+        :rtype: dict, list
+        """
+        keys = self._keys(file_path)
+        if targets is None:
+            targets = self._stage_names()[-1:]
+        stages = dict((stage.name, stage) for stage in self._stages)
+        # The output of each stage is pickled as soon as it is made, and every stage that uses it unpickles its own
+        # copy, so a stage that changes its inputs can't change the output or the checkpoint of another stage
+        frozen = {}
+        ran = []
+
+        def get(name):
+            if name not in frozen:
+                stage = stages[name]
+                path = self._checkpoint_path(file_path, name, keys[name])
+                if os.path.exists(path):
+                    if self._verbose:
+                        print("Reading stage " + name + " of " + file_path + " from the checkpoint store")
+                    with open(path, "rb") as f:
+                        frozen[name] = f.read()
+                else:
+                    args = [get(stage_input) for stage_input in stage.inputs]
+                    if self._verbose:
+                        print("Running stage " + name + " of " + file_path)
+                    frozen[name] = pickle.dumps(stage.function(file_path, *args, **stage.params),
+                                                protocol=pickle.HIGHEST_PROTOCOL)
+                    self._save(file_path, name, keys[name], frozen[name])
+                    ran.append(name)
+            return pickle.loads(frozen[name])
+
+        return dict((name, get(name)) for name in targets), ran
+
+    def load(self, file_path, stage):
+        """
+        Read the output of a stage of a trial from the checkpoint store
+        :param file_path: path of the CSV file
+        :param stage: name of the stage
+        :return: the output, or None if the stage is not up to date
+        """
+        path = self._checkpoint_path(file_path, stage, self._keys(file_path)[stage])
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def status(self, file_path):
+        """
+        :param file_path: path of the CSV file
+        :return: for each stage, True if its output in the checkpoint store is up to date
+        :rtype: dict
+        """
+        keys = self._keys(file_path)
+        return dict((name, os.path.exists(self._checkpoint_path(file_path, name, key))) for name, key in keys.items())
+
+    def _run_safely(self, file_path, targets):
+        try:
+            return self.run_trial(file_path, targets)[1]
+        except Exception as error:
+            if self._verbose:
+                print("Trial " + file_path + " failed:\n" + traceback.format_exc())
+            return error
+
+    def _stage_names(self):
+        return [stage.name for stage in self._stages]
+
+    def _keys(self, file_path):
+        trial_hash = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                trial_hash.update(block)
+        trial_hash = trial_hash.hexdigest()
+
+        keys = {}
+        for stage in self._stages:
+            keys[stage.name] = stage.key(trial_hash, [keys[name] for name in stage.inputs])
+        return keys
+
+    def _trial_dir(self, file_path):
+        file_path = os.path.abspath(file_path)
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(self._store, name + "-" + hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:16])
+
+    def _checkpoint_path(self, file_path, stage, key):
+        return os.path.join(self._trial_dir(file_path), stage + "-" + key + ".pkl")
+
+    def _save(self, file_path, stage, key, output):
+        """
+        Write a checkpoint and remove the old checkpoints of the stage. The file is written under a temporary name
+        first, so a run that is stopped never leaves a broken checkpoint.
+        :param output: the pickled output of the stage
+        """
+        directory = self._trial_dir(file_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        path = self._checkpoint_path(file_path, stage, key)
+        temp = path + "." + str(os.getpid()) + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(output)
+        os.replace(temp, path)
+        for name in os.listdir(directory):
+            if name.startswith(stage + "-") and name.endswith(".pkl") and len(name) == len(stage) + 45 and \
+                    os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+
+
+def load_trial(file_path, **params):
+    """
+    Stage that reads a trial, interpolating it as set by params
+    :param params: keyword arguments of Vicon.Vicon, ex: interpolate=True, maxnanstotal=100
+    :return: the trial
+    :rtype: Vicon.Vicon
+    """
+    return Vicon.Vicon(file_path, **params)
+
+
+def sort_markers(file_path, vicon, filter=True):
+    """
+    Stage that sorts the markers of a trial into rigid bodies
+    :return: the markers
+    :rtype: Markers.Markers
+    """
+    markers = vicon.get_markers()
+    markers.smart_sort(filter)
+    return markers
+
+
+def make_frames(file_path, markers):
+    """
+    Stage that makes the frames of the rigid bodies
+    :return: the markers
+    :rtype: Markers.Markers
+    """
+    markers.auto_make_frames()
+    return markers
+
+
+def calc_joints(file_path, markers, joints=(), **params):
+    """
+    Stage that calculates joints
+    :param joints: (name, parent body, child body, True for a ball joint) of each joint
+    :param params: keyword arguments of Markers.calc_joints
+    :return: the markers
+    :rtype: Markers.Markers
+    """
+    for name, parent, child, ball in joints:
+        markers.def_joint(name, parent, child, ball)
+    params.setdefault("try_load", False)
+    markers.calc_joints(**params)
+    return markers
+
+
+def gait_pipeline(store, joints=(), export=None, load_params=None, joint_params=None, verbose=False):
+    """
+    The usual pipeline: load (with interpolation) -> smart_sort -> auto_make_frames -> calc_joints -> export
+    :param store: directory of the checkpoint store
+    :param joints: (name, parent body, child body, True for a ball joint) of each joint
+    :param export: module level function called as export(file_path, markers) that saves the results,
+                   the last stage is calc_joints if this is None
+    :param load_params: keyword arguments of Vicon.Vicon
+    :param joint_params: keyword arguments of Markers.calc_joints
+    :param verbose: print the stages as they run
+    :return: the pipeline
+    :rtype: Pipeline
+    """
+    pipeline = Pipeline(store, verbose=verbose)
+    pipeline.add_stage("load", load_trial, **(load_params or {}))
+    pipeline.add_stage("smart_sort", sort_markers)
+    pipeline.add_stage("frames", make_frames)
+    pipeline.add_stage("joints", calc_joints, joints=tuple(tuple(joint) for joint in joints), **(joint_params or {}))
+    if export is not None:
+        pipeline.add_stage("export", export)
+    return pipeline
+
+
+def _source_hash(paths):
+    """
+    Hash the python source of files and directories, so changing the code a stage calls recalculates it
+    :param paths: files, or directories whose .py files are all hashed
+    :return: hex digest
+    """
+    key = hashlib.sha1()
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, dirs, names in os.walk(path) for name in names
+                           if name.endswith(".py"))
+        for name in files:
+            key.update(name.encode("utf-8"))
+            key.update(b"\0")
+            key.update(_file_hash(name).encode("utf-8"))
+    return key.hexdigest()
+
+
+def _file_hash(path):
+    """
+    Hash of a file, kept until the file changes so the source is not read again for every stage of every trial
+    """
+    stat = os.stat(path)
+    cached = _file_hashes.get(path)
+    if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+        with open(path, "rb") as f:
+            cached = ((stat.st_mtime_ns, stat.st_size), hashlib.sha1(f.read()).hexdigest())
+        _file_hashes[path] = cached
+    return cached[1]
+
+
+def _code_hash(function):
+    """
+    Hash the code of a function, so changing a stage recalculates it
+    """
+    key = hashlib.sha1()
+    key.update((getattr(function, "__module__", "") + "." + getattr(function, "__qualname__", "")).encode("utf-8"))
+    code = getattr(function, "__code__", None)
+    if code is not None:
+        _hash_code(key, code)
+    return key.hexdigest()
+
+
+def _hash_code(key, code):
+    key.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(key, const)
+        else:
+            key.update(repr(const).encode("utf-8"))
+    key.update(repr(code.co_names).encode("utf-8"))
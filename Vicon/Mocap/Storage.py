@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# //==============================================================================
+# /*
+#     Software License Agreement (BSD License)
+#     Copyright (c) 2020, AIMVicon
+#     (www.aimlab.wpi.edu)
+
+#     All rights reserved.
+
+#     Redistribution and use in source and binary forms, with or without
+#     modification, are permitted provided that the following conditions
+#     are met:
+
+#     * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+
+#     * Redistributions in binary form must reproduce the above
+#     copyright notice, this list of conditions and the following
+#     disclaimer in the documentation and/or other materials provided
+#     with the distribution.
+
+#     * Neither the name of authors nor the names of its contributors may
+#     be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+
+#     THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#     "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#     LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#     FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#     COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#     INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#     BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#     LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#     CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#     LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#     ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#     POSSIBILITY OF SUCH DAMAGE.
+
+#     \author    <http://www.aimlab.wpi.edu>
+#     \author    <nagoldfarb@wpi.edu>
+#     \author    Nathaniel Goldfarb
+#     \version   0.1
+# */
+# //==============================================================================
+
+
+import io
+import json
+import os
+import pickle
+from collections import namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def pack(data, dtype=np.float64):
+    """
+    Store every field of a category in one array, and replace the data of each field with a read only view of its row.
+    The array is the only copy of the values, everything built from the category holds views into it.
+    :param data: the category, indexed by data[subject][field]["data"]
+    :param dtype: type to store the values as
+    :return: the (subject, field) of each row, and the array indexed by [row, sample]
+    :rtype: list, np.array
+    """
+    columns = [(subject, field) for subject, fields in data.items() for field in fields]
+    length = len(data[columns[0][0]][columns[0][1]]["data"]) if columns else 0
+    values = np.empty((len(columns), length), dtype=dtype)
+    for row, (subject, field) in enumerate(columns):
+        values[row] = data[subject][field]["data"]
+        data[subject][field]["data"] = read_only(values[row])
+    return columns, values
+
+
+def read_only(values):
+    """
+    :param values: an array
+    :return: a view of the array that can not be written to
+    :rtype: np.array
+    """
+    view = values.view()
+    view.flags.writeable = False
+    return view
+
+
+def stack(fields):
+    """
+    Stack fields into the columns of one array. Fields that are evenly spaced rows of the same array, like the X, Y
+    and Z rows made by pack, are stacked without copying them.
+    :param fields: 1D arrays or lists of the same length
+    :return: read only array indexed by [sample, field]
+    :rtype: np.array
+    """
+    first = fields[0]
+    if isinstance(first, np.ndarray) and first.ndim == 1 and first.base is not None and \
+            all(isinstance(field, np.ndarray) and field.base is first.base and field.shape == first.shape and
+                field.strides == first.strides and field.dtype == first.dtype for field in fields):
+        addresses = [field.__array_interface__["data"][0] for field in fields]
+        step = addresses[1] - addresses[0] if len(addresses) > 1 else first.itemsize
+        if all(b - a == step for a, b in zip(addresses, addresses[1:])):
+            return as_strided(first, shape=(first.shape[0], len(fields)), strides=(first.strides[0], step),
+                              writeable=False)
+    return read_only(np.column_stack(fields))
+
+
+def gather(arrays):
+    """
+    Stack arrays of the same shape along a new second axis. Arrays that are evenly spaced in the same array, like the
+    raw markers of a trial, are stacked without copying them.
+    :param arrays: arrays of the same shape, each indexed by [sample, ...]
+    :return: read only array indexed by [sample, array, ...]
+    :rtype: np.array
+    """
+    first = arrays[0]
+    if first.ndim > 0 and all(values.shape == first.shape and values.strides == first.strides and
+                              values.dtype == first.dtype for values in arrays):
+        owner = _owner(first)
+        addresses = [values.__array_interface__["data"][0] for values in arrays]
+        step = addresses[1] - addresses[0] if len(addresses) > 1 else 0
+        if all(_owner(values) is owner for values in arrays) and \
+                all(b - a == step for a, b in zip(addresses, addresses[1:])):
+            return as_strided(first, shape=first.shape[:1] + (len(arrays),) + first.shape[1:],
+                              strides=first.strides[:1] + (step,) + first.strides[1:], writeable=False)
+    return read_only(np.stack(arrays, axis=1))
+
+
+def take(values, indices):
+    """
+    Take a grid of columns of an array, without copying them when the columns are evenly spaced along both axes of
+    the grid, like the X, Y and Z columns of the markers of a category
+    :param values: array indexed by [sample, column]
+    :param indices: columns to take, indexed by [row, column] of the grid
+    :return: read only array indexed by [sample, row, column] of the grid
+    :rtype: np.array
+    """
+    indices = np.asarray(indices, dtype=np.intp)
+    rows, cols = indices.shape
+    first = indices[0, 0]
+    row_step = indices[1, 0] - first if rows > 1 else 0
+    col_step = indices[0, 1] - first if cols > 1 else 0
+    if np.array_equal(indices, first + row_step * np.arange(rows)[:, np.newaxis] + col_step * np.arange(cols)):
+        return as_strided(values[:, first], shape=(values.shape[0], rows, cols),
+                          strides=(values.strides[0], row_step * values.strides[1], col_step * values.strides[1]),
+                          writeable=False)
+    return read_only(values[:, indices])
+
+
+# A piece of a long array, values covers start - lead to stop and the samples after it, see chunks
+Chunk = namedtuple("Chunk", ["start", "stop", "lead", "values"])
+
+
+def chunks(values, size, before=0, after=0, length=None, axis=0):
+    """
+    Split an array into views along an axis, so long recordings, memory mapped ones included, can be processed
+    a chunk at a time. Each chunk also holds up to before samples ahead of it and after samples behind it, for the
+    filters that need the samples around its edges.
+    :param values: array
+    :param size: number of samples each chunk is for
+    :param before: samples to add ahead of each chunk
+    :param after: samples to add behind each chunk
+    :param length: number of samples to split, defaults to the length of values along the axis
+    :param axis: axis of the samples
+    :return: generator of Chunk, with the samples from start - lead up to stop + after, clipped to the array
+    """
+    if size < 1:
+        raise ValueError("The size of the chunks must be at least 1")
+    total = values.shape[axis]
+    length = total if length is None else length
+    index = [slice(None)] * values.ndim
+    for start in range(0, length, size):
+        stop = min(start + size, length)
+        first = max(start - before, 0)
+        index[axis] = slice(first, min(stop + after, total))
+        yield Chunk(start, stop, start - first, values[tuple(index)])
+
+
+def map_chunks(function, values, size, before=0, after=0, length=None, out=None, axis=0):
+    """
+    Apply a function to an array a chunk at a time. The function is given each chunk with the samples around it,
+    and returns a result for each sample from the first one it was given, so a 'valid' convolution works with
+    after set to the length of its window less one. Only the results for the samples of the chunk are kept, so the
+    output is the same as applying the function to the whole array when the overlap covers its reach.
+    :param function: function of an array, applied along the axis
+    :param values: array
+    :param size: number of samples in each chunk
+    :param before: samples the function needs ahead of each sample
+    :param after: samples the function needs behind each sample
+    :param length: number of results, defaults to the length of values along the axis
+    :param out: array to write the results into, ex: a memory mapped array, made if None
+    :param axis: axis of the samples
+    :return: the results
+    :rtype: np.array
+    """
+    length = values.shape[axis] if length is None else length
+    for chunk in chunks(values, size, before, after, length, axis):
+        result = np.asarray(function(chunk.values))
+        if out is None:
+            shape = list(result.shape)
+            shape[axis] = length
+            out = np.empty(shape, dtype=result.dtype)
+        index = [slice(None)] * result.ndim
+        index[axis] = slice(chunk.lead, chunk.lead + chunk.stop - chunk.start)
+        target = [slice(None)] * result.ndim
+        target[axis] = slice(chunk.start, chunk.stop)
+        out[tuple(target)] = result[tuple(index)]
+    if out is None:
+        shape = list(values.shape)
+        shape[axis] = max(length, 0)
+        out = np.empty(shape, dtype=values.dtype)
+    return out
+
+
+class Store(object):
+
+    def __init__(self, directory):
+        """
+        A directory of arrays in .npy files, which are opened memory mapped so only the parts that are used are read
+        from the disk. The index is a JSON file describing them.
+        :param directory: directory of the store, made if it does not exist
+        """
+        self._directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def path(self, name):
+        """
+        :param name: name of an array
+        :return: the path of its file
+        :rtype: str
+        """
+        return os.path.join(self._directory, name + ".npy")
+
+    def create(self, name, shape, dtype):
+        """
+        Make an array on the disk
+        :param name: name of the array
+        :param shape: shape of the array
+        :param dtype: type of the array
+        :return: the array, memory mapped for writing
+        :rtype: np.memmap
+        """
+        if 0 in shape:
+            np.save(self.path(name), np.empty(shape, dtype=dtype))
+            return np.empty(shape, dtype=dtype)
+        return np.lib.format.open_memmap(self.path(name), mode="w+", dtype=dtype, shape=tuple(shape))
+
+    def open(self, name, mode="r"):
+        """
+        Open an array of the store
+        :param name: name of the array
+        :param mode: "r" to read it or "r+" to change it
+        :return: the array, memory mapped
+        :rtype: np.memmap
+        """
+        return np.load(self.path(name), mmap_mode=mode)
+
+    @property
+    def index(self):
+        """
+        :return: the index of the store, or None if it has not been written
+        :rtype: dict
+        """
+        path = os.path.join(self._directory, "index.json")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @index.setter
+    def index(self, value):
+        path = os.path.join(self._directory, "index.json")
+        if value is None:
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(value, f, indent=1)
+        os.replace(temp, path)
+
+
+# arrays smaller than this are kept in the pickle, so a trial with many small arrays is not split into many buffers
+MIN_OUT_OF_BAND = 1 << 13
+# start of each array in a shared memory block, in bytes
+ALIGNMENT = 64
+
+
+def reduce(obj, protocol):
+    """
+    Reduce a trial or markers for pickle. The views into a category are pickled as their place in the category, so
+    the category is pickled once. With protocol 5 the large arrays are out-of-band buffers, which pickle.dumps hands
+    to its buffer_callback instead of copying them into the pickle.
+    :param obj: object to reduce, its __dict__ is pickled
+    :param protocol: pickle protocol
+    :return: the reduce tuple
+    :rtype: tuple
+    """
+    payload, buffers = _dumps(_state(obj))
+    if protocol < 5:
+        buffers = [buffer.raw().tobytes() for buffer in buffers]
+    return _restore, (type(obj), payload, buffers)
+
+
+def share(obj):
+    """
+    Copy the arrays of a trial or markers into one block of shared memory, see Shared
+    :param obj: object to share
+    :return: handle that other processes attach to
+    :rtype: Shared
+    """
+    payload, buffers = _dumps(_state(obj))
+    raws = [buffer.raw() for buffer in buffers]
+    offsets = []
+    size = 0
+    for raw in raws:
+        offsets.append(size)
+        size += -(-raw.nbytes // ALIGNMENT) * ALIGNMENT
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for raw, offset in zip(raws, offsets):
+        block.buf[offset:offset + raw.nbytes] = raw
+    return Shared(type(obj), payload, block.name, [(offset, raw.nbytes) for raw, offset in zip(raws, offsets)],
+                  block)
+
+
+class Shared(object):
+
+    def __init__(self, cls, payload, name, spans, block=None):
+        """
+        A trial or markers whose arrays are in shared memory. The handle is small, so it is cheap to send to
+        worker processes, which attach to the arrays without copying them.
+        The process that made the handle owns the memory, and frees it with unlink or by leaving a with block.
+        :param cls: class of the shared object
+        :param payload: the object pickled without its arrays
+        :param name: name of the shared memory block
+        :param spans: the offset and size of each array in the block, in bytes
+        :param block: the block, only passed by the process that made it
+        """
+        self._cls = cls
+        self._payload = payload
+        self._name = name
+        self._spans = spans
+        self._block = block
+        self._owned = block is not None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_block"] = None
+        state["_owned"] = False
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+
+    @property
+    def name(self):
+        """
+        :return: name of the shared memory block
+        :rtype: str
+        """
+        return self._name
+
+    @property
+    def nbytes(self):
+        """
+        :return: the size of the shared arrays in bytes
+        :rtype: int
+        """
+        return sum(size for offset, size in self._spans)
+
+    def attach(self):
+        """
+        Rebuild the object on the shared arrays. The object keeps the block open for as long as it is alive.
+        :return: the object
+        """
+        if self._block is None:
+            self._block = shared_memory.SharedMemory(name=self._name)
+        buffers = [self._block.buf[offset:offset + size] for offset, size in self._spans]
+        obj = _restore(self._cls, self._payload, buffers)
+        obj.__dict__["_shared_block"] = self._block
+        return obj
+
+    def close(self):
+        """
+        Close the block in this process, the objects attached to it must be deleted first
+        :return: None
+        """
+        if self._block is not None:
+            self._block.close()
+        self._block = None
+
+    def unlink(self):
+        """
+        Free the shared memory, only done by the process that made the handle
+        :return: None
+        """
+        block = self._block if self._owned else None
+        self.close()
+        if block is not None:
+            block.unlink()
+        self._owned = False
+
+
+class _Pickler(pickle.Pickler):
+
+    def reducer_override(self, obj):
+        if isinstance(obj, np.memmap) and obj.base is not None and not isinstance(obj.base, np.ndarray) and \
+                obj.filename is not None and obj.mode == "r":
+            # a whole array of a Store, which is opened again rather than copied
+            return _map, (obj.filename,)
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            owner = _owner(obj)
+            if owner is not obj and owner.flags.c_contiguous:
+                offset = obj.__array_interface__["data"][0] - owner.__array_interface__["data"][0]
+                return _view, (owner, offset, obj.shape, obj.strides, obj.dtype, obj.flags.writeable)
+        elif getattr(type(obj), "_share_views", False):
+            # the trial holds the markers, they are pickled in the same pickle so their views share its categories
+            return _new, (type(obj),), _state(obj)
+        return NotImplemented
+
+
+def _dumps(state):
+    buffers = []
+
+    def out_of_band(buffer):
+        if buffer.raw().nbytes < MIN_OUT_OF_BAND:
+            return True
+        buffers.append(buffer)
+        return False
+
+    stream = io.BytesIO()
+    _Pickler(stream, protocol=5, buffer_callback=out_of_band).dump(state)
+    return stream.getvalue(), buffers
+
+
+def _state(obj):
+    state = obj.__dict__.copy()
+    state.pop("_shared_block", None)
+    for name in getattr(obj, "_caches", ()):
+        state[name] = {}
+    return state
+
+
+def _new(cls):
+    return cls.__new__(cls)
+
+
+def _restore(cls, payload, buffers):
+    obj = cls.__new__(cls)
+    obj.__dict__.update(pickle.loads(payload, buffers=buffers))
+    return obj
+
+
+def _owner(values):
+    """
+    :param values: an array
+    :return: the array that holds the memory of values, or values if it is not a view
+    :rtype: np.array
+    """
+    owner = values
+    base = values.base
+    while base is not None:
+        if isinstance(base, np.ndarray):
+            owner = base
+        elif not hasattr(base, "__array_interface__"):
+            # a buffer, ex: shared memory
+            break
+        base = getattr(base, "base", None)
+    return owner
+
+
+def _map(path):
+    return np.load(path, mmap_mode="r")
+
+
+def _view(owner, offset, shape, strides, dtype, writeable):
+    view = np.ndarray(shape, dtype=dtype, buffer=owner, offset=offset, strides=strides)
+    if not writeable:
+        view.flags.writeable = False
+    return view
@@ -43,23 +43,31 @@
 # */
 # //==============================================================================
 import csv
+import hashlib
+import io
+import os
+from functools import partial
 from typing import List, Any
 from ..Interpolation import Akmia
+from ..Interpolation import Interpolation
 import numpy as np
+import pandas
 from Vicon.Markers import ModelOutput as modeloutput
-from Vicon.Devices import EMG, IMU, Accel, ForcePlate
+from Vicon.Devices import Devices, EMG, IMU, Accel, ForcePlate, Gyro
 from . import MocapBase
+from . import Storage
 class Vicon(MocapBase.MocapBase):
 
-    def __init__(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1, sanitize=True,inerpolation_method=Akmia.Akmia):
-        super(Vicon, self).__init__(file_path, verbose, interpolate, maxnanstotal, maxnansrow, sanitize,inerpolation_method)
+    def __init__(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1, sanitize=True,inerpolation_method=Akmia.Akmia,
+                 instrumentation=None, dtype=None, keep_raw=True, store=None, chunk_size=100000):
+        super(Vicon, self).__init__(file_path, verbose, interpolate, maxnanstotal, maxnansrow, sanitize,inerpolation_method,
+                                    instrumentation, dtype, keep_raw, store, chunk_size)
         self._file_path = file_path
         self._number_of_frames = 0
-        self._T_EMGs = {}
-        self._EMGs = {}
-        self._force_plates = {}
-        self._IMUs = {}
-        self._accels = {}
+        # devices by number, for each collection in the device registry, ex: self._devices["IMUs"][1]
+        self._devices = {}
+        self._emg_matrices = {}
+        self._model_output = None
 
 
         self._nan_dict = {}
@@ -72,14 +80,38 @@ class Vicon(MocapBase.MocapBase):
 
     def parse(self):
 
-        self.data_dict = self.open_file(self._file_path, verbose=self._verbose, interpolate=self._interpolate,
-                                              maxnanstotal=self._maxanstotal, maxnansrow=self._maxnansrow, sanitize=self._sanitize)
-        self._make_Accelerometers(verbose=self._verbose)
-        self._make_EMGs(verbose=self._verbose)
-        self._make_force_plates(verbose=self._verbose)
-        self._make_IMUs(verbose=self._verbose)
-        self._make_marker_trajs()
-        self._make_model(verbose=self._verbose)
+        self._arrays = {}
+        with self._instrumentation.stage("open_file", file_path=self._file_path):
+            self.data_dict = self.open_file(self._file_path, verbose=self._verbose, interpolate=self._interpolate,
+                                            maxnanstotal=self._maxanstotal, maxnansrow=self._maxnansrow,
+                                            sanitize=self._sanitize)
+        # The models are built from data_dict the first time they are used, see MocapBase._build
+        self._built = set()
+        self._dropped = False
+        if not self._keep_raw:
+            self.drop_raw()
+
+    def get_devices(self, collection):
+        """
+        Get the devices of a collection in the device registry, built the first time they are used
+        :param collection: name of the collection, ex: "IMUs" or "gyros"
+        :return: devices by number
+        :type: dict
+        """
+        self._build(collection, partial(self._make_devices, collection))
+        return self._devices[collection]
+
+    def _set_device_rates(self, devices):
+        """
+        give every device the rate of the devices section, which sets how many samples it records per frame
+        :param devices: dict of devices
+        :return: None
+        """
+        rate = self._sample_rates.get("Devices")
+        if rate is None or self.frame_rate is None:
+            return
+        for device in devices.values():
+            device.set_rate(rate, self.frame_rate)
 
     @property
     def accels(self):
@@ -88,7 +120,7 @@ class Vicon(MocapBase.MocapBase):
         :return: Accels
         :type: dict
         """
-        return self._accels
+        return self.get_devices("accels")
 
     @property
     def force_plate(self):
@@ -97,7 +129,7 @@ class Vicon(MocapBase.MocapBase):
          :return: Force plates
          :type: dict
         """
-        return self._force_plates
+        return self.get_devices("force_plates")
 
     @property
     def IMUs(self):
@@ -106,7 +138,16 @@ class Vicon(MocapBase.MocapBase):
          :return: IMU
          :type: dict
         """
-        return self._IMUs
+        return self.get_devices("IMUs")
+
+    @property
+    def gyros(self):
+        """
+         Get the dict of IMUs that only have gyroscope channels
+         :return: Gyros
+         :type: dict
+        """
+        return self.get_devices("gyros")
 
     @property
     def T_EMGs(self):
@@ -115,7 +156,7 @@ class Vicon(MocapBase.MocapBase):
          :return: T EMG
          :type: dict
         """
-        return self._T_EMGs
+        return self.get_devices("T_EMGs")
 
     @property
     def EMGs(self):
@@ -124,7 +165,7 @@ class Vicon(MocapBase.MocapBase):
         :return: EMGs
         :type: dict
         """
-        return self._EMGs
+        return self.get_devices("EMGs")
 
     def get_model_output(self):
         """
@@ -132,6 +173,7 @@ class Vicon(MocapBase.MocapBase):
         :return: model outputs
         :rtype: ModelOutput.ModelOutput
         """
+        self._build("model", self._make_model)
         return self._model_output
 
     def get_segments(self):
@@ -232,6 +274,17 @@ class Vicon(MocapBase.MocapBase):
         """
         return self.force_plate
 
+    def get_combined_force_plate(self, threshold=10.0, origins=None):
+        """
+        Combine every force plate into a single ground reaction force
+        :param threshold: smallest total vertical force to find a CoP for
+        :param origins: origin of each plate in the global frame, in the order of the plate numbers
+        :return: dictionary of "force", "moment", "CoP" and "free_moment", see ForcePlate.combine
+        :rtype: dict
+        """
+        keys = sorted(self.get_force_plate_keys())
+        return ForcePlate.combine([self.get_force_plate(key) for key in keys], threshold=threshold, origins=origins)
+
     def get_emg(self, index):
         """
        Get the EMG values
@@ -239,7 +292,7 @@ class Vicon(MocapBase.MocapBase):
        :return: EMG
        :rtype: EMG.EMG
         """
-        return self._EMGs[index]
+        return self.EMGs[index]
 
     def get_emg(self):
         """
@@ -247,11 +300,38 @@ class Vicon(MocapBase.MocapBase):
        :return: list of keys
        :rtype: list
         """
-        return self._EMGs.keys()
+        return self.EMGs.keys()
 
     def get_all_emgs(self):
 
-        return self._EMGs
+        return self.EMGs
+
+    def get_emg_matrix(self, trigno=False, dtype=None):
+        """
+        Stack every EMG channel into one matrix. The EMG objects are changed to hold their row of the matrix,
+        so the channels are not stored twice.
+        :param trigno: stack the Trigno EMGs instead of the IMU EMGs
+        :param dtype: type to store the samples as, ex: np.float32. Defaults to the type of the channels
+        :return: the channel numbers in the order of the rows, and the matrix indexed by [channel, sample]
+        :rtype: list, np.array
+        """
+        emgs = self.T_EMGs if trigno else self.EMGs
+        keys = sorted(emgs.keys())
+        if len(keys) == 0:
+            return keys, np.zeros((0, 0), dtype=dtype)
+
+        stacked = self._emg_matrices.get(trigno)
+        if stacked is not None and stacked[0] == keys and (dtype is None or stacked[1].dtype == dtype) and \
+                all(emgs[key].data.base is stacked[1] for key in keys):
+            return stacked
+
+        matrix = np.vstack([emgs[key].data for key in keys])
+        if dtype is not None:
+            matrix = matrix.astype(dtype, copy=False)
+        for row, key in enumerate(keys):
+            emgs[key].data = matrix[row]
+        self._emg_matrices[trigno] = (keys, matrix)
+        return keys, matrix
 
     def get_t_emg(self, index):
         """
@@ -260,7 +340,7 @@ class Vicon(MocapBase.MocapBase):
         :return: EMG
         :rtype: EMG.EMG
         """
-        return self._T_EMGs[index]
+        return self.T_EMGs[index]
 
     def get_t_emg_keys(self):
         """
@@ -268,7 +348,7 @@ class Vicon(MocapBase.MocapBase):
         :return: list of keys
         :rtype: list
         """
-        return self._T_EMGs.keys()
+        return self.T_EMGs.keys()
 
     def get_all_t_emg(self):
         """
@@ -277,7 +357,7 @@ class Vicon(MocapBase.MocapBase):
         :return: EMG
         :rtype: EMG.EMG
         """
-        return self._T_EMGs
+        return self.T_EMGs
 
     def _make_model(self, verbose=False):
         """
@@ -287,96 +367,39 @@ class Vicon(MocapBase.MocapBase):
         if "Model Outputs" in self.data_dict:
             self._model_output = modeloutput.ModelOutput(self.data_dict["Model Outputs"])
             if verbose:
-                print("Model Outputs generated")
-        elif verbose:
-            print("No Model outputs")
-
-    def _make_force_plates(self, verbose=False):
-        """
-        generate force plate models
-        :return: None
-        """
-        if "Devices" in self.data_dict:
-
-            sensors = self.data_dict["Devices"]
-            keys = self._filter_dict(sensors, 'Force_Plate')  # + ['Combined Moment'] + ['Combined CoP']
-
-            if any("Force_Plate" in word for word in keys):
-                key_numbers = set()
-                for key in keys:
-                    key_numbers.add(self._filter_number(key))
-
-                for i in key_numbers:
-                    self._force_plates[i] = ForcePlate.ForcePlate("Force_Plate_" + str(i),
-                                                                  sensors["Force_Plate__Force_" + str(i)],
-                                                                  sensors["Force_Plate__Moment_" + str(i)],
-                                                                  sensors["Force_Plate__CoP_"+ str(i)])
-
-                if verbose:
-                    print("Force plate models generated")
-            elif verbose:
-                print("No force plates")
-        elif verbose:
-            print("A scan for force plates found no Devices")
-
-
-    def _make_EMGs(self, verbose=True):
-        """
-        generate EMG models
-        :return: None
-        """
-        if "Devices" in self.data_dict:
-            sensors = self.data_dict["Devices"]
-            all_keys = self._filter_dict(sensors, 'EMG')
-            if len(all_keys) > 0:
-                all_keys = self._filter_dict(sensors, 'EMG')
-                T_EMG_keys = self._filter_dict(sensors, 'T_EMG')
-                EMG_keys = [x for x in all_keys if x not in T_EMG_keys]
-                for e_key, t_key in zip(EMG_keys, T_EMG_keys):
-                    self._T_EMGs[self._filter_number(t_key)] = EMG.EMG(t_key, sensors[t_key]["EMG"])
-                    self._EMGs[self._filter_number(e_key)] = EMG.EMG(e_key, sensors[e_key]["IM EMG"])
-                if verbose:
-                    print("EMG models generated")
-            elif verbose:
-                print("No EMGs")
+                self._log("Model Outputs generated")
         elif verbose:
-            print("A scan for EMGs found no Devices")
+            self._log("No Model outputs")
 
-    def _make_IMUs(self, verbose=False):
+    def _make_all(self):
         """
-        generate IMU models
+        build every model the trial has data for
         :return: None
         """
-        if "Devices" in self.data_dict:
-            sensors = self.data_dict["Devices"]
-            keys = self._filter_dict(sensors, 'IMU')
-            if len(keys) > 0:
-                for key in keys:
-                    self._IMUs[self._filter_number(key)] = IMU.IMU(key, sensors[key])
-                if verbose:
-                    print("IMU models Generated")
-            elif verbose:
-                print("No IMUs")
-        elif verbose:
-            print("A scan for IMUs found no Devices")
+        if "Trajectories" in self.data_dict:
+            self._build("markers", self._make_marker_trajs)
+        for collection in Devices.collections():
+            self.get_devices(collection)
+        self.get_model_output()
 
-    def _make_Accelerometers(self, verbose=False):
+    def _make_devices(self, collection, verbose=False):
         """
-        generate the accel objects
+        generate the models of a collection of devices
+        :param collection: name of the collection in the device registry
         :return: None
         """
+        self._devices[collection] = {}
         if "Devices" in self.data_dict:
-            sensors = self.data_dict["Devices"]
-            keys = self._filter_dict(sensors, 'Accel')
-            if len(keys) > 0:
-                for key in keys:
-                    self._accels[self._filter_number(key)] = Accel.Accel(key, sensors[key])
-                if verbose:
-                    print("Accel models generated")
-            elif verbose:
-                print("No Accels")
+            self._devices[collection] = Devices.find_devices(self.data_dict["Devices"], collection,
+                                                                 dtype=self._dtype)
+            self._set_device_rates(self._devices[collection])
+            if verbose:
+                if len(self._devices[collection]) > 0:
+                    self._log(collection + " models generated")
+                else:
+                    self._log("No " + collection)
         elif verbose:
-            print("A scan for Accels found no Devices")
+            self._log("A scan for " + collection + " found no Devices")
 
     def open_file(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1,
                         sanitize=True):
@@ -387,24 +410,185 @@ class Vicon(MocapBase.MocapBase):
         :return: dictionary of the sensors
         :rtype: dict
         """
+        if self._store is not None:
+            return self._open_store(file_path, verbose=verbose, interpolate=interpolate, maxnanstotal=maxnanstotal,
+                                    maxnansrow=maxnansrow, sanitize=sanitize)
+
         # open the file and get the column names, axis, and units
         if verbose:
-            print("Reading data from file " + file_path)
-        with open(file_path, mode='r') as csv_file:
-            reader = csv.reader(csv_file)
-            raw_data = list(reader)
+            self._log("Reading data from file " + file_path)
+        with self._instrumentation.stage("read file", file_path=file_path):
+            with open(file_path, mode='r') as csv_file:
+                reader = csv.reader(csv_file)
+                raw_data = list(reader)
 
         # output_names = ["Devices", "Joints", "Model Outputs", "Segments", "Trajectories"]
         data = {}
-        names, segs = self._seperate_csv_sections(raw_data)
+        with self._instrumentation.stage("split sections"):
+            names, segs = self._seperate_csv_sections(raw_data)
 
         for index, output in enumerate(names):
-            data[output] = self._extract_values(raw_data, segs[index], segs[index + 1], verbose=verbose,
-                                                category=output, interpolate=interpolate, maxnanstotal=maxnanstotal,
-                                                maxnansrow=maxnansrow, sanitize=sanitize)
+            with self._instrumentation.stage("extract " + output, category=output):
+                data[output] = self._extract_values(raw_data, segs[index], segs[index + 1], verbose=verbose,
+                                                    category=output, interpolate=interpolate,
+                                                    maxnanstotal=maxnanstotal, maxnansrow=maxnansrow,
+                                                    sanitize=sanitize)
 
         return data
 
+    def _open_store(self, file_path, verbose=False, interpolate=True, maxnanstotal=-1, maxnansrow=-1, sanitize=True):
+        """
+        Open the memory mapped store of a file, converting the file the first time or when it or the settings have
+        changed. data_dict, the nan masks and the models hold views into the arrays of the store, so only the parts
+        that are used are read from the disk.
+        :param file_path: file path
+        :return: dictionary of the sensors
+        :rtype: dict
+        """
+        name = os.path.basename(file_path)
+        store = Storage.Store(os.path.join(self._store, name + "-" +
+                                           hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]))
+        stat = os.stat(file_path)
+        source = {"size": stat.st_size, "mtime": stat.st_mtime}
+        settings = {"version": STORE_VERSION, "interpolate": interpolate, "maxnanstotal": maxnanstotal,
+                    "maxnansrow": maxnansrow, "sanitize": sanitize, "dtype": np.dtype(self._dtype).str,
+                    "marker_interpolation": self.my_marker_interpolation.__module__ + "." +
+                                            self.my_marker_interpolation.__name__}
+        index = store.index
+        if index is None or index["source"] != source or index["settings"] != settings:
+            with self._instrumentation.stage("convert", file_path=file_path, store=store.directory):
+                index = self._convert_store(file_path, store, source, settings, verbose)
+        elif verbose:
+            self._log("Opening the store of " + file_path + " in " + store.directory)
+
+        data = {}
+        for category, info in index["categories"].items():
+            columns = [tuple(column) for column in info["columns"]]
+            values = store.open(category)
+            nans = store.open(category + ".nans")
+            data[category] = {}
+            self._nan_dict[category] = {}
+            for row, (subject, field) in enumerate(columns):
+                data[category].setdefault(subject, {})[field] = {"data": values[row], "unit": info["units"][row]}
+                self._nan_dict[category].setdefault(subject, {})[field] = nans[row]
+            self._arrays[category] = (columns, values)
+            self._sample_rates[category] = info["rate"]
+            self._timebase[category] = {"frame": store.open(category + ".frames"),
+                                        "sub_frame": store.open(category + ".sub_frames")}
+        self._sanitized = index["sanitized"]
+        return data
+
+    def _convert_store(self, file_path, store, source, settings, verbose=False):
+        """
+        Convert a file to a store without holding the file in memory. The file is read twice, once to find the
+        sections and once to copy a chunk of rows at a time into the arrays of the store, then the missing values
+        of each field are interpolated a chunk at a time.
+        :param file_path: file path
+        :param store: Storage.Store to write to
+        :param source: size and modification time of the file
+        :param settings: the settings the trial is read with
+        :return: the index of the store
+        :rtype: dict
+        """
+        if verbose:
+            self._log("Converting " + file_path + " to a store in " + store.directory)
+        store.index = None
+        sections = _scan_sections(file_path)
+        index = {"source": source, "settings": settings, "categories": {}, "sanitized": {}}
+        arrays = {}
+        for section in sections:
+            names, axes, units = section["header"][1:4]
+            remove_numbers = lambda str: ''.join([i for i in str if not i.isdigit()])
+            fields = _header_fields(fix_col_names(names), list(map(remove_numbers, axes)), units)
+            samples = section["rows"]
+            arrays[section["category"]] = (fields, store.create(section["category"], (len(fields), samples), self._dtype),
+                                           store.create(section["category"] + ".nans", (len(fields), samples), bool),
+                                           store.create(section["category"] + ".frames", (samples,), np.int64),
+                                           store.create(section["category"] + ".sub_frames", (samples,), np.int64))
+            index["categories"][section["category"]] = {"rate": self._parse_rate(section["header"][0]),
+                                                        "columns": [[subject, field] for subject, field, _, _ in fields],
+                                                        "units": [unit for _, _, _, unit in fields],
+                                                        "samples": samples}
+
+        with self._instrumentation.stage("read values"):
+            with open(file_path, newline="") as f:
+                for section, lines in _section_chunks(f, sections, self._chunk_size):
+                    fields, values, nans, frames, sub_frames = arrays[section["category"]]
+                    position = lines[0]
+                    rows = _read_rows(lines[1], section["header"])
+                    stop = position + len(rows)
+                    columns = [column for _, _, column, _ in fields]
+                    values[:, position:stop] = rows[:, columns].T
+                    nans[:, position:stop] = np.isnan(rows[:, columns].T)
+                    frames[position:stop] = rows[:, 0]
+                    sub_frames[position:stop] = np.nan_to_num(rows[:, 1])
+
+        for category, (fields, values, nans, frames, sub_frames) in arrays.items():
+            with self._instrumentation.stage("interpolation " + category, category=category):
+                index["sanitized"].update(self._interpolate_store(category, fields, values, nans, verbose, **settings))
+            for array in (values, nans, frames, sub_frames):
+                if isinstance(array, np.memmap):
+                    array.flush()
+        store.index = index
+        return index
+
+    def _interpolate_store(self, category, fields, values, nans, verbose=False, interpolate=True, maxnanstotal=-1,
+                           maxnansrow=-1, sanitize=True, **settings):
+        """
+        Interpolate the fields of a category of a store in place, with the same rules as _extract_values
+        :return: the sanitized subjects of the category, if any
+        :rtype: dict
+        """
+        sanitized = []
+        subjects = {}
+        for row, (subject, field, _, _) in enumerate(fields):
+            subjects.setdefault(subject, []).append((row, field))
+        for subject, rows in subjects.items():
+            names = [field for _, field in rows]
+            marker = category == "Trajectories" and "Magnitude( X )" not in names and "Count" not in names
+            for row, field in rows:
+                missing = np.asarray(nans[row])
+                total = int(missing.sum())
+                allowed = not (-1 < maxnanstotal < total) and not (-1 < maxnansrow < _longest_run(missing))
+                if 0 < total < len(missing) and allowed:
+                    if interpolate and not marker:
+                        if verbose:
+                            self._log("Interpolating missing values in field " + field + ", in subject " + subject +
+                                      ", in category " + category + "...")
+                        Interpolation.akmia_chunks(values[row], self._chunk_size, verbose=verbose, category=category,
+                                                   sub_key=field, key=subject)
+                    continue
+                if total == len(missing):
+                    if verbose:
+                        self._log("Could not interpolate field " + field + ", in subject " + subject +
+                                  ", in category " + category + ", as all values were nans!")
+                    if sanitize and field != "":
+                        values[row] = 0
+                        if subject not in sanitized:
+                            sanitized.append(subject)
+                nans[row] = False
+            if marker:
+                # the marker interpolation method works on whole fields, a marker at the frame rate fits in memory
+                trajectory = {subject: {field: {"data": np.array(values[row], dtype=np.float64)} for row, field in rows}}
+                self.my_marker_interpolation(trajectory).interpolate(verbose)
+                for row, field in rows:
+                    values[row] = trajectory[subject][field]["data"]
+        return {category: sanitized} if sanitized else {}
+
+    def iter_category(self, category, size, overlap=0):
+        """
+        Go through a category a chunk of samples at a time. The chunks are views, so with a store only the
+        chunk being used is read from the disk.
+        :param category: name of the category
+        :param size: number of samples in each chunk
+        :param overlap: samples to add on both sides of each chunk, for filters that need them
+        :return: the (subject, field) of each column, and a generator of Storage.Chunk whose values are indexed by
+                 [sample, column]
+        :rtype: list, generator
+        """
+        columns, values = self.get_category_array(category, dtype=np.dtype(self._dtype))
+        return columns, Storage.chunks(values, size, before=overlap, after=overlap)
+
     def _seperate_csv_sections(self, all_data):
         """"""
 
@@ -431,55 +615,7 @@ class Vicon(MocapBase.MocapBase):
         return fitlered_col, inx
 
     def _fix_col_names(self, names):
-        fixed_names = []
-        get_index = lambda x: x.index("Sensor") + 7
-
-        for name in names:  # type: str
-
-            # if "Subject".upper() in name.upper():
-            #     fixed = ''.join(
-            #         [i for i in name.replace("Subject", "").replace(":", "").replace("|", "") if
-            #          not i.isdigit()]).strip()
-            #     fixed_names.append(fixed)
-
-            if ":" in name:
-
-                index = name.index(":")
-
-                fixed_names.append(name[index + 1:])
-
-            elif "AMTI" in name:
-
-                if "Force" in name:
-                    unit = "_Force_"
-                elif "Moment" in name:
-                    unit = "_Moment_"
-                elif "CoP" in name:
-                    unit = "_CoP_"
-
-                number = name[name.find('#') + 1]
-                fixed = "Force_Plate_" + unit + str(number)
-                fixed_names.append(fixed)
-
-            elif "Trigno EMG" in name:
-                fixed = "T_EMG_" + name[-1]
-                fixed_names.append(fixed)
-
-            elif "Accelerometers" in name:
-                fixed = "Accel_" + name[get_index(name):]
-                fixed_names.append(fixed)
-
-            elif "IMU AUX" in name:
-                fixed = "IMU_" + name[get_index(name):]
-                fixed_names.append(fixed)
-
-            elif "IMU EMG" in name:
-                fixed = "EMG_" + name[get_index(name):]
-                fixed_names.append(fixed)
-            else:
-                fixed_names.append(name)
-
-        return fixed_names
+        return fix_col_names(names)
 
     def _extract_values(self, raw_data, start, end, verbose=False, category="", interpolate=True, maxnanstotal=-1,
                         maxnansrow=-1, sanitize=True):
@@ -495,21 +631,18 @@ class Vicon(MocapBase.MocapBase):
 
         axis = list(map(remove_numbers, raw_data[start + 3]))
         unit = raw_data[start + 4]
+        self._sample_rates[category] = self._parse_rate(raw_data[start + 1])
+        frames = []
+        sub_frames = []
 
         # Build the dict to store everything
-        for index, name in enumerate(column_names):
-            if index <= 1 or index >= len(axis):
-                continue
-            else:
-                if len(name) > 0:
-                    current_name = name
-
-                    data[current_name] = {}
-                dir = axis[index]
-                indices[(current_name, dir)] = index
-                data[current_name][dir] = {}
-                data[current_name][dir]["data"] = []
-                data[current_name][dir]["unit"] = unit[index]
+        for current_name, dir, index, field_unit in _header_fields(column_names, axis, unit):
+            if current_name not in data:
+                data[current_name] = {}
+            indices[(current_name, dir)] = index
+            data[current_name][dir] = {}
+            data[current_name][dir]["data"] = []
+            data[current_name][dir]["unit"] = field_unit
 
         # Put all the data in the correct sub dictionary.
 
@@ -524,108 +657,121 @@ class Vicon(MocapBase.MocapBase):
         # naninfo[subject][field]["interpolate"] is a boolean value that determines if that field can be interpolated
         # according to the rules set by the user
         naninfo = {}
-        for row in raw_data[start + 5:end - 1]:
-
-            frame = int(row[0])
-
-            for key, value in data.items():
-                if key not in naninfo:
-                    naninfo[key] = {}
-                for sub_key, sub_value in value.items():
-                    if sub_key not in naninfo[key]:
-                        naninfo[key][sub_key] = {"total": 0, "row": 0, "rowtemp": 0}
-                    index = indices[(key, sub_key)]
-                    if index >= len(row) or row[index] == '' or str(row[index]).lower() == "nan":
-                        val = np.nan
-                        naninfo[key][sub_key]["total"] += 1
-                        naninfo[key][sub_key]["rowtemp"] += 1
-                    elif '!' in row[index]:
-                        if naninfo[key][sub_key]["rowtemp"] > naninfo[key][sub_key]["row"]:
-                            naninfo[key][sub_key]["row"] = naninfo[key][sub_key]["rowtemp"]
-                        naninfo[key][sub_key]["rowtemp"] = 0
-                        val = float(row[index][1:])
-                        if verbose and (key, sub_key) not in flags:
-                            print("Reading previously interpolated data in category " + category + \
-                                  ", subject " + key + ", field " + sub_key + ".")
-                            flags.append((key, sub_key))
-                    else:
-                        if naninfo[key][sub_key]["rowtemp"] > naninfo[key][sub_key]["row"]:
-                            naninfo[key][sub_key]["row"] = naninfo[key][sub_key]["rowtemp"]
-                        naninfo[key][sub_key]["rowtemp"] = 0
-                        val = float(row[index])
-                    sub_value["data"].append(val)
-
-        for subject, fields in naninfo.items():
-            for field, info in fields.items():
-                if info["rowtemp"] > info["row"]:
-                    # In fields where the last value is nan, the above loop doesn't properly set info["row"]
-                    info["row"] = info["rowtemp"]
-                if -1 < maxnanstotal < info["total"]:
-                    info["interpolate"] = False
-                    if verbose:
-                        if field == "":
-                            print("Field [Blank Name] in subject " + subject + " has " + str(info["total"]) +
-                                  " nans, which violates the max nans rule of " + str(maxnanstotal) + " nans. [Blank " +
-                                  " Name] will not be interpolated!")
-                        else:
-                            print("Field " + field + " in subject " + subject + " has " + str(info["total"]) +
-                                  " nans, which violates the max nans rule of " + str(maxnanstotal) + " nans. " +
-                                  field + " will not be interpolated!")
-                elif -1 < maxnansrow < info["row"]:
-                    info["interpolate"] = False
-                    if verbose:
-                        if field == "":
-                            print("Field [Blank Name] in subject " + subject + " has " + str(info["row"]) +
-                                  " nans in a row, which violates the max nans in a row rule of " +
-                                  str(maxnansrow) + " nans in a row. [Blank Name] will not be interpolated!")
+        with self._instrumentation.stage("read values " + category, category=category):
+            for row in raw_data[start + 5:end - 1]:
+
+                frame = int(row[0])
+                frames.append(frame)
+                sub_frames.append(int(row[1]) if len(row) > 1 and row[1].isdigit() else 0)
+
+                for key, value in data.items():
+                    if key not in naninfo:
+                        naninfo[key] = {}
+                    for sub_key, sub_value in value.items():
+                        if sub_key not in naninfo[key]:
+                            naninfo[key][sub_key] = {"total": 0, "row": 0, "rowtemp": 0}
+                        index = indices[(key, sub_key)]
+                        if index >= len(row) or row[index] == '' or str(row[index]).lower() == "nan":
+                            val = np.nan
+                            naninfo[key][sub_key]["total"] += 1
+                            naninfo[key][sub_key]["rowtemp"] += 1
+                        elif '!' in row[index]:
+                            if naninfo[key][sub_key]["rowtemp"] > naninfo[key][sub_key]["row"]:
+                                naninfo[key][sub_key]["row"] = naninfo[key][sub_key]["rowtemp"]
+                            naninfo[key][sub_key]["rowtemp"] = 0
+                            val = float(row[index][1:])
+                            if verbose and (key, sub_key) not in flags:
+                                self._log("Reading previously interpolated data in category " + category + \
+                                          ", subject " + key + ", field " + sub_key + ".")
+                                flags.append((key, sub_key))
                         else:
-                            print("Field " + field + " in subject " + subject + " has " + str(info["row"]) +
-                                  " nans in a row, which violates the max nans in a row rule of " +
-                                  str(maxnansrow) + " nans in a row. " + field + " will not be interpolated!")
-                else:
-                    info["interpolate"] = True
+                            if naninfo[key][sub_key]["rowtemp"] > naninfo[key][sub_key]["row"]:
+                                naninfo[key][sub_key]["row"] = naninfo[key][sub_key]["rowtemp"]
+                            naninfo[key][sub_key]["rowtemp"] = 0
+                            val = float(row[index])
+                        sub_value["data"].append(val)
+
+        with self._instrumentation.stage("nan analysis " + category, category=category):
+            for subject, fields in naninfo.items():
+                for field, info in fields.items():
+                    if info["rowtemp"] > info["row"]:
+                        # In fields where the last value is nan, the above loop doesn't properly set info["row"]
+                        info["row"] = info["rowtemp"]
+                    if -1 < maxnanstotal < info["total"]:
+                        info["interpolate"] = False
+                        if verbose:
+                            if field == "":
+                                self._log("Field [Blank Name] in subject " + subject + " has " + str(info["total"]) +
+                                          " nans, which violates the max nans rule of " + str(maxnanstotal) + " nans. [Blank " +
+                                          " Name] will not be interpolated!")
+                            else:
+                                self._log("Field " + field + " in subject " + subject + " has " + str(info["total"]) +
+                                          " nans, which violates the max nans rule of " + str(maxnanstotal) + " nans. " +
+                                          field + " will not be interpolated!")
+                    elif -1 < maxnansrow < info["row"]:
+                        info["interpolate"] = False
+                        if verbose:
+                            if field == "":
+                                self._log("Field [Blank Name] in subject " + subject + " has " + str(info["row"]) +
+                                          " nans in a row, which violates the max nans in a row rule of " +
+                                          str(maxnansrow) + " nans in a row. [Blank Name] will not be interpolated!")
+                            else:
+                                self._log("Field " + field + " in subject " + subject + " has " + str(info["row"]) +
+                                          " nans in a row, which violates the max nans in a row rule of " +
+                                          str(maxnansrow) + " nans in a row. " + field + " will not be interpolated!")
+                    else:
+                        info["interpolate"] = True
 
-        for key, value in data.items():  # For every subject in the data...
+        with self._instrumentation.stage("interpolation " + category, category=category):
+            for key, value in data.items():  # For every subject in the data...
 
-            # prepare the data for the interpolate.
-            #ingnore if it is the marker data, use the custom function set by the user
-            if category == "Trajectories" and not ("Magnitude( X )" in value.keys()) and not ("Count" in value.keys()):
+                # prepare the data for the interpolate.
+                #ingnore if it is the marker data, use the custom function set by the user
+                if category == "Trajectories" and not ("Magnitude( X )" in value.keys()) and not ("Count" in value.keys()):
 
-                self._prepare_interpolation(value, key, naninfo, category, False, sanitize, verbose)
-            else:
-                self._prepare_interpolation(value, key, naninfo, category, interpolate, sanitize, verbose)
+                    self._prepare_interpolation(value, key, naninfo, category, False, sanitize, verbose)
+                else:
+                    self._prepare_interpolation(value, key, naninfo, category, interpolate, sanitize, verbose)
+
+            if category == "Trajectories":
+                my_interpolate = self.my_marker_interpolation(data)
+                my_interpolate.interpolate(verbose)
 
-        if category == "Trajectories":
-            my_interpolate = self.my_marker_interpolation(data)
-            my_interpolate.interpolate(verbose)
+        # interpolation is done on the lists in double precision, then the category is stored once in self._dtype
+        self._arrays[category] = Storage.pack(data, self._dtype)
 
+        self._timebase[category] = {"frame": np.asarray(frames, dtype=np.int64),
+                                    "sub_frame": np.asarray(sub_frames, dtype=np.int64)}
         return data
 
+    def _parse_rate(self, row):
+        """
+        read the sample rate from the row under the name of a category
+        :param row: the row of the csv
+        :return: the rate in Hz, or None if there is no rate
+        """
+        return _parse_rate(row)
+
     def save(self, filename=None, verbose=False, mark_interpolated=True):
+        self._check_raw()
         file_path = self._file_path
         if filename is not None:
             file_path = filename
         if verbose and mark_interpolated:
-            print("Saving data to " + file_path + ". Interpolated values will be marked with '!'.")
+            self._log("Saving data to " + file_path + ". Interpolated values will be marked with '!'.")
         if verbose and not mark_interpolated:
-            print("Saving data to " + file_path + ". Interpolated values will not be marked.")
-        with open(file_path, "wb") as f:
-            f.seek(0)
-            f.truncate()
+            self._log("Saving data to " + file_path + ". Interpolated values will not be marked.")
+        with open(file_path, "w", newline="") as f:
             writer = csv.writer(f)
             for category, subjects in self.data_dict.items():  # for every category in the data...
                 if verbose:
-                    print("Saving category " + category + "...")
+                    self._log("Saving category " + category + "...")
                 #  write the header
                 writer.writerow([category])
-                if category == "Devices":
-                    writer.writerow([1000])  # Devices section has 1000 (units??) framerate
-                else:
-                    writer.writerow([100])  # unlike all other sections, with 100 framerate
-                # writer.writerow(["", ""])
+                writer.writerow([self._sample_rates[category]])
 
                 line = ["", ""]
-                for subject, fields in subjects.iteritems():  # for every subject...
+                for subject, fields in subjects.items():  # for every subject...
                     line.append(subject)
                     if len(fields) > 1:  # if the subject has at least two fields...
                         for i in range(len(fields) - 1):
@@ -633,29 +779,24 @@ class Vicon(MocapBase.MocapBase):
                 writer.writerow(line)
 
                 line = ["Frame", "Sub Frame"]
-                for subject, fields in subjects.iteritems():
-                    for field, f_vals in fields.iteritems():
+                for subject, fields in subjects.items():
+                    for field, f_vals in fields.items():
                         line.append(field)  # add name of each field
                 writer.writerow(line)
 
                 line = ["", ""]
-                for subject, fields in subjects.iteritems():
-                    for field, f_vals in fields.iteritems():
+                for subject, fields in subjects.items():
+                    for field, f_vals in fields.items():
                         line.append(f_vals["unit"])  # add unit for each field
                 writer.writerow(line)
 
                 #  Time to write the data!
+                frames, sub_frames = self.get_timebase(category)
                 for i in range(self._len_data(category)):
-                    if category == "Devices":
-                        frame = (i / 10) + 1
-                        sub = i % 10
-                    else:
-                        frame = i + 1
-                        sub = 0
-                    line = [frame, sub]
+                    line = [frames[i], sub_frames[i]]
 
-                    for subject, fields in subjects.iteritems():
-                        for field, f_vals in fields.iteritems():
+                    for subject, fields in subjects.items():
+                        for field, f_vals in fields.items():
                             x = f_vals["data"][i]
                             if mark_interpolated and self._nan_dict[category][subject][field][i]:
                                 x = "!" + str(x)
@@ -665,10 +806,23 @@ class Vicon(MocapBase.MocapBase):
                     writer.writerow(line)
                 writer.writerow(["", ""])
         if verbose:
-            print("Saved!")
+            self._log("Saved!")
 
     def __eq__(self, other):
-        return isinstance(other, Vicon) and self.data_dict == other.data_dict
+        if not isinstance(other, Vicon) or self.data_dict.keys() != other.data_dict.keys():
+            return False
+        for category, subjects in self.data_dict.items():
+            if subjects.keys() != other.data_dict[category].keys():
+                return False
+            for subject, fields in subjects.items():
+                other_fields = other.data_dict[category][subject]
+                if fields.keys() != other_fields.keys():
+                    return False
+                for field, f_vals in fields.items():
+                    if f_vals["unit"] != other_fields[field]["unit"] or \
+                            not np.array_equal(f_vals["data"], other_fields[field]["data"], equal_nan=True):
+                        return False
+        return True
 
     def find_ineq(self, other):
         """
@@ -683,11 +837,13 @@ class Vicon(MocapBase.MocapBase):
             if category not in other.data_dict:
                 print("Category " + category + " missing!")
                 flag = True
-            for subject, fields in subjects.iteritems():
+                continue
+            for subject, fields in subjects.items():
                 if subject not in other.data_dict[category]:
                     print("Subject " + subject + " in category " + category + " missing!")
                     flag = True
-                for field, f_vals in fields.iteritems():
+                    continue
+                for field, f_vals in fields.items():
                     if field not in other.data_dict[category][subject]:
                         flag = True
                         print("Field " + field + " of subject " + subject + " in category " + category + " missing!")
@@ -695,11 +851,13 @@ class Vicon(MocapBase.MocapBase):
                         flag = True
                         print("Data length mismatch in field " + field \
                               + " of subject " + subject + " in category " + category + "!")
-                    elif set(f_vals["data"]) != set(other.data_dict[category][subject][field]["data"]):
+                    elif not np.array_equal(np.sort(f_vals["data"]),
+                                            np.sort(other.data_dict[category][subject][field]["data"]), equal_nan=True):
                         flag = True
                         print("Data mismatch in field " + field \
                               + " of subject " + subject + " in category " + category + "!")
-                    elif f_vals["data"] != other.data_dict[category][subject][field]["data"]:
+                    elif not np.array_equal(f_vals["data"], other.data_dict[category][subject][field]["data"],
+                                            equal_nan=True):
                         flag = True
                         print("Data order mismatch in field " + field \
                               + " of subject " + subject + " in category " + category + "!")
@@ -713,6 +871,158 @@ class Vicon(MocapBase.MocapBase):
             print("No differences detected!")
 
 
+# Changing the layout of the store makes the old stores be converted again
+STORE_VERSION = 1
+
+
+def _parse_rate(row):
+    """
+    read the sample rate from the row under the name of a category
+    :param row: the row of the csv
+    :return: the rate in Hz, or None if there is no rate
+    """
+    try:
+        rate = float(row[0])
+    except (IndexError, ValueError):
+        return None
+    return int(rate) if rate.is_integer() else rate
+
+
+def _header_fields(names, axes, units):
+    """
+    Find the fields of a section from its header
+    :param names: the row of fixed subject names
+    :param axes: the row of field names
+    :param units: the row of units
+    :return: the subject, field, column and unit of every field
+    :rtype: list
+    """
+    fields = []
+    current_name = None
+    for index, name in enumerate(names):
+        if index <= 1 or index >= len(axes):
+            continue
+        if len(name) > 0:
+            current_name = name
+        fields.append((current_name, axes[index], index, units[index] if index < len(units) else ""))
+    return fields
+
+
+def _scan_sections(file_path):
+    """
+    Find the sections of a file without holding it in memory
+    :param file_path: file path
+    :return: the "category", the "header" rows under its name, the line of the first row of data as "start" and the
+             number of "rows" of each section, in the order of the file
+    :rtype: list
+    """
+    sections = []
+    section = None
+    header = 0
+    with open(file_path, newline="") as f:
+        for number, line in enumerate(f):
+            first = line.split(",", 1)[0].strip().lstrip("\ufeff")
+            if header > 0:
+                section["header"].append(next(csv.reader([line])))
+                header -= 1
+                if header == 0:
+                    section["start"] = number + 1
+            elif section is not None and "start" in section and first.isdigit():
+                section["rows"] += 1
+            elif first != "" and not first.isdigit() and first != "Frame":
+                section = {"category": first, "header": [], "rows": 0}
+                sections.append(section)
+                header = 4
+    sections = [section for section in sections if "start" in section]
+    names = [section["category"] for section in sections]
+    if "Devices" in names:
+        sections = sections[names.index("Devices"):]
+    return sections
+
+
+def _section_chunks(f, sections, size):
+    """
+    Read the rows of data of each section a chunk at a time
+    :param f: the open file
+    :param sections: the sections from _scan_sections
+    :param size: number of rows in each chunk
+    :return: generator of the section, and the sample of the first row with the lines of the chunk
+    """
+    sections = iter(sections)
+    section = next(sections, None)
+    lines = []
+    position = 0
+    for number, line in enumerate(f):
+        while section is not None and number >= section["start"] + section["rows"]:
+            if lines:
+                yield section, (position, lines)
+            lines = []
+            position = 0
+            section = next(sections, None)
+        if section is None:
+            break
+        if number < section["start"]:
+            continue
+        lines.append(line)
+        if len(lines) == size:
+            yield section, (position, lines)
+            position += len(lines)
+            lines = []
+    if section is not None and lines:
+        yield section, (position, lines)
+
+
+def _read_rows(lines, header):
+    """
+    Parse rows of data of a section. Values marked as interpolated with a "!" are read as they are.
+    :param lines: the lines of the rows
+    :param header: the header rows of the section, see _scan_sections
+    :return: the rows indexed by [sample, column], missing values are nan
+    :rtype: np.array
+    """
+    return pandas.read_csv(io.StringIO("".join(lines).replace("!", "")), header=None,
+                           names=range(max(len(header[1]), len(header[2]), 2)), dtype=np.float64).to_numpy()
+
+
+def _longest_run(mask):
+    """
+    :param mask: bool array
+    :return: the length of the longest run of True
+    :rtype: int
+    """
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return int((np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max())
+
+
+def fix_col_names(names):
+    """
+    Give the subjects in a CSV header the names used in data_dict, ex: "subject:RKNEE" -> "RKNEE"
+    :param names: the row of subject names
+    :return: the fixed names
+    :rtype: list
+    """
+    fixed_names = []
+    device_names = Devices.classify_header(names)
+
+    for name, device_name in zip(names, device_names):  # type: str
+
+        if ":" in name:
+
+            index = name.index(":")
+
+            fixed_names.append(name[index + 1:])
+
+        elif device_name is not None:
+            fixed_names.append(device_name)
+
+        else:
+            fixed_names.append(name)
+
+    return fixed_names
+
+
 if __name__ == '__main__':
     file = "/home/nathaniel/AIM_GaitData/Gaiting_stairs/subject_08/subject_08_walking_01.csv"
     data = Vicon(file)
@@ -0,0 +1,36 @@
+"""
+Known answer checks of the joint centers, on the synthetic trials of Vicon.Examples.benchmark
+
+    python -m pytest tests
+"""
+import pytest
+
+from Vicon.Examples import benchmark
+
+
+@pytest.mark.parametrize("frames", [300, 500])
+def test_joint_centers(tmp_path, frames):
+    results, hip_error, knee_error = benchmark.run(str(tmp_path), frames, memory=False)
+    assert hip_error < benchmark.HIP_TOLERANCE
+    assert knee_error < benchmark.KNEE_TOLERANCE
+
+
+@pytest.mark.parametrize("frames", [300, 500])
+def test_hip_center_with_skewed_clusters(tmp_path, frames):
+    results, hip_error, knee_error = benchmark.run(str(tmp_path), frames, memory=False, layout="skewed")
+    assert hip_error < benchmark.HIP_TOLERANCE
+
+
+@pytest.mark.xfail(strict=True, reason="the hinge solver assumes orthonormal frames, with the skewed clusters the "
+                                       "knee is more than 100 mm from its axis")
+def test_knee_axis_with_skewed_clusters(tmp_path):
+    results, hip_error, knee_error = benchmark.run(str(tmp_path), 300, memory=False, layout="skewed")
+    assert knee_error < benchmark.KNEE_TOLERANCE
+
+
+def test_stages_are_timed(tmp_path):
+    results = benchmark.run(str(tmp_path), 200, memory=False)[0]
+    names = [name for name, wall, cpu, peak in results]
+    assert names == ["open_file", "interpolation", "make_markers", "smart_sort", "auto_make_frames", "calc_joints",
+                     "save"]
+    assert all(wall >= 0 and cpu >= 0 for name, wall, cpu, peak in results)
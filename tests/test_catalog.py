@@ -0,0 +1,72 @@
+"""
+A catalog of trials that can be searched without opening them
+"""
+import os
+
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap import Catalog
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trials(tmp_path):
+    os.makedirs(str(tmp_path / "a"))
+    Synthetic.generate(str(tmp_path / "a" / "walk.csv"), 60,
+                       gaps=[("Root1", 10, 5), ("Root1", 30, 8)], seed=1)
+    Synthetic.generate(str(tmp_path / "b.csv"), 80, imus=0, subject="Other", seed=2)
+    return tmp_path
+
+
+def test_scan_matches_vicon(trials):
+    path = str(trials / "a" / "walk.csv")
+    sections = Catalog.scan_sections(path, chunk_size=7)
+    trial = Vicon(path, interpolate=False)
+    for category, section in sections.items():
+        assert section["rate"] == trial.get_sample_rate(category)
+        frames, sub_frames = trial.get_timebase(category)
+        np.testing.assert_array_equal(section["frames"], frames)
+        np.testing.assert_array_equal(section["sub_frames"], sub_frames)
+        for (subject, field), unit, values in zip(section["fields"], section["units"], section["data"].T):
+            assert trial.data_dict[category][subject][field]["unit"] == unit
+            np.testing.assert_array_equal(np.isnan(values), trial._nan_dict[category][subject][field])
+    assert sections["Trajectories"]["people"] == ["Sub"]
+
+
+def test_catalog(trials):
+    with Catalog.Catalog(str(trials / "trials.db")) as catalog:
+        assert catalog.update(str(trials)) == 2
+        walk, other = str(trials / "a" / "walk.csv"), str(trials / "b.csv")
+        assert catalog.trials() == [walk, other]
+
+        trial = catalog.get_trial(walk)
+        assert trial["frames"] == 60 and trial["subjects"] == ["Sub"]
+        assert trial["categories"]["Devices"] == (1000, 600)
+        assert trial["devices"]["IMUs"] == [1, 2]
+        # the gaps are counted like Vicon counts them
+        assert trial["fields"]["Trajectories"]["Root1"]["X"] == ("mm", 13, 8)
+        assert trial["fields"]["Trajectories"]["Root2"]["X"] == ("mm", 0, 0)
+
+        assert catalog.find(subject="Other") == [other]
+        assert catalog.find(collections=["IMUs"]) == [walk]
+        assert catalog.find(markers=["Root*"], max_gap=5) == [other]
+        assert catalog.find(markers=["R_Tibia*"], max_nans=0.01) == [walk, other]
+        assert catalog.find(path="*b.csv") == [other]
+
+
+def test_update_only_scans_changed_files(trials):
+    with Catalog.Catalog(str(trials / "trials.db")) as catalog:
+        catalog.update(str(trials))
+        assert catalog.update(str(trials)) == 0
+        # touching a file without changing it doesn't scan it again
+        os.utime(str(trials / "b.csv"), (0, 0))
+        assert catalog.update(str(trials)) == 0
+        Synthetic.generate(str(trials / "b.csv"), 40, seed=3)
+        assert catalog.update(str(trials)) == 1
+        assert catalog.get_trial(str(trials / "b.csv"))["frames"] == 40
+        os.remove(str(trials / "b.csv"))
+        catalog.update(str(trials))
+        assert catalog.trials() == [str(trials / "a" / "walk.csv")]
+        assert catalog.get_trial(str(trials / "b.csv")) is None
@@ -0,0 +1,73 @@
+"""
+Devices found through the registry of device classes
+"""
+import re
+
+import numpy as np
+import pytest
+
+from Vicon.Devices import Devices
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # devices registered by a test are forgotten afterwards
+    monkeypatch.setattr(Devices, "_registry", list(Devices._registry))
+    yield Devices
+    Devices._header_cache.clear()
+    Devices._subject_cache.clear()
+
+
+def test_classify_header():
+    names = ["Imported AMTI OR6 Series Force Plate #2 - CoP", "Delsys Trigno IMU AUX 2.0 #1 - Sensor 3",
+             "Imported Trigno EMG #1 - Sensor 4", "Imported Delsys Trigno IMU EMG 2.0 #1 - Sensor 1", "Other",
+             "Sub:Root1"]
+    fixed = Devices.classify_header(names)
+    assert fixed == ("Force_Plate__CoP_2", "IMU_3", "T_EMG_4", "EMG_1", None, None)
+    assert Devices.classify_header(list(names)) is fixed
+
+
+def test_find_devices_in_a_trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 20, force_plates=2, emgs=1, imus=3, accels=2, seed=1)
+    trial = Vicon(str(tmp_path / "walk.csv"))
+    for collection in ("EMGs", "T_EMGs", "IMUs", "accels", "force_plates", "gyros"):
+        assert collection in Devices.collections()
+    assert {collection: sorted(trial.get_devices(collection)) for collection in Devices.collections()} == \
+        {"EMGs": [1], "T_EMGs": [1], "IMUs": [1, 2, 3], "accels": [1, 2], "force_plates": [1, 2], "gyros": []}
+
+
+def test_subjects_missing_a_channel_are_skipped():
+    sensors = {"IMU_1": {"ACCX1": {}, "ACCY1": {}}, "Accel_2": {"ACCX2": {}, "ACCY2": {}, "ACCZ2": {}}}
+    groups = Devices.classify_subjects(sensors)
+    assert "IMUs" not in groups
+
+
+def test_a_subject_goes_to_one_collection():
+    sensors = {"IMU_1": {"GYROX": {}, "GYROY": {}, "GYROZ": {}},
+               "IMU_2": {"ACCX": {}, "ACCY": {}, "ACCZ": {}, "GYROX": {}, "GYROY": {}, "GYROZ": {}}}
+    groups = Devices.classify_subjects(sensors)
+    assert [number for device, schema, number, keys in groups["IMUs"]] == [2]
+    assert [number for device, schema, number, keys in groups["gyros"]] == [1]
+
+
+def test_register_a_device(registry):
+    @registry.register
+    class Goniometer(registry.Devices):
+
+        columns = ((re.compile(r"Goniometer.*Sensor (?P<number>\d+)"), "Gonio_{number}"),)
+        schemas = (registry.Schema("goniometers", re.compile(r"Gonio_(?P<number>\d+)$"), ("ANGLE",)),)
+
+        def __init__(self, name, sensor):
+            super(Goniometer, self).__init__(name, sensor, "Goniometer")
+
+    assert registry.register(Goniometer) is Goniometer
+    assert registry._registry.count(Goniometer) == 1
+    assert "goniometers" in registry.collections()
+    assert registry.classify_header(["Goniometer #1 - Sensor 2"]) == ("Gonio_2",)
+
+    angle = {"ANGLE": {"data": np.arange(5.0)}}
+    devices = registry.find_devices({"Gonio_2": angle, "Gonio_1": {"OTHER": {}}}, "goniometers")
+    assert list(devices) == [2]
+    assert devices[2].name == "Gonio_2" and devices[2].get_values() is angle
@@ -0,0 +1,57 @@
+"""
+Trials stored in single precision
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trials(tmp_path):
+    path = str(tmp_path / "walk.csv")
+    truth = Synthetic.generate(path, 200, seed=1)
+    return truth, Vicon(path), Vicon(path, dtype=np.float32)
+
+
+def joints(trial):
+    markers = trial.get_markers()
+    markers.smart_sort(filter=False)
+    markers.auto_make_frames()
+    markers.def_joint("hip", "Root", "R_Femur", True)
+    markers.def_joint("knee", "R_Femur", "R_Tibia", False)
+    markers.calc_joints(try_load=False)
+    return {name: np.asarray(markers.get_joint(name), dtype=np.float64) for name in ("hip", "knee")}
+
+
+def test_fields_and_devices_are_single_precision(trials):
+    truth, double, single = trials
+    assert single.dtype == np.float32 and double.dtype == np.float64
+    field = single.data_dict["Trajectories"]["Root1"]["X"]["data"]
+    assert field.dtype == np.float32
+    np.testing.assert_allclose(field, double.data_dict["Trajectories"]["Root1"]["X"]["data"], rtol=1e-6)
+    assert single.get_category_array("Devices", dtype=np.float32)[1].dtype == np.float32
+    assert single.get_force_plate(1).get_force_array().dtype == np.float32
+    assert single.get_imu(1).get_accel_array().dtype == np.float32
+    assert single.get_imu(1).get_gyro_array().dtype == np.float32
+    assert single.EMGs[1].data.dtype == np.float32
+    np.testing.assert_allclose(single.get_force_plate(1).get_force_array(),
+                               double.get_force_plate(1).get_force_array(), rtol=1e-6, atol=1e-4)
+
+
+def test_markers_are_single_precision(trials):
+    truth, double, single = trials
+    names, positions = single.get_markers().query("Root*", filtered=False)
+    assert positions.dtype == np.float32
+    np.testing.assert_allclose(positions, double.get_markers().query("Root*", filtered=False)[1], rtol=1e-6)
+
+
+def test_joints_are_fit_in_double_precision(trials):
+    truth, double, single = trials
+    expected = joints(double)
+    result = joints(single)
+    for name in ("hip", "knee"):
+        assert result[name].dtype == np.float64
+        # only the rounding of the stored positions, well under a millimetre, separates them
+        np.testing.assert_allclose(result[name], expected[name], atol=1e-2)
@@ -0,0 +1,42 @@
+"""
+EMG channels stored as 1D arrays
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 50, emgs=3, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def test_channels_are_1d(trial):
+    assert sorted(trial.EMGs) == [1, 2, 3] and sorted(trial.T_EMGs) == [1, 2, 3]
+    emg = trial.EMGs[1]
+    assert emg.data.shape == (500,) and emg.data.dtype == np.float64
+    assert not emg.data.flags.writeable
+    # the PointArray of the old layout is only built when it is asked for
+    assert emg._sensor is None
+    assert emg.get_values() is emg.sensor
+
+
+def test_emg_matrix_holds_the_channels(trial):
+    channels = [np.array(trial.EMGs[key].data) for key in (1, 2, 3)]
+    keys, matrix = trial.get_emg_matrix()
+    assert keys == [1, 2, 3] and matrix.shape == (3, 500)
+    np.testing.assert_array_equal(matrix, channels)
+    # the channels are rows of the matrix rather than copies of it
+    for row, key in enumerate(keys):
+        assert trial.EMGs[key].data.base is matrix
+    assert trial.get_emg_matrix()[1] is matrix
+
+
+def test_emg_matrix_types(trial):
+    keys, matrix = trial.get_emg_matrix(trigno=True, dtype=np.float32)
+    assert matrix.dtype == np.float32
+    assert trial.T_EMGs[1].data.dtype == np.float32
+    assert trial.get_emg_matrix()[1].dtype == np.float64
@@ -0,0 +1,74 @@
+"""
+EMG envelopes made for every channel at once
+"""
+import numpy as np
+import pytest
+
+from Vicon.Devices.EMGPipeline import EMGPipeline
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+RATE = 1000.0
+
+
+def sines(amplitudes, seconds=2.0, frequency=150.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return np.outer(amplitudes, np.sin(2 * np.pi * frequency * t))
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        EMGPipeline(RATE, envelope="peak")
+    with pytest.raises(ValueError):
+        EMGPipeline(RATE, band=(20.0, 500.0))
+
+
+@pytest.mark.parametrize("envelope, scale", [("lowpass", 2 / np.pi), ("rms", 1 / np.sqrt(2))])
+def test_envelope_of_a_sine(envelope, scale):
+    envelopes = EMGPipeline(RATE, envelope=envelope, mvc=[1.0, 2.0]).process(sines([1.0, 4.0]))
+    middle = envelopes[:, 500:1500]
+    np.testing.assert_allclose(middle, np.broadcast_to([[scale], [2 * scale]], middle.shape), rtol=0.02)
+    unscaled = EMGPipeline(RATE, envelope=envelope, mvc=[1.0, 2.0]).process(sines([1.0, 4.0]), normalize=False)
+    np.testing.assert_allclose(unscaled[1], 2 * envelopes[1])
+
+
+@pytest.mark.parametrize("envelope", ["lowpass", "rms"])
+def test_chunks_match_one_chunk(envelope):
+    pipeline = EMGPipeline(RATE, envelope=envelope)
+    matrix = sines([1.0, 3.0]) + np.random.RandomState(0).normal(0, 0.1, (2, 2000))
+    whole = next(pipeline.process_chunks([matrix]))
+    pieces = np.hstack(list(pipeline.process_chunks(matrix[:, start:start + 300] for start in range(0, 2000, 300))))
+    np.testing.assert_allclose(pieces, whole, atol=1e-9)
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 200, emgs=2, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def test_apply_caches_the_envelopes(trial):
+    pipeline = EMGPipeline(RATE)
+    keys, envelopes = pipeline.apply(trial)
+    assert keys == [1, 2] and envelopes.shape == (2, 2000)
+    np.testing.assert_array_equal(trial.EMGs[2].envelope, envelopes[1])
+    np.testing.assert_allclose(envelopes, pipeline.process(trial.get_emg_matrix()[1]))
+    # the same settings reuse the cached envelopes
+    pipeline.process = None
+    np.testing.assert_array_equal(pipeline.apply(trial)[1], envelopes)
+
+
+def test_apply_in_chunks(trial):
+    pipeline = EMGPipeline(RATE)
+    out = np.zeros((2, 2000))
+    keys, envelopes = pipeline.apply(trial, chunk_size=256, out=out)
+    assert envelopes is out
+    np.testing.assert_allclose(out, next(pipeline.process_chunks([trial.get_emg_matrix()[1]])), atol=1e-9)
+    # the cached envelopes were made by causal filters, so filtering the whole trial makes them again
+    assert not np.allclose(pipeline.apply(trial)[1], out)
+
+
+def test_apply_without_emgs(tmp_path):
+    Synthetic.generate(str(tmp_path / "still.csv"), 50, emgs=0, seed=1)
+    keys, envelopes = EMGPipeline(RATE).apply(Vicon(str(tmp_path / "still.csv")))
+    assert keys == [] and envelopes.shape == (0, 0)
@@ -0,0 +1,90 @@
+"""
+Force plates combined into a single ground reaction force
+"""
+import numpy as np
+
+from Vicon.Devices import ForcePlate
+
+
+def fields(names, values):
+    return {name: {"data": values[:, axis]} for axis, name in enumerate(names)}
+
+
+def plate(force, cop, free, origin=(0.0, 0.0, 0.0)):
+    force = np.asarray(force, dtype=np.float64)
+    cop = np.asarray(cop, dtype=np.float64)
+    # moments about the origin of the plate, as Vicon gives them
+    moment = np.cross(np.nan_to_num(cop) - origin, force)
+    moment[:, 2] += free
+    return ForcePlate.ForcePlate("plate", fields(("Fx", "Fy", "Fz"), force), fields(("Mx", "My", "Mz"), moment),
+                                 fields(("Cx", "Cy", "Cz"), cop))
+
+
+def walk(samples=50, seed=0):
+    rng = np.random.RandomState(seed)
+    force = np.column_stack((rng.normal(0, 30, samples), rng.normal(0, 30, samples), -rng.uniform(100, 800, samples)))
+    cop = np.column_stack((rng.uniform(-200, 200, samples), rng.uniform(-300, 300, samples), np.zeros(samples)))
+    return force, cop, rng.normal(0, 5, samples)
+
+
+def test_one_plate_is_unchanged():
+    force, cop, free = walk()
+    combined = ForcePlate.combine([plate(force, cop, free)])
+    np.testing.assert_allclose(combined["force"], force)
+    np.testing.assert_allclose(combined["CoP"], cop)
+    np.testing.assert_allclose(combined["free_moment"], free, atol=1e-9)
+
+
+def test_two_plates_match_the_total_moment():
+    origins = [(0.0, 0.0, 0.0), (500.0, 0.0, 0.0)]
+    first, second = walk(seed=1), walk(seed=2)
+    second[1][:, 0] += 500.0
+    combined = ForcePlate.combine([plate(*first), plate(*second, origin=origins[1])], origins=origins)
+    force = first[0] + second[0]
+    np.testing.assert_allclose(combined["force"], force)
+    # the combined CoP is weighted by the vertical force on each plate
+    np.testing.assert_allclose(combined["CoP"], (first[1] * first[0][:, 2:] + second[1] * second[0][:, 2:]) /
+                               force[:, 2:])
+    # the total force acting at the combined CoP with the free moment gives the same moment about the origin
+    moment = np.cross(combined["CoP"], force)
+    moment[:, 2] += combined["free_moment"]
+    np.testing.assert_allclose(combined["moment"], moment, atol=1e-6)
+    np.testing.assert_allclose(combined["free_moment"], first[2] + second[2] + (
+        (first[1] - combined["CoP"])[:, 0] * first[0][:, 1] - (first[1] - combined["CoP"])[:, 1] * first[0][:, 0] +
+        (second[1] - combined["CoP"])[:, 0] * second[0][:, 1] - (second[1] - combined["CoP"])[:, 1] * second[0][:, 0]))
+
+
+def test_unloaded_plates_are_ignored():
+    force, cop, free = walk()
+    empty = np.zeros_like(force)
+    empty[:, 2] = 2.0  # noise below the threshold
+    blank = np.full_like(cop, np.nan)
+    combined = ForcePlate.combine([plate(force, cop, free), plate(empty, blank, np.zeros(len(free)))])
+    np.testing.assert_allclose(combined["CoP"], cop)
+    assert not np.isnan(combined["moment"]).any() and not np.isnan(combined["free_moment"]).any()
+
+
+def test_one_unloaded_plate_agrees_with_the_moment():
+    force, cop, free = walk(seed=3)
+    # a plate at heel strike: loaded for the second half, reading noise with a blank CoP before that
+    other_force, other_cop, other_free = walk(seed=4)
+    other_force[:25] = [3.0, -2.0, 4.0]
+    other_cop[:25] = np.nan
+    other_free[:25] = 1.5
+    combined = ForcePlate.combine([plate(force, cop, free), plate(other_force, other_cop, other_free)])
+    np.testing.assert_allclose(combined["force"][:25], force[:25])
+    np.testing.assert_allclose(combined["CoP"][:25], cop[:25])
+    np.testing.assert_allclose(combined["free_moment"][:25], free[:25], atol=1e-9)
+    # the total force acting at the combined CoP with the free moment gives the total moment, loaded or not
+    moment = np.cross(combined["CoP"], combined["force"])
+    moment[:, 2] += combined["free_moment"]
+    np.testing.assert_allclose(combined["moment"], moment, atol=1e-6)
+
+
+def test_no_cop_without_load():
+    force = np.zeros((5, 3))
+    force[:, 2] = [0.0, 5.0, -50.0, 9.0, 0.0]
+    cop = np.tile([10.0, 20.0, 0.0], (5, 1))
+    combined = ForcePlate.combine([plate(force, cop, np.zeros(5))])
+    np.testing.assert_array_equal(np.isnan(combined["CoP"]).all(axis=1), [True, True, False, True, True])
+    np.testing.assert_allclose(combined["CoP"][2], cop[2])
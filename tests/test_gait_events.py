@@ -0,0 +1,67 @@
+"""
+Heel strikes and toe offs found on every force plate at once
+"""
+import numpy as np
+
+from Vicon.Devices import GaitEvents
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+def stances(n, *spans, force=-500.0):
+    fz = np.zeros(n)
+    for first, last in spans:
+        fz[first:last] = force
+    return fz
+
+
+def listed(events):
+    return [(int(e["plate"]), str(e["event"]), int(e["sample"])) for e in events]
+
+
+def test_events_on_every_plate():
+    fz = np.vstack((stances(100, (10, 40), (60, 90)), stances(100, (30, 70))))
+    events = GaitEvents.detect_events(fz, plates=[1, 2], samples_per_frame=10)
+    assert listed(events) == [(1, "heel_strike", 10), (2, "heel_strike", 30), (1, "toe_off", 40),
+                              (1, "heel_strike", 60), (2, "toe_off", 70), (1, "toe_off", 90)]
+    np.testing.assert_array_equal(events["frame"], events["sample"] // 10)
+
+
+def test_stances_at_the_ends_only_have_the_recorded_event():
+    events = GaitEvents.detect_events(stances(100, (0, 20), (80, 100)))
+    assert listed(events) == [(0, "toe_off", 20), (0, "heel_strike", 80)]
+
+
+def test_hysteresis():
+    fz = stances(60, (10, 50), force=100.0)
+    # dips between release and threshold don't end the stance
+    fz[20:25] = 15.0
+    fz[30:32] = 5.0
+    assert listed(GaitEvents.detect_events(fz, threshold=20, release=10)) == \
+        [(0, "heel_strike", 10), (0, "toe_off", 30), (0, "heel_strike", 32), (0, "toe_off", 50)]
+    assert listed(GaitEvents.detect_events(fz, threshold=20)) == \
+        [(0, "heel_strike", 10), (0, "toe_off", 20), (0, "heel_strike", 25), (0, "toe_off", 30),
+         (0, "heel_strike", 32), (0, "toe_off", 50)]
+
+
+def test_short_swings_and_stances_are_cleaned_up():
+    fz = stances(100, (10, 40), (43, 70), (80, 83))
+    assert listed(GaitEvents.detect_events(fz, min_swing=5, min_stance=10)) == \
+        [(0, "heel_strike", 10), (0, "toe_off", 70)]
+
+
+def test_events_of_a_trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 300, seed=1)
+    trial = Vicon(str(tmp_path / "walk.csv"))
+    keys, fz = GaitEvents.get_vertical_forces(trial)
+    assert keys == [1, 2] and fz.shape == (2, 3000)
+    np.testing.assert_array_equal(fz[1], trial.get_force_plate(2).get_force_array()[:, 2])
+    events = GaitEvents.detect_gait_events(trial, min_stance=50)
+    assert len(events) > 0
+    np.testing.assert_array_equal(events, GaitEvents.detect_events(fz, min_stance=50, samples_per_frame=10,
+                                                                   plates=keys))
+
+
+def test_trial_without_plates(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 50, force_plates=0, seed=1)
+    assert len(GaitEvents.detect_gait_events(Vicon(str(tmp_path / "walk.csv")))) == 0
@@ -0,0 +1,62 @@
+"""
+Graphing fields reduced with min/max decimation
+"""
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.MocapBase import minmax_decimate
+from Vicon.Mocap.Vicon import Vicon
+
+
+def test_short_lines_are_kept():
+    x, y = np.arange(10), np.arange(10.0)
+    result = minmax_decimate(x, y, 20)
+    np.testing.assert_array_equal(result[0], x)
+    np.testing.assert_array_equal(result[1], y)
+
+
+def test_minimum_and_maximum_of_each_group():
+    y = np.sin(np.linspace(0, 20, 1000))
+    y[123] = 5.0
+    y[877] = -5.0
+    x, reduced = minmax_decimate(np.arange(1000), y, 100)
+    assert len(reduced) <= 100
+    np.testing.assert_array_equal(reduced, y[x])
+    # the points stay in order and the extremes survive
+    assert np.all(np.diff(x) >= 0)
+    assert 123 in x and 877 in x
+    assert reduced.max() == 5.0 and reduced.min() == -5.0
+
+
+def test_gaps_are_kept():
+    y = np.arange(1000.0)
+    y[300:500] = np.nan
+    x, reduced = minmax_decimate(np.arange(1000), y, 100)
+    assert np.isnan(reduced[(x >= 310) & (x < 490)]).all()
+    assert not np.isnan(reduced[(x < 290) | (x >= 510)]).any()
+
+
+@pytest.fixture
+def trial(tmp_path, monkeypatch):
+    monkeypatch.setattr(plt, "show", lambda: None)
+    Synthetic.generate(str(tmp_path / "gap.csv"), 2000, gaps=[("Root1", 400, 10)], seed=1)
+    yield Vicon(str(tmp_path / "gap.csv"))
+    plt.close("all")
+
+
+def test_graph_is_decimated(trial):
+    trial.graph("Trajectories", "Root1", "X", max_points=200)
+    original, interpolated = plt.gca().get_lines()
+    assert len(original.get_xdata()) <= 200
+    # the interpolated block joins the original data on either side of it
+    frames = interpolated.get_xdata()[~np.isnan(interpolated.get_ydata())]
+    assert frames.min() == 399 and frames.max() == 410
+
+
+def test_graph_limits_show_every_sample(trial):
+    trial.graph("Trajectories", "Root1", "X", limits=(100, 150), max_points=200)
+    assert len(plt.gca().get_lines()[0].get_xdata()) > 50
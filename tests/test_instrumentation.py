@@ -0,0 +1,87 @@
+"""
+Recording the stages of reading and processing trials
+"""
+import pickle
+
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Instrumentation import Instrumentation
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial_path(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 30, seed=1)
+    return str(tmp_path / "walk.csv")
+
+
+def test_nested_stages():
+    events = []
+    instrumentation = Instrumentation(memory=True, callbacks=[events.append])
+    with instrumentation.stage("outer", trial="a"):
+        with instrumentation.stage("inner"):
+            block = bytearray(1000000)
+        del block
+    inner, outer = instrumentation.records
+    assert (inner["name"], inner["depth"], outer["name"], outer["depth"]) == ("inner", 1, "outer", 0)
+    assert outer["info"] == {"trial": "a"}
+    assert inner["peak"] >= 1000000 and outer["peak"] >= inner["peak"]
+    assert outer["wall"] >= inner["wall"] >= 0
+    assert [event["name"] for event in events] == ["inner", "outer"]
+    assert "  inner" in instrumentation.report() and "inner" not in instrumentation.report(max_depth=0)
+    assert set(instrumentation.totals()) == {"inner", "outer"}
+
+
+def test_drained_records_are_kept_in_the_totals():
+    instrumentation = Instrumentation(max_records=2)
+    for _ in range(3):
+        with instrumentation.stage("stage"):
+            pass
+    assert len(instrumentation.records) == 2
+    assert len(instrumentation.drain()) == 2 and instrumentation.records == []
+    assert instrumentation.counts() == {"stage": 3}
+    assert instrumentation.totals()["stage"][0] >= 0
+    instrumentation.reset()
+    assert instrumentation.totals() == {} and instrumentation.counts() == {}
+
+
+def test_messages(capsys):
+    events = []
+    instrumentation = Instrumentation(callbacks=[events.append])
+    instrumentation.message("quiet")
+    instrumentation.message("loud", verbose=True)
+    assert capsys.readouterr().out == "loud\n"
+    assert events == [{"event": "message", "message": "quiet"}, {"event": "message", "message": "loud"}]
+    instrumentation.verbose = True
+    instrumentation.message("everything")
+    assert capsys.readouterr().out == "everything\n"
+
+
+def test_pickled_without_callbacks():
+    instrumentation = Instrumentation(callbacks=[lambda event: None])
+    with instrumentation.stage("stage"):
+        pass
+    copy = pickle.loads(pickle.dumps(instrumentation))
+    assert copy._callbacks == [] and copy.records == instrumentation.records
+
+
+def test_trials_report_their_stages(trial_path):
+    trial = Vicon(trial_path)
+    names = [record["name"] for record in trial.get_report()]
+    assert names[0] == "read file" and names[-1] == "open_file"
+    assert "interpolation Trajectories" in names
+
+
+def test_shared_instrumentation_keeps_verbose_per_trial(trial_path, capsys):
+    events = []
+    shared = Instrumentation(callbacks=[events.append])
+    Vicon(trial_path, verbose=True, instrumentation=shared).get_markers()
+    assert "Reading data from file" in capsys.readouterr().out
+    assert not shared.verbose
+    quiet = Vicon(trial_path, instrumentation=shared)
+    quiet.get_markers()
+    assert capsys.readouterr().out == ""
+    # both trials recorded their stages in the shared instrumentation
+    assert [record["name"] for record in shared.records].count("open_file") == 2
+    assert any(event["event"] == "message" for event in events)
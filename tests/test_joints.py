@@ -0,0 +1,208 @@
+"""
+Joint centers calculated from synthetic trials whose joint centers are known
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Markers import Markers
+from Vicon.Mocap.Vicon import Vicon
+
+def leg(path, frames=200, **params):
+    # the synthetic markers are symmetric about the knee, so its center is known along the axis too
+    truth = Synthetic.generate(str(path), frames, seed=1, **params)
+    markers = Vicon(str(path)).get_markers()
+    markers.smart_sort(filter=False)
+    markers.auto_make_frames()
+    markers.def_joint("hip", "Root", "R_Femur", True)
+    markers.def_joint("knee", "R_Femur", "R_Tibia", False)
+    return truth, markers
+
+
+def joint_error(markers, truth, name):
+    joint = np.asarray(markers.get_joint(name), dtype=np.float64)
+    return np.linalg.norm(joint - truth["joints"][name][:len(joint)], axis=1).max()
+
+
+@pytest.mark.parametrize("local", [Synthetic.ROOT_MARKERS, Synthetic.FEMUR_MARKERS, Synthetic.TIBIA_MARKERS])
+def test_synthetic_frames_are_orthonormal(local):
+    x_axis = local[1] - local[0]
+    y_axis = local[2] - local[0]
+    assert abs(np.dot(x_axis, y_axis)) < 1e-12
+
+
+def test_hinge_joint_center(tmp_path):
+    truth, markers = leg(tmp_path / "leg.csv")
+    markers.calc_joints(try_load=False)
+    assert joint_error(markers, truth, "knee") < 0.1
+    # the joint relative to the parent is still given in the frames of the parent
+    knee = np.asarray(markers.get_joint("knee"), dtype=np.float64)
+    rel = np.asarray(markers.get_joint_rel("knee"), dtype=np.float64).reshape(3)
+    frame = np.asarray(markers.get_frame("R_Femur")[0], dtype=np.float64)
+    np.testing.assert_allclose(frame[:3, :3].dot(rel) + frame[:3, 3], knee[0], atol=0.1)
+
+
+def test_ball_joint_center(tmp_path):
+    truth, markers = leg(tmp_path / "leg.csv")
+    markers.calc_joints(try_load=False)
+    assert joint_error(markers, truth, "hip") < 5.0
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_joints_in_a_pool_match_serial(tmp_path, processes):
+    truth, serial = leg(tmp_path / "leg.csv")
+    serial.calc_joints(try_load=False)
+    pooled = leg(tmp_path / "leg.csv")[1]
+    pooled.calc_joints(try_load=False, workers=2, processes=processes)
+    for name in ("hip", "knee"):
+        np.testing.assert_allclose(np.asarray(pooled.get_joint(name), dtype=np.float64),
+                                   np.asarray(serial.get_joint(name), dtype=np.float64))
+        np.testing.assert_allclose(np.asarray(pooled.get_joint_rel(name), dtype=np.float64),
+                                   np.asarray(serial.get_joint_rel(name), dtype=np.float64))
+
+
+def test_concurrent_pools_keep_their_own_markers(tmp_path):
+    trials = [leg(tmp_path / "still.csv")[1], leg(tmp_path / "noisy.csv", noise=1.0)[1]]
+    serial = [leg(tmp_path / "still.csv")[1], leg(tmp_path / "noisy.csv", noise=1.0)[1]]
+    for markers in serial:
+        markers.calc_joints(try_load=False)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(lambda markers: markers.calc_joints(try_load=False, workers=2, processes=True), trials))
+    for pooled, markers in zip(trials, serial):
+        for name in ("hip", "knee"):
+            np.testing.assert_allclose(pooled.get_joint(name), markers.get_joint(name))
+    assert Markers._joint_source is None
+
+
+def test_joints_are_arrays(tmp_path):
+    markers = leg(tmp_path / "leg.csv")[1]
+    markers.calc_joints()
+    for name in ("hip", "knee"):
+        assert type(markers.get_joint(name)) is np.ndarray and markers.get_joint(name).shape[1] == 3
+        assert type(markers.get_joint_rel(name)) is np.ndarray and markers.get_joint_rel(name).shape == (3, 1)
+        assert type(markers.get_joint_rel_child(name)) is np.ndarray
+        assert markers.get_joint_rel_child(name).shape == (3, 1)
+
+
+def test_no_cache_by_default(tmp_path, monkeypatch):
+    markers = leg(tmp_path / "leg.csv")[1]
+    monkeypatch.setattr(Markers.Markers, "_joint_key", lambda *args: pytest.fail("hashed without a cache_dir"))
+    markers.calc_joints()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["leg.csv"]
+
+
+def test_joints_csv_is_reused(tmp_path, capsys):
+    markers = leg(tmp_path / "leg.csv")[1]
+    markers.calc_joints()
+    markers.save_joints()
+    read = leg(tmp_path / "leg.csv")[1]
+    read.calc_joints(verbose=True)
+    assert "Reading joints from file" in capsys.readouterr().out
+    np.testing.assert_allclose(read.get_joint("knee"), markers.get_joint("knee"), atol=1e-6)
+
+
+def test_strict_joints_csv(tmp_path):
+    markers = leg(tmp_path / "leg.csv")[1]
+    markers.calc_joints()
+    markers.save_joints()
+    saved = tmp_path / "leg-joints.csv"
+    saved.write_text(saved.read_text().replace("R_Tibia", "L_Tibia"))
+    with pytest.raises(ValueError):
+        leg(tmp_path / "leg.csv")[1].calc_joints()
+    read = leg(tmp_path / "leg.csv")[1]
+    read.calc_joints(strict=False)
+    np.testing.assert_allclose(read.get_joint("knee"), markers.get_joint("knee"), atol=1e-6)
+
+
+def test_read_joints_are_arrays(tmp_path):
+    markers = leg(tmp_path / "leg.csv")[1]
+    markers.calc_joints(try_load=False)
+    markers.save_joints()
+    read = leg(tmp_path / "leg.csv")[1]
+    read.read_joints()
+    for name in ("hip", "knee"):
+        for get in ("get_joint", "get_joint_rel", "get_joint_rel_child"):
+            value = getattr(read, get)(name)
+            assert type(value) is np.ndarray
+            np.testing.assert_allclose(value, getattr(markers, get)(name), atol=1e-6)
+
+
+def test_unreadable_cache_entry(tmp_path, capsys):
+    fresh = cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)[0]
+    for entry in (tmp_path / "cache").iterdir():
+        entry.write_bytes(b"not an array")
+    # the joints are calculated again and the entries replaced
+    markers, read = cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert read == []
+    np.testing.assert_array_equal(markers.get_joint("knee"), fresh.get_joint("knee"))
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)[1] == ["hip", "knee"]
+
+
+def test_stopped_write_leaves_no_entry(tmp_path, capsys, monkeypatch):
+    def stopped(f, data):
+        f.write(b"\x93NUMPY")
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(np, "save", stopped)
+        with pytest.raises(KeyboardInterrupt):
+            cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert list((tmp_path / "cache").iterdir()) == []
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)[1] == []
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)[1] == ["hip", "knee"]
+
+
+def memory_mapped(values):
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+
+def cached(path, cache_dir, capsys, window=None, **params):
+    markers = leg(path, **params)[1]
+    if window is not None:
+        markers.filter_window = window
+    markers.calc_joints(cache_dir=str(cache_dir), verbose=True)
+    out = capsys.readouterr().out
+    return markers, [name for name in ("hip", "knee") if "Reading joint " + name in out]
+
+
+def test_cache_hit_is_memory_mapped(tmp_path, capsys):
+    fresh, read = cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert read == []
+    loaded, read = cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert read == ["hip", "knee"]
+    for name in ("hip", "knee"):
+        joint = loaded.get_joint(name)
+        assert type(joint) is type(fresh.get_joint(name))
+        assert memory_mapped(joint)
+        np.testing.assert_array_equal(joint, fresh.get_joint(name))
+        np.testing.assert_array_equal(loaded.get_joint_rel(name), fresh.get_joint_rel(name))
+        np.testing.assert_array_equal(loaded.get_joint_rel_child(name), fresh.get_joint_rel_child(name))
+    # copy on write, so the cache is not changed
+    loaded.get_joint("hip")[0] = 0.0
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)[0].get_joint("hip")[0, 2] != 0.0
+
+
+def test_changed_markers_miss_the_cache(tmp_path, capsys):
+    cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys, noise=0.1)[1] == []
+    # the out of date entries are replaced
+    assert len(list((tmp_path / "cache").iterdir())) == 2
+
+
+def test_changed_filter_window_misses_the_cache(tmp_path, capsys):
+    cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert cached(tmp_path / "leg.csv", tmp_path / "cache", capsys, window=5)[1] == []
+
+
+def test_stale_entries_of_other_joints_are_kept(tmp_path, capsys):
+    other = tmp_path / "cache" / ("hip-" + "a" * 40 + "-b.npy")
+    other.parent.mkdir()
+    other.write_bytes(b"")
+    cached(tmp_path / "leg.csv", tmp_path / "cache", capsys)
+    assert other.exists()
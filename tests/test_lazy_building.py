@@ -0,0 +1,41 @@
+"""
+Markers, model outputs and devices built the first time they are used
+"""
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 50, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def built(trial):
+    return [record["name"] for record in trial.get_report() if record["name"].startswith("make ")]
+
+
+def test_nothing_is_built_when_read(trial):
+    assert built(trial) == []
+
+
+def test_only_what_is_used_is_built(trial):
+    markers = trial.get_markers()
+    assert built(trial) == ["make markers"]
+    assert trial.markers is markers
+    imus = trial.IMUs
+    assert sorted(imus) == [1, 2]
+    assert trial.IMUs is imus
+    trial.get_model_output()
+    trial.get_model_output()
+    assert built(trial) == ["make markers", "make IMUs", "make model"]
+
+
+def test_device_collections_are_built_separately(trial):
+    plate = trial.get_force_plate(1)
+    assert trial.get_force_plate(1) is plate
+    assert built(trial) == ["make force_plates"]
+    trial.get_all_emgs()
+    assert built(trial) == ["make force_plates", "make EMGs"]
@@ -0,0 +1,45 @@
+"""
+Model outputs built on first access
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 100, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def test_nothing_is_built_up_front(trial):
+    model = trial.get_model_output()
+    assert model._arrays == {} and model._joints == {} and model._limbs == {}
+    assert trial.get_model_output() is model
+
+
+def test_get_array(trial):
+    model = trial.get_model_output()
+    angles = model.get_array("R", "Knee", "Angles")
+    output = trial.data_dict["Model Outputs"]["RKneeAngles"]
+    np.testing.assert_array_equal(angles, np.column_stack([output[axis]["data"] for axis in "XYZ"]))
+    assert not angles.flags.writeable
+    assert model.get_array("R", "Knee", "Angles") is angles
+    assert model.get_array("R", "Knee", "Power") is None
+    # arrays don't build joints
+    assert model._joints == {}
+
+
+def test_joints_and_limbs_are_built_once(trial):
+    model = trial.get_model_output()
+    knee = model.get_joint("R", "Knee")
+    assert model.get_joint("R", "Knee") is knee
+    assert list(model._joints) == [("R", "Knee")]
+    leg = model.get_right_leg()
+    assert model.get_right_leg() is leg
+    # the leg reuses the knee that was already built
+    assert set(model._joints) == {("R", "Hip"), ("R", "Knee"), ("R", "Ankle")}
+    assert model.get_joint("R", "Knee") is knee
+    assert list(model._limbs) == ["right_leg"]
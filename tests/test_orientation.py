@@ -0,0 +1,79 @@
+"""
+IMU orientations estimated for every sensor at once
+"""
+import numpy as np
+import pytest
+
+from Vicon.Devices import Orientation
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+RATE = 1000.0
+
+
+def still(accel, samples=2000):
+    return np.zeros((len(accel), samples, 3)), np.repeat(np.asarray(accel, dtype=np.float64)[:, np.newaxis], samples,
+                                                         axis=1)
+
+
+def test_bad_method():
+    with pytest.raises(ValueError):
+        Orientation.OrientationFilter(RATE, method="kalman")
+
+
+@pytest.mark.parametrize("method", ["madgwick", "complementary"])
+def test_still_sensors(method):
+    # level, tilted about x and upside down
+    tilt = np.radians(30)
+    gyro, accel = still([[0, 0, 1], [0, np.sin(tilt), np.cos(tilt)], [0, 0, -1]])
+    quaternions, free = Orientation.OrientationFilter(RATE, method).estimate(gyro, accel)
+    np.testing.assert_allclose(np.linalg.norm(quaternions, axis=2), 1.0)
+    # gravity ends up along the global z axis and is removed. Madgwick's gradient step always has the size beta,
+    # so even a still sensor moves by about beta / rate
+    np.testing.assert_allclose(free, 0.0, atol=1e-3)
+    np.testing.assert_allclose(Orientation.rotate(quaternions[:, -1], accel[:, -1]), [[0, 0, 1]] * 3, atol=1e-3)
+
+
+@pytest.mark.parametrize("method", ["madgwick", "complementary"])
+def test_turning_about_gravity(method):
+    gyro, accel = still([[0, 0, 1], [0, 0, 1]])
+    gyro[0, :, 2] = 90.0
+    gyro[1, :, 2] = -45.0
+    quaternions, free = Orientation.OrientationFilter(RATE, method, gyro_unit="deg/s").estimate(gyro, accel)
+    angles = np.radians([90.0, -45.0]) * 2.0
+    np.testing.assert_allclose(quaternions[:, -1], np.column_stack((np.cos(angles / 2), np.zeros(2), np.zeros(2),
+                                                                    np.sin(angles / 2))), atol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["madgwick", "complementary"])
+def test_accelerometer_corrects_the_gyroscope(method):
+    # a gyroscope that reads a tilt that isn't happening
+    gyro, accel = still([[0, 0, 9.81]], samples=20000)
+    gyro[0, :, 0] = 0.01
+    quaternions, free = Orientation.OrientationFilter(RATE, method, gravity=9.81).estimate(gyro, accel)
+    # left alone the gyroscope would have tilted the sensor by 0.2 rad
+    assert np.linalg.norm(quaternions[0, -1, 1:]) < 0.01
+    assert np.abs(free[0, -1]).max() < 0.1
+
+
+def test_rotate():
+    quaternion = np.array([np.cos(np.pi / 4), 0, 0, np.sin(np.pi / 4)])
+    np.testing.assert_allclose(Orientation.rotate(quaternion, np.array([1.0, 0, 0])), [0, 1, 0], atol=1e-12)
+
+
+def test_apply_caches_the_orientations(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 100, imus=2, seed=1)
+    imus = Vicon(str(tmp_path / "walk.csv")).IMUs
+    orientation = Orientation.OrientationFilter(1000, "complementary")
+    results = orientation.apply(imus)
+    assert sorted(results) == [1, 2]
+    quaternions, free = results[1]
+    assert quaternions.shape == (1000, 4) and free.shape == (1000, 3)
+    assert imus[1].orientation is quaternions
+    # the IMUs are filtered together the same way as one at a time
+    alone = orientation.estimate(imus[2].get_gyro_array()[np.newaxis], imus[2].get_accel_array()[np.newaxis],
+                                 imus[2].get_gyro_unit())
+    np.testing.assert_allclose(results[2][0], alone[0][0], atol=1e-12)
+    # filtering again with the same settings is skipped
+    orientation.estimate = None
+    assert orientation.apply(imus)[1][0] is quaternions
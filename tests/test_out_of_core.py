@@ -0,0 +1,99 @@
+"""
+Trials read through a memory mapped store
+"""
+import os
+
+import numpy as np
+import pytest
+
+from Vicon.Devices import EMGPipeline
+from Vicon.Examples import Synthetic
+from Vicon.Interpolation import Interpolation
+from Vicon.Markers import Markers
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial_path(tmp_path):
+    path = str(tmp_path / "walk.csv")
+    Synthetic.generate(path, 200, gaps=[("Root1", 40, 8), ("R_Femur2", 120, 5)], seed=1)
+    return path
+
+
+def stages(trial):
+    return [record["name"] for record in trial.get_report()]
+
+
+def test_store_matches_memory(trial_path, tmp_path):
+    memory = Vicon(trial_path)
+    stored = Vicon(trial_path, store=str(tmp_path / "cache"), chunk_size=64)
+    assert "convert" in stages(stored)
+    for category in ("Trajectories", "Devices"):
+        columns, expected = memory.get_category_array(category)
+        stored_columns, values = stored.get_category_array(category)
+        assert stored_columns == columns
+        np.testing.assert_allclose(values, expected)
+        np.testing.assert_array_equal(stored.get_timebase(category)[0], memory.get_timebase(category)[0])
+    np.testing.assert_allclose(stored.get_markers().query("*")[1], memory.get_markers().query("*")[1])
+    np.testing.assert_allclose(stored.get_force_plate(1).get_force_array(),
+                               memory.get_force_plate(1).get_force_array())
+
+
+def test_store_is_reused_until_the_file_changes(trial_path, tmp_path):
+    cache = str(tmp_path / "cache")
+    Vicon(trial_path, store=cache)
+    again = Vicon(trial_path, store=cache)
+    assert "convert" not in stages(again) and "read file" not in stages(again)
+    # other settings, or a changed file, convert the file again
+    assert "convert" in stages(Vicon(trial_path, store=cache, dtype=np.float32))
+    stat = os.stat(trial_path)
+    os.utime(trial_path, (stat.st_atime, stat.st_mtime + 10))
+    assert "convert" in stages(Vicon(trial_path, store=cache))
+
+
+def test_iter_category(trial_path, tmp_path):
+    trial = Vicon(trial_path, store=str(tmp_path / "cache"))
+    columns, values = trial.get_category_array("Trajectories")
+    columns, chunks = trial.iter_category("Trajectories", 64, overlap=2)
+    pieces = list(chunks)
+    assert [(chunk.start, chunk.stop) for chunk in pieces] == [(0, 64), (64, 128), (128, 192), (192, 200)]
+    np.testing.assert_array_equal(pieces[1].values, values[62:130])
+
+
+def marker_dict(frames, seed=1):
+    rng = np.random.default_rng(seed)
+    return {"Sub:" + name: {axis: {"data": rng.normal(size=frames)} for axis in ("X", "Y", "Z")}
+            for name in ("Root1", "Root2")}
+
+
+def test_markers_filter_whole_or_in_chunks():
+    data = marker_dict(50)
+    whole = Markers.Markers(data, "walk")
+    whole.make_markers()
+    chunked = Markers.Markers(data, "walk", chunk_size=7)
+    chunked.make_markers()
+    expected = np.column_stack([np.convolve(data["Sub:Root1"][axis]["data"], np.ones(10) / 10, mode="valid")
+                                for axis in ("X", "Y", "Z")])
+    np.testing.assert_allclose(whole.get_marker("Root1").positions, expected)
+    np.testing.assert_allclose(chunked.get_marker("Root1").positions, expected)
+
+
+def test_akmia_chunks_matches_akmia():
+    rng = np.random.default_rng(1)
+    values = np.cumsum(rng.normal(size=1000))
+    values[[5, 6, 7, 99, 100, 101, 102, 500, 998, 999]] = np.nan
+    expected = Interpolation.akmia({"data": values.copy()}, False, "", "", "")
+    Interpolation.akmia_chunks(values, size=100)
+    np.testing.assert_allclose(values, expected)
+
+
+def test_emg_envelopes_in_chunks(trial_path, tmp_path):
+    trial = Vicon(trial_path, store=str(tmp_path / "cache"))
+    rate = trial.get_sample_rate("Devices")
+    keys, matrix = trial.get_emg_matrix()
+    # the chunks are filtered causally, the same as filtering the whole recording as one chunk
+    expected = next(EMGPipeline.EMGPipeline(rate).process_chunks([matrix]))
+    out = np.empty_like(expected)
+    chunked_keys, envelopes = EMGPipeline.EMGPipeline(rate).apply(trial, chunk_size=300, out=out)
+    assert chunked_keys == keys and envelopes is out
+    np.testing.assert_allclose(envelopes, expected, atol=1e-12)
@@ -0,0 +1,134 @@
+"""
+Stages run over trials with a checkpoint store
+"""
+import os
+
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap import Pipeline
+
+
+def start(file_path, size=3):
+    return {"values": list(range(size))}
+
+
+def append(file_path, output, value=10):
+    # changes its input in place, like the marker stages do
+    output["values"].append(value)
+    return output
+
+
+def total(file_path, first, second):
+    return sum(first["values"]) + sum(second["values"])
+
+
+def fail(file_path, output):
+    raise RuntimeError("stage failed")
+
+
+@pytest.fixture
+def trial(tmp_path):
+    path = tmp_path / "trial.csv"
+    path.write_text("not read by these stages")
+    return str(path)
+
+
+def make(store):
+    pipeline = Pipeline.Pipeline(str(store))
+    pipeline.add_stage("start", start)
+    pipeline.add_stage("append", append)
+    pipeline.add_stage("total", total, inputs=["start", "append"])
+    return pipeline
+
+
+def test_stages_dont_share_outputs(tmp_path, trial):
+    pipeline = make(tmp_path / "store")
+    outputs, ran = pipeline.run_trial(trial, targets=["start", "append", "total"])
+    assert ran == ["start", "append", "total"]
+    assert outputs["start"] == {"values": [0, 1, 2]}
+    assert outputs["append"] == {"values": [0, 1, 2, 10]}
+    assert outputs["total"] == 3 + 13
+    assert pipeline.load(trial, "start") == {"values": [0, 1, 2]}
+    assert pipeline.load(trial, "append") == {"values": [0, 1, 2, 10]}
+
+
+def test_checkpoints_are_reused(tmp_path, trial):
+    make(tmp_path / "store").run_trial(trial)
+    pipeline = make(tmp_path / "store")
+    outputs, ran = pipeline.run_trial(trial, targets=["start", "append", "total"])
+    assert ran == []
+    assert outputs == {"start": {"values": [0, 1, 2]}, "append": {"values": [0, 1, 2, 10]}, "total": 16}
+    # the copies handed out can be changed without changing the checkpoint
+    outputs["start"]["values"].clear()
+    assert pipeline.load(trial, "start") == {"values": [0, 1, 2]}
+
+
+def test_changed_parameters_rerun_later_stages(tmp_path, trial):
+    make(tmp_path / "store").run_trial(trial)
+    pipeline = Pipeline.Pipeline(str(tmp_path / "store"))
+    pipeline.add_stage("start", start)
+    pipeline.add_stage("append", append, value=20)
+    pipeline.add_stage("total", total, inputs=["start", "append"])
+    assert pipeline.status(trial) == {"start": True, "append": False, "total": False}
+    outputs, ran = pipeline.run_trial(trial)
+    assert ran == ["append", "total"] and outputs["total"] == 26
+    checkpoints = os.listdir(pipeline._trial_dir(trial))
+    assert len(checkpoints) == 3
+
+
+def test_changed_source_reruns_the_stage(tmp_path, trial):
+    helper = tmp_path / "helper.py"
+    helper.write_text("SCALE = 1\n")
+
+    def build():
+        pipeline = Pipeline.Pipeline(str(tmp_path / "store"))
+        pipeline.add_stage("start", start, sources=[str(helper)])
+        pipeline.add_stage("append", append)
+        return pipeline
+
+    build().run_trial(trial)
+    assert build().status(trial) == {"start": True, "append": True}
+    helper.write_text("SCALE = 20\n")
+    assert build().status(trial) == {"start": False, "append": False}
+
+
+def test_bad_stages():
+    pipeline = Pipeline.Pipeline("store")
+    pipeline.add_stage("start", start)
+    with pytest.raises(ValueError):
+        pipeline.add_stage("start", start)
+    with pytest.raises(ValueError):
+        pipeline.add_stage("total", total, inputs=["start", "missing"])
+
+
+def test_failed_trials_dont_stop_the_others(tmp_path, trial):
+    other = str(tmp_path / "other.csv")
+    with open(other, "w") as f:
+        f.write("another trial")
+    pipeline = make(tmp_path / "store")
+    pipeline.add_stage("fail", fail, inputs=["start"])
+    results = pipeline.run([trial, other], targets=["total"], workers=2, processes=False)
+    assert results == {trial: ["start", "append", "total"], other: ["start", "append", "total"]}
+    results = pipeline.run([trial], targets=["fail"])
+    assert isinstance(results[trial], RuntimeError)
+
+
+def test_gait_pipeline(tmp_path):
+    path = str(tmp_path / "leg.csv")
+    Synthetic.generate(path, 100, seed=1)
+    pipeline = Pipeline.gait_pipeline(str(tmp_path / "store"), joints=[("knee", "R_Femur", "R_Tibia", False)],
+                                      joint_params={"workers": 1})
+    outputs, ran = pipeline.run_trial(path, targets=["smart_sort", "joints"])
+    assert ran == ["load", "smart_sort", "frames", "joints"]
+    # the frames and joints were made on copies of the sorted markers
+    assert len(outputs["smart_sort"]._frames) == 0 and len(outputs["smart_sort"]._joints) == 0
+    # and match running the same steps by hand
+    markers = Pipeline.load_trial(path).get_markers()
+    markers.smart_sort(True)
+    markers.auto_make_frames()
+    markers.def_joint("knee", "R_Femur", "R_Tibia", False)
+    markers.calc_joints(try_load=False)
+    np.testing.assert_allclose(np.asarray(outputs["joints"].get_joint("knee"), dtype=np.float64),
+                               np.asarray(markers.get_joint("knee"), dtype=np.float64))
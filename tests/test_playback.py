@@ -0,0 +1,54 @@
+"""
+Frames precomputed for playing back and exporting markers
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def markers(tmp_path):
+    Synthetic.generate(str(tmp_path / "leg.csv"), 50, seed=1)
+    return Vicon(str(tmp_path / "leg.csv")).get_markers()
+
+
+def test_playback_frames(markers):
+    points, joints, addl = markers._playback_frames()
+    names = [name for name in markers.marker_names if np.any(markers._marker_positions(name) != 0)]
+    assert points.shape == (len(markers._marker_positions(names[0])), len(names), 3)
+    assert joints is None and addl is None
+    np.testing.assert_allclose(points[:, 0], markers._marker_positions(names[0]))
+
+
+def test_playback_window(markers):
+    points = markers._playback_frames(start=10, end=40, step=5)[0]
+    name = markers.marker_names[0]
+    np.testing.assert_allclose(points[:, 0], markers._marker_positions(name)[10:40:5])
+
+
+def test_playback_centered(markers):
+    name = markers.marker_names[0]
+    root = markers._marker_positions(name)
+    points, joints, centered = markers._playback_frames(center=True, centerPoint=name, addlPoints=[root],
+                                                        addlPointsMin=5)
+    # the center marker stays over the origin at the height it started at
+    np.testing.assert_allclose(points[:, 0, :2], 0, atol=1e-9)
+    np.testing.assert_allclose(points[:, 0, 2], root[0, 2])
+    assert np.isnan(centered[:5]).all()
+    np.testing.assert_allclose(centered[5:, 0], points[5:, 0])
+
+
+def test_playback_errors(markers):
+    with pytest.raises(ValueError):
+        markers._playback_frames(center=True)
+    with pytest.raises(ValueError):
+        markers._playback_frames(start=100)
+
+
+def test_update_playback(markers):
+    points = markers._playback_frames()[0]
+    scatter = type("Scatter", (), {})()
+    assert markers._update_playback(3, [(scatter, points)]) == [scatter]
+    np.testing.assert_allclose(np.stack(scatter._offsets3d, axis=1), points[3])
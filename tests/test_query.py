@@ -0,0 +1,76 @@
+"""
+Windows of markers and category fields as stacked arrays
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Markers import Markers
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 100, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def test_match_names():
+    names = ["R_Femur1", "R_Femur2", "R_Tibia1", "R_Femur[1]"]
+    assert Markers.match_names(names, "R_Femur*") == ["R_Femur1", "R_Femur2", "R_Femur[1]"]
+    # an exact name is not read as a pattern
+    assert Markers.match_names(names, "R_Femur[1]") == ["R_Femur[1]"]
+    with pytest.raises(ValueError):
+        Markers.match_names(names, "L_*")
+
+
+def test_markers_query(trial):
+    markers = trial.get_markers()
+    names, femur = markers.query("R_Femur*", 10, 40, filtered=False)
+    assert names == ["R_Femur1", "R_Femur2", "R_Femur3", "R_Femur4"]
+    assert femur.shape == (30, 4, 3) and not femur.flags.writeable
+    columns, trajectories = trial.get_category_array("Trajectories")
+    assert np.shares_memory(femur, trajectories)
+    x = trial.data_dict["Trajectories"]["R_Femur3"]["X"]["data"]
+    np.testing.assert_array_equal(femur[:, 2, 0], x[10:40])
+    # names in any order, with repeats dropped, are copied
+    names, mixed = markers.query(["R_Tibia1", "R_Femur*", "R_Tibia1"], filtered=False)
+    assert names == ["R_Tibia1", "R_Femur1", "R_Femur2", "R_Femur3", "R_Femur4"]
+    np.testing.assert_array_equal(mixed[:, 1:], markers.query("R_Femur*", filtered=False)[1])
+    with pytest.raises(ValueError):
+        markers.query("L_*")
+
+
+def test_markers_shorter_than_the_filter_window():
+    rng = np.random.default_rng(1)
+    data = {"Sub:" + name: {axis: {"data": rng.normal(size=5)} for axis in ("X", "Y", "Z")}
+            for name in ("Root1", "Root2")}
+    markers = Markers.Markers(data, "short")
+    assert markers.filter_window > 5
+    markers.make_markers()
+    names, positions = markers.query("Root*")
+    assert names == ["Root1", "Root2"] and positions.shape == (0, 2, 3)
+
+
+def test_markers_query_rigid_body(trial):
+    markers = trial.get_markers()
+    markers.smart_sort(filter=False)
+    names, femur = markers.query("R_Femur", 0, 20, filtered=False)
+    assert len(names) == 4
+    np.testing.assert_allclose(femur, markers.get_rigid_body_array("R_Femur").transpose(1, 0, 2)[:20])
+
+
+def test_category_query(trial):
+    subjects, fields, forces = trial.query("Devices", "Force_Plate__Force_*", start=10, end=20)
+    assert subjects == ["Force_Plate__Force_1", "Force_Plate__Force_2"] and fields == ["Fx", "Fy", "Fz"]
+    # ten device samples are recorded in each frame
+    assert forces.shape == (100, 2, 3)
+    np.testing.assert_array_equal(forces[:, 0], trial.get_force_plate(1).get_force_array()[100:200])
+    columns, devices = trial.get_category_array("Devices")
+    assert np.shares_memory(forces, devices)
+    subjects, fields, heights = trial.query("Trajectories", ["Root1", "Root2"], fields=["Z"])
+    assert heights.shape == (100, 2, 1)
+    with pytest.raises(ValueError):
+        trial.query("Trajectories", "Root1", fields=["W"])
+    with pytest.raises(ValueError):
+        trial.query("Trajectories", "Nothing*")
@@ -0,0 +1,56 @@
+"""
+Rendering marker frames without a display
+"""
+import os
+
+import matplotlib
+import numpy as np
+import pytest
+
+from Vicon.Markers import Render
+
+
+def playback(frames=6):
+    markers = np.zeros((frames, 2, 3))
+    markers[:, 1, 2] = np.linspace(100, 600, frames)
+    joints = markers[:, :1] + 50
+    return markers, joints, None
+
+
+def test_export_images(tmp_path):
+    name = str(tmp_path / "frames")
+    assert Render.export(playback(), name, 10, workers=2, chunk_size=4, size=(2, 2), dpi=20, images=True) == name
+    assert sorted(os.listdir(name)) == ["frame_%06d.png" % frame for frame in range(6)]
+
+
+def test_export_without_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setitem(matplotlib.rcParams, "animation.ffmpeg_path", str(tmp_path / "no-ffmpeg"))
+    with pytest.raises(RuntimeError, match="ffmpeg"):
+        Render.export(playback(), str(tmp_path / "video"), 10, workers=1)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_failed_export_removes_chunks(tmp_path, monkeypatch):
+    # an ffmpeg that is found but can't write anything
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\ncat > /dev/null\nexit 1\n")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setitem(matplotlib.rcParams, "animation.ffmpeg_path", str(ffmpeg))
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        Render.export(playback(), str(tmp_path / "video"), 10, workers=1, size=(2, 2), dpi=20)
+    assert os.listdir(str(tmp_path)) == ["ffmpeg"]
+
+
+def test_failed_export_keeps_existing_files(tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\ncat > /dev/null\nexit 1\n")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setitem(matplotlib.rcParams, "animation.ffmpeg_path", str(ffmpeg))
+    # a directory of the user's that happens to have the name the chunks used to be written to
+    mine = tmp_path / "video-chunks"
+    mine.mkdir()
+    (mine / "notes.txt").write_text("keep me")
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        Render.export(playback(), str(tmp_path / "video"), 10, workers=1, size=(2, 2), dpi=20)
+    assert sorted(os.listdir(str(tmp_path))) == ["ffmpeg", "video-chunks"]
+    assert os.listdir(str(mine)) == ["notes.txt"]
@@ -0,0 +1,73 @@
+"""
+Pickling trials with out-of-band buffers, and sharing them with worker processes
+"""
+import multiprocessing
+import pickle
+
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap import Storage
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 200, seed=1)
+    trial = Vicon(str(tmp_path / "walk.csv"))
+    trial.get_markers().smart_sort(filter=False)
+    return trial
+
+
+def femur_mean(handle):
+    trial = handle.attach()
+    return trial.get_markers().get_rigid_body_array("R_Femur").mean(axis=1)
+
+
+def test_out_of_band_buffers(trial):
+    buffers = []
+    payload = pickle.dumps(trial, protocol=5, buffer_callback=buffers.append)
+    columns, devices = trial.get_category_array("Devices")
+    # the devices are sent as a buffer rather than copied into the pickle
+    assert len(payload) < devices.nbytes
+    assert sum(buffer.raw().nbytes for buffer in buffers) >= devices.nbytes
+    copy = pickle.loads(payload, buffers=buffers)
+    np.testing.assert_array_equal(copy.get_category_array("Devices")[1], devices)
+    np.testing.assert_array_equal(copy.get_markers().get_rigid_body_array("R_Femur"),
+                                  trial.get_markers().get_rigid_body_array("R_Femur"))
+
+
+def test_views_stay_views(trial):
+    copy = pickle.loads(pickle.dumps(trial, protocol=4))
+    columns, trajectories = copy.get_category_array("Trajectories")
+    assert np.shares_memory(copy.data_dict["Trajectories"]["Root1"]["X"]["data"], trajectories)
+    assert np.shares_memory(copy.get_markers().query("Root1", filtered=False)[1], trajectories)
+    # markers pickled alone still hold one copy of the trajectories
+    markers = pickle.loads(pickle.dumps(trial.get_markers(), protocol=5))
+    names, positions = markers.query(["Root1", "Root2"], filtered=False)
+    names, expected = trial.get_markers().query(["Root1", "Root2"], filtered=False)
+    np.testing.assert_array_equal(positions, expected)
+    # the query is a view of the rows of the trajectories, as it was before pickling
+    assert not positions.flags.owndata and positions.strides == expected.strides
+
+
+def test_shared_memory(trial):
+    expected = trial.get_markers().get_rigid_body_array("R_Femur").mean(axis=1)
+    with trial.share() as handle:
+        assert handle.nbytes >= trial.get_category_array("Devices")[1].nbytes
+        handle = pickle.loads(pickle.dumps(handle))
+        with multiprocessing.get_context("fork").Pool(2) as pool:
+            for result in pool.map(femur_mean, [handle, handle]):
+                np.testing.assert_array_equal(result, expected)
+
+
+def test_unlink_frees_the_memory(trial):
+    handle = trial.share()
+    attached = handle.attach()
+    np.testing.assert_array_equal(attached.get_category_array("Devices")[1], trial.get_category_array("Devices")[1])
+    del attached
+    name = handle.name
+    handle.unlink()
+    with pytest.raises(FileNotFoundError):
+        Storage.shared_memory.SharedMemory(name=name)
@@ -0,0 +1,78 @@
+"""
+Nearest marker and proximity queries over every frame
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Markers import Spatial
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def positions():
+    positions = np.random.default_rng(1).uniform(0.0, 100.0, size=(50, 6, 3))
+    positions[3, 2] = np.nan
+    positions[7] = np.nan
+    # two markers that come within a few millimetres of each other
+    positions[20:25, 4] = positions[20:25, 1] + [2.0, 0.0, 0.0]
+    return positions
+
+
+def distances_to(positions, points):
+    every = np.linalg.norm(positions - points[:, np.newaxis, :], axis=2)
+    every[np.isnan(every)] = np.inf
+    return every
+
+
+@pytest.mark.parametrize("window", [1, 7, 10000])
+def test_nearest(positions, window):
+    index = Spatial.SpatialIndex(["m" + str(n) for n in range(6)], positions, window)
+    points = np.random.default_rng(2).uniform(0.0, 100.0, size=(50, 3))
+    every = distances_to(positions, points)
+    distances, nearest = index.nearest(points, k=2)
+    order = np.argsort(every, axis=1)[:, :2]
+    valid = np.isfinite(every).any(axis=1)
+    np.testing.assert_array_equal(nearest[valid], order[valid])
+    np.testing.assert_allclose(distances[valid], np.take_along_axis(every, order, axis=1)[valid])
+    # a frame without markers
+    assert (nearest[7] == -1).all() and np.isinf(distances[7]).all()
+    # a point far outside the markers is still given its nearest marker
+    far = np.full((50, 3), [1e6, 0.0, 0.0])
+    far_distances, far_nearest = index.nearest(far[0])
+    np.testing.assert_array_equal(far_nearest[valid, 0], np.argmin(distances_to(positions, far), axis=1)[valid])
+
+
+def test_within(positions):
+    index = Spatial.SpatialIndex(["m" + str(n) for n in range(6)], positions, 8)
+    point = np.array([50.0, 50.0, 50.0])
+    mask = index.within(point, 40.0)
+    np.testing.assert_array_equal(mask, distances_to(positions, np.tile(point, (50, 1))) <= 40.0)
+
+
+def test_close_pairs(positions):
+    index = Spatial.SpatialIndex(["m" + str(n) for n in range(6)], positions, 8)
+    frames, first, second, distances = index.close_pairs(5.0)
+    expected = [(frame, a, b) for frame in range(50) for a in range(6) for b in range(a + 1, 6)
+                if np.linalg.norm(positions[frame, a] - positions[frame, b]) <= 5.0]
+    assert list(zip(frames, first, second)) == expected
+    assert set(frames) >= set(range(20, 25))
+    np.testing.assert_allclose(distances, np.linalg.norm(positions[frames, first] - positions[frames, second], axis=1))
+    with pytest.raises(ValueError):
+        Spatial.SpatialIndex([], positions, 0)
+
+
+def test_markers_spatial_index(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 60, seed=1)
+    markers = Vicon(str(tmp_path / "walk.csv")).get_markers()
+    index = markers.spatial_index("R_Femur*", filtered=False, window=16)
+    assert index is markers.spatial_index("R_Femur*", filtered=False, window=16)
+    names, femur = markers.query("R_Femur*", filtered=False)
+    assert index.names == names and len(index) == len(femur)
+    distances, nearest = index.nearest(femur[:, 2])
+    np.testing.assert_array_equal(nearest[:, 0], 2)
+    np.testing.assert_array_equal(distances[:, 0], 0.0)
+    # the built trees are not pickled with the markers
+    assert pickle.loads(pickle.dumps(markers))._spatial_indexes == {}
@@ -0,0 +1,129 @@
+"""
+Categories stored once, and the views the models hold into them
+"""
+import numpy as np
+import pytest
+
+from Vicon.Examples import Synthetic
+from Vicon.Mocap import Storage
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial_path(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 50, seed=1)
+    return str(tmp_path / "walk.csv")
+
+
+def category():
+    return {"A": {"X": {"data": [1.0, 2.0]}, "Y": {"data": [3.0, 4.0]}, "Z": {"data": [5.0, 6.0]}},
+            "B": {"X": {"data": [7.0, 8.0]}, "Y": {"data": [9.0, 10.0]}, "Z": {"data": [11.0, 12.0]}}}
+
+
+def test_pack_replaces_the_fields_with_views():
+    data = category()
+    columns, values = Storage.pack(data, dtype=np.float32)
+    assert columns == [("A", "X"), ("A", "Y"), ("A", "Z"), ("B", "X"), ("B", "Y"), ("B", "Z")]
+    assert values.dtype == np.float32 and values.shape == (6, 2)
+    np.testing.assert_array_equal(values[4], [9.0, 10.0])
+    assert np.shares_memory(data["B"]["Y"]["data"], values)
+    with pytest.raises(ValueError):
+        data["B"]["Y"]["data"][0] = 0.0
+    columns, values = Storage.pack({})
+    assert columns == [] and values.shape == (0, 0)
+
+
+def test_stack_is_a_view_of_evenly_spaced_rows():
+    data = category()
+    columns, values = Storage.pack(data)
+    fields = [data["B"][name]["data"] for name in ("X", "Y", "Z")]
+    stacked = Storage.stack(fields)
+    np.testing.assert_array_equal(stacked, [[7.0, 9.0, 11.0], [8.0, 10.0, 12.0]])
+    assert np.shares_memory(stacked, values) and not stacked.flags.writeable
+    # lists, or rows out of order, are copied
+    assert not np.shares_memory(Storage.stack([fields[0], fields[2], fields[1]]), values)
+    np.testing.assert_array_equal(Storage.stack([[1.0, 2.0], [3.0, 4.0]]), [[1.0, 3.0], [2.0, 4.0]])
+
+
+def test_gather_and_take():
+    values = np.arange(24.0).reshape(4, 6)
+    markers = [values[:, 0:3], values[:, 3:6]]
+    gathered = Storage.gather(markers)
+    assert gathered.shape == (4, 2, 3) and np.shares_memory(gathered, values)
+    np.testing.assert_array_equal(gathered[:, 1], values[:, 3:6])
+    copied = Storage.gather([markers[1], markers[0].copy()])
+    assert not np.shares_memory(copied, values)
+    np.testing.assert_array_equal(copied[:, 0], values[:, 3:6])
+
+    taken = Storage.take(values, [[0, 1, 2], [3, 4, 5]])
+    np.testing.assert_array_equal(taken, gathered)
+    assert np.shares_memory(taken, values) and not taken.flags.writeable
+    uneven = Storage.take(values, [[0, 2], [5, 1]])
+    np.testing.assert_array_equal(uneven, values[:, [[0, 2], [5, 1]]])
+
+
+def test_models_hold_views_of_the_categories(trial_path):
+    trial = Vicon(trial_path)
+    markers = trial.get_markers()
+    columns, trajectories = trial.get_category_array("Trajectories")
+    field = trial.data_dict["Trajectories"]["Root1"]["X"]["data"]
+    assert np.shares_memory(field, trajectories) and not field.flags.writeable
+    names, positions = markers.query("Root1", filtered=False)
+    assert np.shares_memory(positions, trajectories)
+    columns, devices = trial.get_category_array("Devices")
+    assert np.shares_memory(trial.get_force_plate(1).get_force_array(), devices)
+    # making the markers leaves the trajectories as they were read
+    assert set(trial.data_dict["Trajectories"]) == set(Vicon(trial_path).data_dict["Trajectories"])
+
+
+def test_drop_raw(trial_path):
+    trial = Vicon(trial_path)
+    expected = trial.get_category_array("Devices")[1].copy()
+    trial.drop_raw()
+    assert trial.data_dict == {}
+    np.testing.assert_array_equal(trial.get_category_array("Devices")[1], expected)
+    # the categories without stored arrays were in data_dict
+    with pytest.raises(ValueError):
+        trial.get_category_array("Joints")
+    dropped = Vicon(trial_path, keep_raw=False)
+    assert dropped.data_dict == {}
+    np.testing.assert_array_equal(dropped.get_force_plate(1).get_force_array(),
+                                  Vicon(trial_path).get_force_plate(1).get_force_array())
+
+
+def test_chunks_overlap_at_the_edges():
+    values = np.arange(10.0)
+    pieces = list(Storage.chunks(values, 4, before=1, after=2))
+    assert [(chunk.start, chunk.stop, chunk.lead) for chunk in pieces] == [(0, 4, 0), (4, 8, 1), (8, 10, 1)]
+    np.testing.assert_array_equal(pieces[1].values, values[3:10])
+    assert all(np.shares_memory(chunk.values, values) for chunk in pieces)
+    with pytest.raises(ValueError):
+        list(Storage.chunks(values, 0))
+
+
+def test_map_chunks_matches_the_whole_array():
+    values = np.random.default_rng(1).normal(size=(1000, 3))
+    window = 9
+    average = lambda piece: np.apply_along_axis(np.convolve, 0, piece, np.ones(window) / window, "valid")
+    expected = average(values)
+    out = np.empty_like(expected)
+    result = Storage.map_chunks(average, values, 128, after=window - 1, length=len(expected), out=out)
+    assert result is out
+    np.testing.assert_allclose(result, expected)
+    np.testing.assert_array_equal(Storage.map_chunks(lambda piece: piece * 2, values.T, 100, axis=1), values.T * 2)
+
+
+def test_store(tmp_path):
+    store = Storage.Store(str(tmp_path / "store"))
+    assert store.index is None
+    values = store.create("values", (3, 4), np.float32)
+    values[:] = 1.5
+    values.flush()
+    assert store.create("empty", (0, 4), np.float64).shape == (0, 4)
+    store.index = {"values": [3, 4]}
+    reopened = Storage.Store(store.directory)
+    assert reopened.index == {"values": [3, 4]}
+    np.testing.assert_array_equal(reopened.open("values"), np.full((3, 4), 1.5, dtype=np.float32))
+    assert reopened.open("empty").shape == (0, 4)
+    reopened.index = None
+    assert store.index is None
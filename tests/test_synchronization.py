@@ -0,0 +1,62 @@
+"""
+Lining devices up with the markers
+"""
+import numpy as np
+import pytest
+
+from Vicon.Devices import Synchronization
+
+
+def pulses(n, rate, times, width=0.05):
+    t = np.arange(n) / float(rate)
+    return sum(np.exp(-0.5 * ((t - time) / width) ** 2) for time in times)
+
+
+@pytest.mark.parametrize("lag", [0.25, -0.25])
+def test_estimate_lag(lag):
+    times = [1.0, 2.3, 2.9, 4.4]
+    reference = pulses(600, 100, times)
+    signal = pulses(12000, 2000, [time + lag for time in times])
+    found, strength = Synchronization.estimate_lag(signal, reference, 2000, 100, max_lag=1.0)
+    assert found == pytest.approx(lag, abs=0.01)
+    assert strength > 0.9
+
+
+def test_align_device_that_started_early():
+    values = np.arange(20.0).reshape((10, 2))
+    aligned = Synchronization.align(values, 3)
+    np.testing.assert_array_equal(aligned, values[3:])
+    assert np.shares_memory(aligned, values)
+
+
+def test_align_device_that_started_late():
+    values = np.arange(20.0).reshape((10, 2))
+    aligned = Synchronization.align(values, -3)
+    assert aligned.shape == (13, 2)
+    assert np.isnan(aligned[:3]).all()
+    np.testing.assert_array_equal(aligned[3:], values)
+    np.testing.assert_array_equal(Synchronization.align(np.arange(4), -2, fill=-1), [-1, -1, 0, 1, 2, 3])
+
+
+def test_aligned_samples_match_the_reference():
+    reference = np.arange(100.0)
+    for lag in (7, 0, -7):
+        # the device recorded the same clock, starting lag samples before the reference
+        device = np.arange(100.0) - lag
+        aligned = Synchronization.align(device, lag)
+        shared = min(len(aligned), len(reference))
+        valid = ~np.isnan(aligned[:shared])
+        np.testing.assert_array_equal(aligned[:shared][valid], reference[:shared][valid])
+        assert np.count_nonzero(~valid) == max(-lag, 0)
+
+
+def test_synchronize_stores_the_lag():
+    class Device(object):
+        lag = 0
+        drift = 0.0
+
+    times = [1.0, 2.3, 2.9, 4.4]
+    device = Device()
+    lag, drift = Synchronization.synchronize(device, pulses(12000, 2000, [time - 0.1 for time in times]),
+                                             pulses(600, 100, times), 2000, 100, max_lag=1.0)
+    assert device.lag == -200 and drift == 0.0
@@ -0,0 +1,67 @@
+"""
+Sample rates, timebases and resampling of whole categories
+"""
+import numpy as np
+import pytest
+
+from Vicon.Devices import Synchronization
+from Vicon.Examples import Synthetic
+from Vicon.Mocap.Vicon import Vicon
+
+
+@pytest.fixture
+def trial(tmp_path):
+    Synthetic.generate(str(tmp_path / "walk.csv"), 100, rate=100, device_rate=2000, seed=1)
+    return Vicon(str(tmp_path / "walk.csv"))
+
+
+def test_rates(trial):
+    assert trial.frame_rate == 100
+    assert trial.get_sample_rate("Devices") == 2000
+    assert trial.samples_per_frame("Devices") == 20 and trial.samples_per_frame("Trajectories") == 1
+    plate = trial.get_force_plate(1)
+    assert plate.rate == 2000 and plate.offset == 20
+    np.testing.assert_array_equal(plate.get_offset_index(np.array([0, 3])), [0, 60])
+
+
+def test_times(trial):
+    frames, sub_frames = trial.get_timebase("Devices")
+    np.testing.assert_array_equal(frames[:21], [1] * 20 + [2])
+    np.testing.assert_array_equal(sub_frames[:21], list(range(20)) + [0])
+    np.testing.assert_allclose(trial.get_times("Devices"), np.arange(2000) / 2000.0)
+    np.testing.assert_allclose(trial.get_times("Trajectories"), np.arange(100) / 100.0)
+
+
+def test_rates_are_saved(trial, tmp_path):
+    trial.save(str(tmp_path / "saved.csv"))
+    saved = Vicon(str(tmp_path / "saved.csv"))
+    assert saved.get_sample_rate("Devices") == 2000 and saved.frame_rate == 100
+    for category in ("Devices", "Trajectories"):
+        for before, after in zip(trial.get_timebase(category), saved.get_timebase(category)):
+            np.testing.assert_array_equal(before, after)
+
+
+def test_category_array(trial):
+    columns, values = trial.get_category_array("Devices")
+    assert values.shape == (2000, len(columns))
+    subject, field = columns[0]
+    np.testing.assert_array_equal(values[:, 0], trial.data_dict["Devices"][subject][field]["data"])
+
+
+def test_resample_categories(trial):
+    columns, devices = trial.decimate_devices()
+    assert devices.shape == (100, len(trial.get_category_array("Devices")[0]))
+    columns, trajectories = trial.upsample_trajectories()
+    assert trajectories.shape == (2000, len(columns))
+    assert trial.resample("Devices", 1000)[1].shape[0] == 1000
+
+
+def test_resample_keeps_slow_signals():
+    t = np.arange(2000) / 2000.0
+    values = np.column_stack((np.sin(2 * np.pi * 3 * t), np.cos(2 * np.pi * 5 * t)))
+    resampled = Synchronization.resample(values, 2000, 100)
+    t = np.arange(100) / 100.0
+    expected = np.column_stack((np.sin(2 * np.pi * 3 * t), np.cos(2 * np.pi * 5 * t)))
+    # away from the edges, where the filter runs out of samples
+    np.testing.assert_allclose(resampled[10:-10], expected[10:-10], atol=0.01)
+    np.testing.assert_array_equal(Synchronization.resample(values, 2000, 2000), values)